@@ -0,0 +1,147 @@
+"""
+Persistent torch.compile artifact cache.
+
+Inductor caches compiled graphs on disk, but only if its cache directory survives the process and
+dynamo keeps enough compiled variants per function. ``configure_compile_cache`` points inductor
+and triton at a directory keyed by the model structure, the torch version, the dtype and the
+device, so a restart or a reload of the pipeline finds the kernels of the previous run.
+``compile_report`` reads the hit / miss counters of inductor and dynamo.
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, Optional
+
+import torch
+from loguru import logger
+
+DEFAULT_COMPILE_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache/ace-step/compile")
+# song durations (seconds) the transformer is compiled for by ACEStepPipeline.warmup_compile
+DEFAULT_WARMUP_DURATIONS = (30.0, 60.0, 120.0, 180.0, 240.0)
+# portable bundle of compiled artifacts (torch >= 2.7), loaded before the first compilation
+ARTIFACTS_FILE_NAME = "compile_artifacts.bin"
+
+
+def model_hash(model: torch.nn.Module) -> str:
+    """
+    Hash of what compiled code depends on: the class, the config and the name, shape and dtype of
+    every parameter and buffer. Weight values do not enter compiled graphs, so a fine-tune or a
+    LoRA with the same structure shares the cache.
+    """
+    model = getattr(model, "_orig_mod", model)
+    digest = hashlib.sha256(type(model).__qualname__.encode())
+    config = getattr(model, "config", None)
+    if config is not None:
+        digest.update(json.dumps(dict(config), sort_keys=True, default=str).encode())
+    for name, tensor in model.state_dict().items():
+        digest.update(f"{name}:{tuple(tensor.shape)}:{tensor.dtype};".encode())
+    return digest.hexdigest()
+
+
+def compile_cache_key(model: torch.nn.Module, dtype: torch.dtype, device) -> str:
+    device = torch.device(device)
+    device_name = device.type
+    if device.type == "cuda" and torch.cuda.is_available():
+        major, minor = torch.cuda.get_device_capability(device)
+        device_name = f"cuda-sm{major}{minor}"
+    parts = [model_hash(model)[:16], f"torch-{torch.__version__}", str(dtype).replace("torch.", ""), device_name]
+    return "_".join(part.replace("+", "-").replace("/", "-") for part in parts)
+
+
+def warmup_cache_size_limit(
+    durations: Iterable[float], batch_sizes: Iterable[int], erg_query_scales: bool = False
+) -> int:
+    """
+    Compiled variants per function that hold every graph of a warm-up over ``durations`` x
+    ``batch_sizes``, where ``batch_sizes`` are the sizes the transformer runs at, guidance included.
+    """
+    # per latent length and batch size: a static and a dynamic text length, each with an empty and a
+    # filled cross-attention KV cache, and with ERG scaled and unscaled queries
+    variants_per_shape = 2 * 2 * (2 if erg_query_scales else 1)
+    return variants_per_shape * len(list(durations)) * len(list(batch_sizes)) + 2
+
+
+def raise_cache_size_limit(cache_size_limit: int):
+    import torch._dynamo
+
+    torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, cache_size_limit)
+
+
+def configure_compile_cache(cache_dir: str, cache_size_limit: Optional[int] = None) -> str:
+    """
+    Makes inductor and triton use ``cache_dir`` with the FX graph and autotuning caches on, and
+    loads the saved artifact bundle if there is one. ``cache_size_limit`` raises the number of
+    compiled variants dynamo keeps per function, a limit of 1 recompiles on every new shape.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ["TORCHINDUCTOR_CACHE_DIR"] = cache_dir
+    os.environ["TRITON_CACHE_DIR"] = os.path.join(cache_dir, "triton")
+
+    import torch._dynamo
+    import torch._inductor.config as inductor_config
+
+    inductor_config.fx_graph_cache = True
+    if hasattr(inductor_config, "autotune_local_cache"):
+        inductor_config.autotune_local_cache = True
+    if cache_size_limit is not None:
+        raise_cache_size_limit(cache_size_limit)
+
+    artifacts_path = os.path.join(cache_dir, ARTIFACTS_FILE_NAME)
+    if os.path.isfile(artifacts_path) and hasattr(torch.compiler, "load_cache_artifacts"):
+        try:
+            with open(artifacts_path, "rb") as f:
+                torch.compiler.load_cache_artifacts(f.read())
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable compile artifacts {artifacts_path}: {e}")
+    logger.info(f"torch.compile cache: {cache_dir}")
+    return cache_dir
+
+
+def save_compile_artifacts(cache_dir: str) -> Optional[str]:
+    """Writes the artifacts compiled so far as one portable bundle, when torch supports it."""
+    if not hasattr(torch.compiler, "save_cache_artifacts"):
+        return None
+    saved = torch.compiler.save_cache_artifacts()
+    if saved is None:
+        return None
+    artifacts, _ = saved
+    path = os.path.join(cache_dir, ARTIFACTS_FILE_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(artifacts)
+    os.replace(tmp_path, path)
+    return path
+
+
+def compile_counters() -> Dict[str, int]:
+    """Current inductor cache and dynamo compilation counters of this process."""
+    from torch._dynamo.utils import counters
+
+    return {
+        "fx_graph_cache_hits": counters["inductor"]["fxgraph_cache_hit"],
+        "fx_graph_cache_misses": counters["inductor"]["fxgraph_cache_miss"],
+        "fx_graph_cache_bypasses": counters["inductor"]["fxgraph_cache_bypass"],
+        "compiled_graphs": counters["stats"]["unique_graphs"],
+    }
+
+
+def compile_report(since: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    """Counters of ``compile_counters``, relative to an earlier snapshot ``since`` if given."""
+    current = compile_counters()
+    if since is None:
+        return current
+    return {name: value - since.get(name, 0) for name, value in current.items()}
+
+
+def compile_transformer_blocks(transformer: torch.nn.Module, modules: Iterable[str] = ("transformer_blocks",)):
+    """
+    Compiles every block of the transformer in place. The pipeline calls ``decode`` rather than
+    ``forward``, so wrapping the whole model in torch.compile never reached the hot loop; the
+    blocks are shared by both and all of them run the same compiled code.
+    """
+    model = getattr(transformer, "_orig_mod", transformer)
+    for name in modules:
+        for block in getattr(model, name):
+            block.compile()
+    return transformer
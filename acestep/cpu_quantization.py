@@ -0,0 +1,96 @@
+"""
+CPU inference profile with dynamic int8 quantization.
+
+Without a GPU the transformer (lyric encoder included) and UMT5 run in float32. Dynamic int8
+quantization stores the weights of every ``nn.Linear`` as int8 and quantizes the activations on
+the fly, which cuts the weight memory by about 4x and runs the matmuls on the int8 kernels of
+fbgemm / qnnpack. Quantizing billions of weights takes a while, so the quantized state dict is
+cached per component under ``<checkpoint_dir>/int8_dynamic/`` and loaded into an empty model on
+the next start without reading the float weights at all.
+"""
+
+import os
+from typing import Optional
+
+import torch
+from accelerate import init_empty_weights
+from loguru import logger
+from torch import nn
+from torch.ao.nn.quantized import dynamic as nnqd
+
+from acestep.weight_bundles import build_empty_component
+
+INT8_CACHE_DIR_NAME = "int8_dynamic"
+
+
+def int8_cache_path(checkpoint_dir, component) -> str:
+    return os.path.join(checkpoint_dir, INT8_CACHE_DIR_NAME, f"{component}.pt")
+
+
+def select_quantized_engine():
+    """fbgemm on x86, qnnpack on ARM, whichever this torch build has."""
+    engines = torch.backends.quantized.supported_engines
+    for engine in ("x86", "fbgemm", "qnnpack"):
+        if engine in engines:
+            torch.backends.quantized.engine = engine
+            return engine
+    return torch.backends.quantized.engine
+
+
+def quantize_dynamic_int8(model: nn.Module) -> nn.Module:
+    """
+    Replaces every plain ``nn.Linear`` of ``model`` in place. Subclasses such as the
+    QueryScaledLinear of the text encoder are left in float32.
+    """
+    select_quantized_engine()
+    torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8, inplace=True)
+    return model
+
+
+def save_int8_component(model: nn.Module, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    torch.save({"torch_version": torch.__version__, "state_dict": model.state_dict()}, tmp_path)
+    os.replace(tmp_path, path)
+    logger.info(f"int8 state dict saved to: {path}")
+
+
+def _swap_dynamic_linears(model: nn.Module, state_dict) -> int:
+    # the cached state dict says which Linear layers were quantized
+    swapped = 0
+    for name, module in list(model.named_modules()):
+        if type(module) is not nn.Linear or f"{name}._packed_params._packed_params" not in state_dict:
+            continue
+        parent_name, _, child_name = name.rpartition(".")
+        parent = model.get_submodule(parent_name) if parent_name else model
+        setattr(
+            parent,
+            child_name,
+            nnqd.Linear(module.in_features, module.out_features, bias_=module.bias is not None, dtype=torch.qint8),
+        )
+        swapped += 1
+    return swapped
+
+
+def load_int8_component(component, config, path) -> Optional[nn.Module]:
+    """
+    Builds ``component`` from ``config`` without allocating float weights and loads the cached int8
+    state dict into it. Returns None when there is no cache or it was written by another torch.
+    """
+    if not os.path.isfile(path):
+        return None
+    checkpoint = torch.load(path, map_location="cpu", weights_only=True)
+    if checkpoint.get("torch_version") != torch.__version__:
+        logger.info(f"Ignoring int8 cache written by torch {checkpoint.get('torch_version')}: {path}")
+        return None
+    state_dict = checkpoint["state_dict"]
+
+    select_quantized_engine()
+    with init_empty_weights():
+        model = build_empty_component(component, config)
+        _swap_dynamic_linears(model, state_dict)
+    model.load_state_dict(state_dict, strict=True, assign=True)
+    if hasattr(model, "tie_weights"):
+        model.tie_weights()
+    logger.info(f"Loaded int8 {component} from: {path}")
+    return model.eval()
@@ -0,0 +1,203 @@
+"""
+Per-host CPU execution settings.
+
+Without a GPU the pipeline runs eagerly with torch's default thread count. ``autotune_cpu`` times a
+short synthetic generation (one transformer step and the DCAE + vocoder decode of a few seconds
+of latents) for a few intra-op thread counts, with and without bfloat16 autocast for the
+transformer and with the DCAE weights in channels-last, and keeps the fastest combination. The
+result is stored per host in ``~/.cache/ace-step/cpu_tuning.json`` and applied by the pipeline
+at load time, so the tuning runs once per machine.
+"""
+
+import functools
+import json
+import os
+import platform
+import time
+from typing import Callable, Dict, List, Optional, TypeVar
+
+import torch
+from loguru import logger
+
+DEFAULT_CPU_TUNING_FILE = os.path.join(os.path.expanduser("~"), ".cache/ace-step/cpu_tuning.json")
+TUNING_FORMAT_VERSION = "1"
+
+T = TypeVar("T")
+
+
+def available_cpus() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def cpu_model() -> str:
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def host_key(dtype: torch.dtype, profile: str = "") -> str:
+    """Host, CPU, usable cores, torch version and pipeline profile the settings were tuned for."""
+    parts = [platform.node(), cpu_model(), f"{available_cpus()}cpu", f"torch-{torch.__version__}", str(dtype)]
+    if profile:
+        parts.append(profile)
+    return "|".join(parts)
+
+
+def thread_candidates(cpus: Optional[int] = None) -> List[int]:
+    # all usable cores, one per physical core on SMT machines, and a quarter for busy hosts
+    cpus = cpus or available_cpus()
+    return sorted({cpus, max(1, cpus // 2), max(1, cpus // 4)}, reverse=True)
+
+
+def load_cpu_settings(path, key) -> Optional[Dict]:
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path) as f:
+            tuned = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable CPU tuning file {path}: {e}")
+        return None
+    if tuned.get("format_version") != TUNING_FORMAT_VERSION:
+        return None
+    return tuned.get("hosts", {}).get(key)
+
+
+def save_cpu_settings(path, key, settings: Dict):
+    """Adds or replaces the settings of ``key``, keeping those of other hosts sharing the file."""
+    tuned = {"format_version": TUNING_FORMAT_VERSION, "hosts": {}}
+    if os.path.isfile(path):
+        try:
+            with open(path) as f:
+                previous = json.load(f)
+            if previous.get("format_version") == TUNING_FORMAT_VERSION:
+                tuned = previous
+        except (OSError, ValueError):
+            pass
+    tuned["hosts"][key] = settings
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(tuned, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def set_dcae_channels_last(music_dcae, channels_last: bool):
+    # only the DCAE is 2D; the vocoder convs are 1D, channels-last does not apply to them
+    memory_format = torch.channels_last if channels_last else torch.contiguous_format
+    music_dcae.dcae.to(memory_format=memory_format)
+
+
+def apply_cpu_settings(settings: Dict, music_dcae=None):
+    torch.set_num_threads(settings["intra_op_threads"])
+    if music_dcae is not None:
+        set_dcae_channels_last(music_dcae, settings["dcae_channels_last"])
+
+
+def cpu_autocast(func: Callable[..., T]) -> Callable[..., T]:
+    """Runs a pipeline method under CPU autocast when the tuned settings of the pipeline ask for it."""
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if self.cpu_autocast_dtype is None:
+            return func(self, *args, **kwargs)
+        with torch.autocast("cpu", dtype=self.cpu_autocast_dtype):
+            return func(self, *args, **kwargs)
+
+    return wrapper
+
+
+def _best_time(fn, repeats) -> float:
+    fn()  # first call allocates and picks kernels
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def autotune_cpu(pipeline, duration: float = 10.0, repeats: int = 2) -> Dict:
+    """
+    Times the synthetic generation of ``duration`` seconds on the loaded ``pipeline`` and returns
+    the fastest settings with the measured times. Leaves the pipeline in the winning configuration.
+    Combinations that fail (e.g. bfloat16 autocast with int8 Linear layers) are skipped.
+    """
+    transformer = pipeline.ace_step_transformer
+    music_dcae = pipeline.music_dcae
+    dtype = pipeline.dtype
+    frame_length = pipeline.duration_frame_length(duration)
+    inner_dim = getattr(transformer, "_orig_mod", transformer).inner_dim
+    generator = torch.Generator().manual_seed(0)
+    latents = torch.randn(1, 8, 16, frame_length, generator=generator).to(dtype)
+    encoder_hidden_states = torch.randn(1, 64, inner_dim, generator=generator).to(dtype)
+
+    def transformer_step(autocast_bf16):
+        with torch.autocast("cpu", dtype=torch.bfloat16, enabled=autocast_bf16):
+            transformer.decode(
+                hidden_states=latents,
+                attention_mask=torch.ones(1, frame_length, dtype=dtype),
+                encoder_hidden_states=encoder_hidden_states,
+                encoder_hidden_mask=torch.ones(1, 64, dtype=dtype),
+                timestep=torch.full((1,), 500.0, dtype=dtype),
+                output_length=frame_length,
+            )
+
+    def dcae_step():
+        music_dcae.decode(latents, sr=48000)
+
+    def measure(name, fn):
+        try:
+            return _best_time(fn, repeats)
+        except Exception as e:
+            logger.info(f"CPU tuning: {name} failed, skipped: {e}")
+            return float("inf")
+
+    timings = {}
+    default_threads = torch.get_num_threads()
+    with torch.inference_mode():
+        for threads in thread_candidates():
+            torch.set_num_threads(threads)
+            timings[f"threads={threads}"] = measure(
+                f"{threads} threads", lambda: (transformer_step(False), dcae_step())
+            )
+        thread_times = {int(name.split("=")[1]): value for name, value in timings.items()}
+        intra_op_threads = min(thread_times, key=thread_times.get)
+        if thread_times[intra_op_threads] == float("inf"):
+            raise RuntimeError("CPU tuning: the synthetic generation failed for every thread count")
+        torch.set_num_threads(intra_op_threads)
+
+        timings["transformer"] = measure("transformer", lambda: transformer_step(False))
+        autocast_bf16 = False
+        # autocast only changes anything for float32 models
+        if dtype == torch.float32:
+            timings["transformer_autocast_bf16"] = measure("bf16 autocast", lambda: transformer_step(True))
+            autocast_bf16 = timings["transformer_autocast_bf16"] < timings["transformer"]
+
+        timings["dcae_contiguous"] = measure("DCAE", dcae_step)
+        set_dcae_channels_last(music_dcae, True)
+        timings["dcae_channels_last"] = measure("DCAE channels-last", dcae_step)
+        dcae_channels_last = timings["dcae_channels_last"] < timings["dcae_contiguous"]
+        set_dcae_channels_last(music_dcae, dcae_channels_last)
+
+    settings = {
+        "intra_op_threads": intra_op_threads,
+        "autocast_bf16": autocast_bf16,
+        "dcae_channels_last": dcae_channels_last,
+        "default_intra_op_threads": default_threads,
+        "timings": {name: round(value, 4) for name, value in timings.items() if value != float("inf")},
+        "duration": duration,
+        "tuned_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    logger.info(
+        f"CPU tuning: {intra_op_threads} threads (default {default_threads}), "
+        f"bf16 autocast {autocast_bf16}, DCAE channels-last {dcae_channels_last}"
+    )
+    return settings
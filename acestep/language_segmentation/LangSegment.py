@@ -266,7 +266,8 @@ class LangSegment:
 
     def __init__(self):
 
-        self.langid = LanguageIdentifier.from_pickled_model(MODEL_FILE, norm_probs=True)
+        # the pickled langid model is loaded on the first classification, see the langid property
+        self._langid = None
 
         self._text_cache = None
         self._text_lasts = None
@@ -343,6 +344,12 @@ class LangSegment:
 
         self.LangSSML = LangSSML()
 
+    @property
+    def langid(self):
+        if self._langid is None:
+            self._langid = LanguageIdentifier.from_pickled_model(MODEL_FILE, norm_probs=True)
+        return self._langid
+
     def _clears(self):
         self._text_cache = None
         self._text_lasts = None
@@ -26,6 +26,7 @@ from diffusers.loaders import FromOriginalModelMixin, PeftAdapterMixin
 
 
 from .attention import LinearTransformerBlock, t2i_modulate
+from .customer_attention_processor import CrossAttentionKVCache
 from .lyrics_utils.lyric_encoder import ConformerEncoder as LyricEncoder
 
 
@@ -189,10 +190,16 @@ class PatchEmbed(nn.Module):
         self.height, self.width = height // patch_size_h, width // patch_size_w
         self.base_size = self.width
 
-    def forward(self, latent):
+    def forward(self, latent, valid_length: Optional[int] = None):
+        width = latent.shape[-1]
+        if valid_length is not None and valid_length < width:
+            # the GroupNorm statistics span all frames, padding must not enter them
+            latent = latent[..., :valid_length]
         # early convolutions, N x C x H x W -> N x 256 * sqrt(patch_size) x H/patch_size x W/patch_size
         latent = self.early_conv_layers(latent)
         latent = latent.flatten(2).transpose(1, 2)  # BCHW -> BNC
+        if latent.shape[1] < width:
+            latent = F.pad(latent, (0, 0, 0, width - latent.shape[1]))
         return latent
 
 
@@ -203,6 +210,94 @@ class Transformer2DModelOutput(BaseOutput):
     proj_losses: Optional[Tuple[Tuple[str, torch.Tensor]]] = None
 
 
+@dataclass
+class DecodeTables:
+    """
+    Per-generation inputs of `ACEStepTransformer2DModel.decode` that do not depend on the latents:
+    rotary cos/sin for the latent and encoder sequences, already shaped [1, 1, S, D] in float32 on
+    the model device, and the timestep embeddings of every scheduled timestep.
+    """
+
+    rotary_freqs_cis: Tuple[torch.Tensor, torch.Tensor]
+    encoder_rotary_freqs_cis: Tuple[torch.Tensor, torch.Tensor]
+    embedded_timesteps: torch.Tensor
+    temb: torch.Tensor
+
+
+class StepFeatureCache:
+    """
+    Opt-in reuse of the deep transformer blocks across diffusion steps (TeaCache / DeepCache style).
+
+    Every `decode` measures the relative L1 change of the timestep-modulated input of the first block
+    against the previous step. While the change accumulated since the last full pass stays below
+    `threshold`, the blocks from `start_block` on are skipped and the residual they added on that
+    pass is reused. Conditioning variants (cond / uncond passes) are tracked separately by identity
+    of the encoder states, like in `CrossAttentionKVCache`. The last of `num_steps` is always computed.
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        start_block: int = 2,
+        num_steps: Optional[int] = None,
+        max_variants: int = 4,
+    ):
+        self.threshold = threshold
+        self.start_block = start_block
+        self.num_steps = num_steps
+        self.max_variants = max_variants
+        self.computed_steps = 0
+        self.reused_steps = 0
+        self._variants = []  # [(encoder_hidden_states, state)]
+
+    def state_for(self, encoder_hidden_states: torch.Tensor) -> Dict[str, Any]:
+        for source, state in self._variants:
+            if source is encoder_hidden_states:
+                return state
+        state = {"modulated": None, "accumulated": 0.0, "residual": None}
+        self._variants.append((encoder_hidden_states, state))
+        if len(self._variants) > self.max_variants:
+            self._variants.pop(0)
+        return state
+
+    def should_reuse(
+        self,
+        state: Dict[str, Any],
+        modulated: torch.Tensor,
+        step_index: Optional[int] = None,
+    ) -> bool:
+        previous = state["modulated"]
+        state["modulated"] = modulated
+        reusable = (
+            previous is not None
+            and state["residual"] is not None
+            and previous.shape == modulated.shape
+            and not (
+                self.num_steps is not None
+                and step_index is not None
+                and step_index >= self.num_steps - 1
+            )
+        )
+        if reusable:
+            state["accumulated"] += (
+                (modulated - previous).abs().mean() / previous.abs().mean()
+            ).item()
+            if state["accumulated"] < self.threshold:
+                self.reused_steps += 1
+                return True
+        state["accumulated"] = 0.0
+        self.computed_steps += 1
+        return False
+
+    @property
+    def reuse_ratio(self) -> float:
+        total = self.computed_steps + self.reused_steps
+        return self.reused_steps / total if total else 0.0
+
+    def clear(self):
+        self._variants.clear()
+
+
 class ACEStepTransformer2DModel(
     ModelMixin, ConfigMixin, PeftAdapterMixin, FromOriginalModelMixin
 ):
@@ -364,11 +459,16 @@ class ACEStepTransformer2DModel(
         self,
         lyric_token_idx: Optional[torch.LongTensor] = None,
         lyric_mask: Optional[torch.LongTensor] = None,
+        layer_query_scales: Optional[Dict[int, float]] = None,
     ):
         # N x T x D
         lyric_embs = self.lyric_embs(lyric_token_idx)
         prompt_prenet_out, _mask = self.lyric_encoder(
-            lyric_embs, lyric_mask, decoding_chunk_size=1, num_decoding_left_chunks=-1
+            lyric_embs,
+            lyric_mask,
+            decoding_chunk_size=1,
+            num_decoding_left_chunks=-1,
+            layer_query_scales=layer_query_scales,
         )
         prompt_prenet_out = self.lyric_proj(prompt_prenet_out)
         return prompt_prenet_out
@@ -380,6 +480,7 @@ class ACEStepTransformer2DModel(
         speaker_embeds: Optional[torch.FloatTensor] = None,
         lyric_token_idx: Optional[torch.LongTensor] = None,
         lyric_mask: Optional[torch.LongTensor] = None,
+        lyric_layer_query_scales: Optional[Dict[int, float]] = None,
     ):
 
         bs = encoder_text_hidden_states.shape[0]
@@ -396,6 +497,7 @@ class ACEStepTransformer2DModel(
         encoder_lyric_hidden_states = self.forward_lyric_encoder(
             lyric_token_idx=lyric_token_idx,
             lyric_mask=lyric_mask,
+            layer_query_scales=lyric_layer_query_scales,
         )
 
         encoder_hidden_states = torch.cat(
@@ -411,6 +513,49 @@ class ACEStepTransformer2DModel(
         )
         return encoder_hidden_states, encoder_hidden_mask
 
+    def _broadcast_rotary(self, seq_len, dtype):
+        # same values decode() would get, upcast once instead of in every attention block
+        cos, sin = self.rotary_emb(
+            torch.empty(0, device=self.rotary_emb.inv_freq.device, dtype=dtype),
+            seq_len=seq_len,
+        )
+        return cos[None, None].float(), sin[None, None].float()
+
+    def precompute_decode_tables(
+        self,
+        timesteps: torch.Tensor,
+        latent_length: int,
+        encoder_length: int,
+        dtype: Optional[torch.dtype] = None,
+    ) -> DecodeTables:
+        """
+        Builds the rotary tables for both sequence lengths and the timestep embeddings for all `timesteps`
+        in one batched call. Pass the result to `decode` together with the index of the current timestep.
+        """
+        dtype = dtype if dtype is not None else self.dtype
+        embedded_timesteps = self.timestep_embedder(
+            self.time_proj(timesteps).to(dtype=dtype)
+        )
+        temb = self.t_block(embedded_timesteps)
+        return DecodeTables(
+            rotary_freqs_cis=self._broadcast_rotary(latent_length, dtype),
+            encoder_rotary_freqs_cis=self._broadcast_rotary(encoder_length, dtype),
+            embedded_timesteps=embedded_timesteps,
+            temb=temb,
+        )
+
+    def _modulated_block_input(self, hidden_states, temb):
+        # what the first block feeds its self-attention: tracks both the latents and the timestep
+        block = self.transformer_blocks[0]
+        norm_hidden_states = block.norm1(hidden_states)
+        if block.use_adaln_single:
+            shift_msa, scale_msa = (
+                block.scale_shift_table[None]
+                + temb.reshape(hidden_states.shape[0], 6, -1)
+            )[:, :2].chunk(2, dim=1)
+            norm_hidden_states = norm_hidden_states * (1 + scale_msa) + shift_msa
+        return norm_hidden_states
+
     def decode(
         self,
         hidden_states: torch.Tensor,
@@ -425,14 +570,33 @@ class ACEStepTransformer2DModel(
         ] = None,
         controlnet_scale: Union[float, torch.Tensor] = 1.0,
         return_dict: bool = True,
+        cross_attention_kv_cache: Optional[CrossAttentionKVCache] = None,
+        decode_tables: Optional[DecodeTables] = None,
+        step_index: Optional[int] = None,
+        block_query_scales: Optional[Dict[int, Union[float, torch.Tensor]]] = None,
+        feature_cache: Optional[StepFeatureCache] = None,
+        valid_length: Optional[int] = None,
     ):
+        """
+        `valid_length` marks the latents as padded after that many frames (duration buckets). `attention_mask`
+        must be 0 on the padded frames; they do not affect the others and their output is 0.
+        """
 
-        embedded_timestep = self.timestep_embedder(
-            self.time_proj(timestep).to(dtype=hidden_states.dtype)
-        )
-        temb = self.t_block(embedded_timestep)
+        if decode_tables is not None and step_index is not None:
+            batch_size = hidden_states.shape[0]
+            embedded_timestep = decode_tables.embedded_timesteps[
+                step_index : step_index + 1
+            ].expand(batch_size, -1)
+            temb = decode_tables.temb[step_index : step_index + 1].expand(batch_size, -1)
+        else:
+            embedded_timestep = self.timestep_embedder(
+                self.time_proj(timestep).to(dtype=hidden_states.dtype)
+            )
+            temb = self.t_block(embedded_timestep)
 
-        hidden_states = self.proj_in(hidden_states)
+        hidden_states = self.proj_in(hidden_states, valid_length=valid_length)
+        # only padded latents need the feed-forward masking, unpadded steps skip it
+        padding_mask = attention_mask if valid_length is not None and valid_length < hidden_states.shape[1] else None
 
         # controlnet logic
         if block_controlnet_hidden_states is not None:
@@ -441,15 +605,40 @@ class ACEStepTransformer2DModel(
 
         inner_hidden_states = []
 
-        rotary_freqs_cis = self.rotary_emb(
-            hidden_states, seq_len=hidden_states.shape[1]
-        )
-        encoder_rotary_freqs_cis = self.rotary_emb(
-            encoder_hidden_states, seq_len=encoder_hidden_states.shape[1]
-        )
+        if (
+            decode_tables is not None
+            and decode_tables.rotary_freqs_cis[0].shape[-2] == hidden_states.shape[1]
+            and decode_tables.encoder_rotary_freqs_cis[0].shape[-2]
+            == encoder_hidden_states.shape[1]
+        ):
+            rotary_freqs_cis = decode_tables.rotary_freqs_cis
+            encoder_rotary_freqs_cis = decode_tables.encoder_rotary_freqs_cis
+        else:
+            rotary_freqs_cis = self.rotary_emb(
+                hidden_states, seq_len=hidden_states.shape[1]
+            )
+            encoder_rotary_freqs_cis = self.rotary_emb(
+                encoder_hidden_states, seq_len=encoder_hidden_states.shape[1]
+            )
+
+        feature_cache_state = None
+        reuse_deep_blocks = False
+        if feature_cache is not None and not self.training and ssl_hidden_states is None:
+            feature_cache_state = feature_cache.state_for(encoder_hidden_states)
+            reuse_deep_blocks = feature_cache.should_reuse(
+                feature_cache_state,
+                self._modulated_block_input(hidden_states[:, :valid_length], temb),
+                step_index,
+            )
 
         for index_block, block in enumerate(self.transformer_blocks):
 
+            if feature_cache_state is not None and index_block == feature_cache.start_block:
+                if reuse_deep_blocks:
+                    hidden_states = hidden_states + feature_cache_state["residual"]
+                    break
+                deep_blocks_input = hidden_states
+
             if self.training and self.gradient_checkpointing:
 
                 hidden_states = torch.utils.checkpoint.checkpoint(
@@ -473,12 +662,26 @@ class ACEStepTransformer2DModel(
                     rotary_freqs_cis=rotary_freqs_cis,
                     rotary_freqs_cis_cross=encoder_rotary_freqs_cis,
                     temb=temb,
+                    cross_attention_kv_cache=cross_attention_kv_cache,
+                    attn_query_scale=(
+                        block_query_scales.get(index_block)
+                        if block_query_scales
+                        else None
+                    ),
+                    padding_mask=padding_mask,
                 )
 
             for ssl_encoder_depth in self.ssl_encoder_depths:
                 if index_block == ssl_encoder_depth:
                     inner_hidden_states.append(hidden_states)
 
+        if (
+            feature_cache_state is not None
+            and not reuse_deep_blocks
+            and feature_cache.start_block < len(self.transformer_blocks)
+        ):
+            feature_cache_state["residual"] = hidden_states - deep_blocks_input
+
         proj_losses = []
         if (
             len(inner_hidden_states) > 0
@@ -519,6 +722,8 @@ class ACEStepTransformer2DModel(
                 proj_losses.append((ssl_name, proj_loss / bs))
 
         output = self.final_layer(hidden_states, embedded_timestep, output_length)
+        if valid_length is not None and valid_length < output.shape[-1]:
+            output[..., valid_length:] = 0
         if not return_dict:
             return (output, proj_losses)
 
@@ -11,7 +11,7 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from typing import Tuple, Union
+from typing import Optional, Tuple, Union
 
 import torch
 import torch.nn.functional as F
@@ -25,6 +25,7 @@ try:
     # from .dcformer import DCMHAttention
     from .customer_attention_processor import (
         Attention,
+        CrossAttentionKVCache,
         CustomLiteLAProcessor2_0,
         CustomerAttnProcessor2_0,
     )
@@ -32,6 +33,7 @@ except ImportError:
     # from dcformer import DCMHAttention
     from customer_attention_processor import (
         Attention,
+        CrossAttentionKVCache,
         CustomLiteLAProcessor2_0,
         CustomerAttnProcessor2_0,
     )
@@ -179,9 +181,13 @@ class GLUMBConv(nn.Module):
             act=act[2],
         )
 
-    def forward(self, x: torch.Tensor) -> torch.Tensor:
+    def forward(self, x: torch.Tensor, mask: Optional[torch.Tensor] = None) -> torch.Tensor:
         x = x.transpose(1, 2)
         x = self.inverted_conv(x)
+        if mask is not None:
+            # the biased inverted conv maps zeros to silu(bias): masked (padded) frames are zeroed
+            # after it, so the depthwise conv sees them like its own zero padding
+            x = x.masked_fill(mask[:, None, :] == 0, 0)
         x = self.depth_conv(x)
 
         x, gate = torch.chunk(x, 2, dim=1)
@@ -267,7 +273,14 @@ class LinearTransformerBlock(nn.Module):
         rotary_freqs_cis: Union[torch.Tensor, Tuple[torch.Tensor]] = None,
         rotary_freqs_cis_cross: Union[torch.Tensor, Tuple[torch.Tensor]] = None,
         temb: torch.FloatTensor = None,
+        cross_attention_kv_cache: Optional[CrossAttentionKVCache] = None,
+        attn_query_scale: Optional[Union[float, torch.Tensor]] = None,
+        padding_mask: Optional[torch.Tensor] = None,
     ):
+        """
+        `padding_mask` (N x T, 0 on padded frames) is given only when the frames are padded, the feed-forward then
+        keeps the padding out of its depthwise conv.
+        """
 
         N = hidden_states.shape[0]
 
@@ -290,6 +303,7 @@ class LinearTransformerBlock(nn.Module):
                 encoder_attention_mask=encoder_attention_mask,
                 rotary_freqs_cis=rotary_freqs_cis,
                 rotary_freqs_cis_cross=rotary_freqs_cis_cross,
+                query_scale=attn_query_scale,
             )
         else:
             attn_output, _ = self.attn(
@@ -299,6 +313,7 @@ class LinearTransformerBlock(nn.Module):
                 encoder_attention_mask=None,
                 rotary_freqs_cis=rotary_freqs_cis,
                 rotary_freqs_cis_cross=None,
+                query_scale=attn_query_scale,
             )
 
         if self.use_adaln_single:
@@ -313,6 +328,8 @@ class LinearTransformerBlock(nn.Module):
                 encoder_attention_mask=encoder_attention_mask,
                 rotary_freqs_cis=rotary_freqs_cis,
                 rotary_freqs_cis_cross=rotary_freqs_cis_cross,
+                kv_cache=cross_attention_kv_cache,
+                query_scale=attn_query_scale,
             )
             hidden_states = attn_output + hidden_states
 
@@ -322,7 +339,7 @@ class LinearTransformerBlock(nn.Module):
             norm_hidden_states = norm_hidden_states * (1 + scale_mlp) + shift_mlp
 
         # step 4: feed forward
-        ff_output = self.ff(norm_hidden_states)
+        ff_output = self.ff(norm_hidden_states, mask=padding_mask)
         if self.use_adaln_single:
             ff_output = gate_mlp * ff_output
 
@@ -23,6 +23,46 @@ from diffusers.models.attention_processor import Attention
 logger = logging.get_logger(__name__)  # pylint: disable=invalid-name
 
 
+class CrossAttentionKVCache:
+    """
+    Per-generation cache of cross-attention keys, values and masks.
+
+    The conditioning (encoder states and masks) is constant for a whole generation, so the
+    K/V projections of every `CustomerAttnProcessor2_0` only need to be computed on the first
+    step of each conditioning variant. Variants are recognised by tensor identity: the cache
+    holds references to the source tensors, so passing different conditioning tensors starts a
+    new variant instead of returning stale entries.
+    """
+
+    def __init__(self, max_variants: int = 4):
+        self.max_variants = max_variants
+        self._variants = []  # [(sources, {layer_id: (key, value, attention_mask)})]
+
+    def _find(self, sources):
+        for variant in self._variants:
+            if all(a is b for a, b in zip(variant[0], sources)):
+                return variant
+        return None
+
+    def lookup(self, attn: Attention, *sources):
+        variant = self._find(sources)
+        if variant is None:
+            return None
+        return variant[1].get(id(attn))
+
+    def store(self, attn: Attention, entry, *sources):
+        variant = self._find(sources)
+        if variant is None:
+            variant = (sources, {})
+            self._variants.append(variant)
+            if len(self._variants) > self.max_variants:
+                self._variants.pop(0)
+        variant[1][id(attn)] = entry
+
+    def clear(self):
+        self._variants.clear()
+
+
 class CustomLiteLAProcessor2_0:
     """Attention processor used typically in processing the SD3-like self-attention projections. add rms norm for query and key and apply RoPE"""
 
@@ -50,10 +90,11 @@ class CustomLiteLAProcessor2_0:
         Returns:
             Tuple[torch.Tensor, torch.Tensor]: Tuple of modified query tensor and key tensor with rotary embeddings.
         """
-        cos, sin = freqs_cis  # [S, D]
-        cos = cos[None, None]
-        sin = sin[None, None]
-        cos, sin = cos.to(x.device), sin.to(x.device)
+        cos, sin = freqs_cis  # [S, D], or [1, 1, S, D] when precomputed by the transformer
+        if cos.ndim == 2:
+            cos = cos[None, None]
+            sin = sin[None, None]
+            cos, sin = cos.to(x.device), sin.to(x.device)
 
         x_real, x_imag = x.reshape(*x.shape[:-1], -1, 2).unbind(-1)  # [B, S, H, D//2]
         x_rotated = torch.stack([-x_imag, x_real], dim=-1).flatten(3)
@@ -70,6 +111,7 @@ class CustomLiteLAProcessor2_0:
         encoder_attention_mask: Optional[torch.FloatTensor] = None,
         rotary_freqs_cis: Union[torch.Tensor, Tuple[torch.Tensor]] = None,
         rotary_freqs_cis_cross: Union[torch.Tensor, Tuple[torch.Tensor]] = None,
+        query_scale: Optional[Union[float, torch.Tensor]] = None,
         *args,
         **kwargs,
     ) -> torch.FloatTensor:
@@ -94,6 +136,8 @@ class CustomLiteLAProcessor2_0:
         # `sample` projections.
         dtype = hidden_states.dtype
         query = attn.to_q(hidden_states)
+        if query_scale is not None:
+            query = query * query_scale
         key = attn.to_k(hidden_states)
         value = attn.to_v(hidden_states)
 
@@ -274,10 +318,11 @@ class CustomerAttnProcessor2_0:
         Returns:
             Tuple[torch.Tensor, torch.Tensor]: Tuple of modified query tensor and key tensor with rotary embeddings.
         """
-        cos, sin = freqs_cis  # [S, D]
-        cos = cos[None, None]
-        sin = sin[None, None]
-        cos, sin = cos.to(x.device), sin.to(x.device)
+        cos, sin = freqs_cis  # [S, D], or [1, 1, S, D] when precomputed by the transformer
+        if cos.ndim == 2:
+            cos = cos[None, None]
+            sin = sin[None, None]
+            cos, sin = cos.to(x.device), sin.to(x.device)
 
         x_real, x_imag = x.reshape(*x.shape[:-1], -1, 2).unbind(-1)  # [B, S, H, D//2]
         x_rotated = torch.stack([-x_imag, x_real], dim=-1).flatten(3)
@@ -294,6 +339,8 @@ class CustomerAttnProcessor2_0:
         encoder_attention_mask: Optional[torch.FloatTensor] = None,
         rotary_freqs_cis: Union[torch.Tensor, Tuple[torch.Tensor]] = None,
         rotary_freqs_cis_cross: Union[torch.Tensor, Tuple[torch.Tensor]] = None,
+        kv_cache: Optional[CrossAttentionKVCache] = None,
+        query_scale: Optional[Union[float, torch.Tensor]] = None,
         *args,
         **kwargs,
     ) -> torch.Tensor:
@@ -325,65 +372,82 @@ class CustomerAttnProcessor2_0:
             )
 
         query = attn.to_q(hidden_states)
+        if query_scale is not None:
+            query = query * query_scale
 
-        if encoder_hidden_states is None:
-            encoder_hidden_states = hidden_states
-        elif attn.norm_cross:
-            encoder_hidden_states = attn.norm_encoder_hidden_states(
-                encoder_hidden_states
-            )
-
-        key = attn.to_k(encoder_hidden_states)
-        value = attn.to_v(encoder_hidden_states)
-
-        inner_dim = key.shape[-1]
+        inner_dim = query.shape[-1]
         head_dim = inner_dim // attn.heads
 
         query = query.view(batch_size, -1, attn.heads, head_dim).transpose(1, 2)
 
-        key = key.view(batch_size, -1, attn.heads, head_dim).transpose(1, 2)
-        value = value.view(batch_size, -1, attn.heads, head_dim).transpose(1, 2)
-
         if attn.norm_q is not None:
             query = attn.norm_q(query)
-        if attn.norm_k is not None:
-            key = attn.norm_k(key)
 
-        # Apply RoPE if needed
         if rotary_freqs_cis is not None:
             query = self.apply_rotary_emb(query, rotary_freqs_cis)
-            if not attn.is_cross_attention:
-                key = self.apply_rotary_emb(key, rotary_freqs_cis)
-            elif rotary_freqs_cis_cross is not None and has_encoder_hidden_state_proj:
-                key = self.apply_rotary_emb(key, rotary_freqs_cis_cross)
-
-        if (
-            attn.is_cross_attention
-            and encoder_attention_mask is not None
-            and has_encoder_hidden_state_proj
-        ):
-            # attention_mask: N x S1
-            # encoder_attention_mask: N x S2
-            # cross attention 整合attention_mask和encoder_attention_mask
-            combined_mask = (
-                attention_mask[:, :, None] * encoder_attention_mask[:, None, :]
-            )
-            attention_mask = torch.where(combined_mask == 1, 0.0, -torch.inf)
-            attention_mask = (
-                attention_mask[:, None, :, :]
-                .expand(-1, attn.heads, -1, -1)
-                .to(query.dtype)
-            )
 
-        elif not attn.is_cross_attention and attention_mask is not None:
-            attention_mask = attn.prepare_attention_mask(
-                attention_mask, sequence_length, batch_size
-            )
-            # scaled_dot_product_attention expects attention_mask shape to be
-            # (batch, heads, source_length, target_length)
-            attention_mask = attention_mask.view(
-                batch_size, attn.heads, -1, attention_mask.shape[-1]
-            )
+        # keys, values and the cross-attention mask only depend on the conditioning
+        use_kv_cache = kv_cache is not None and attn.is_cross_attention
+        cache_sources = (encoder_hidden_states, attention_mask, encoder_attention_mask)
+        cached = kv_cache.lookup(attn, *cache_sources) if use_kv_cache else None
+        if cached is not None:
+            key, value, attention_mask = cached
+        else:
+            if encoder_hidden_states is None:
+                encoder_hidden_states = hidden_states
+            elif attn.norm_cross:
+                encoder_hidden_states = attn.norm_encoder_hidden_states(
+                    encoder_hidden_states
+                )
+
+            key = attn.to_k(encoder_hidden_states)
+            value = attn.to_v(encoder_hidden_states)
+
+            key = key.view(batch_size, -1, attn.heads, head_dim).transpose(1, 2)
+            value = value.view(batch_size, -1, attn.heads, head_dim).transpose(1, 2)
+
+            if attn.norm_k is not None:
+                key = attn.norm_k(key)
+
+            # Apply RoPE if needed
+            if rotary_freqs_cis is not None:
+                if not attn.is_cross_attention:
+                    key = self.apply_rotary_emb(key, rotary_freqs_cis)
+                elif rotary_freqs_cis_cross is not None and has_encoder_hidden_state_proj:
+                    key = self.apply_rotary_emb(key, rotary_freqs_cis_cross)
+
+            if (
+                attn.is_cross_attention
+                and encoder_attention_mask is not None
+                and has_encoder_hidden_state_proj
+            ):
+                # attention_mask: N x S1
+                # encoder_attention_mask: N x S2
+                # cross attention 整合attention_mask和encoder_attention_mask
+                # masked query frames (duration bucket padding) keep the encoder mask as well:
+                # masking their whole row would make softmax return NaN, their output is unused
+                combined_mask = encoder_attention_mask[:, None, :].expand(
+                    -1, attention_mask.shape[1], -1
+                )
+                attention_mask = torch.where(combined_mask == 1, 0.0, -torch.inf)
+                attention_mask = (
+                    attention_mask[:, None, :, :]
+                    .expand(-1, attn.heads, -1, -1)
+                    .to(query.dtype)
+                )
+
+            elif not attn.is_cross_attention and attention_mask is not None:
+                attention_mask = attn.prepare_attention_mask(
+                    attention_mask, sequence_length, batch_size
+                )
+                # scaled_dot_product_attention expects attention_mask shape to be
+                # (batch, heads, source_length, target_length)
+                attention_mask = attention_mask.view(
+                    batch_size, attn.heads, -1, attention_mask.shape[-1]
+                )
+
+            if use_kv_cache:
+                kv_cache.store(attn, (key, value, attention_mask), *cache_sources)
 
         # the output of sdp = (batch, num_heads, seq_len, head_dim)
         # TODO: add support for attn.scale when we move to Torch 2.1
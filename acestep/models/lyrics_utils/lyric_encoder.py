@@ -1,4 +1,4 @@
-from typing import Optional, Tuple, Union
+from typing import Dict, Optional, Tuple, Union
 import math
 import torch
 from torch import nn
@@ -202,7 +202,11 @@ class MultiHeadedAttention(nn.Module):
         self.dropout = nn.Dropout(p=dropout_rate)
 
     def forward_qkv(
-        self, query: torch.Tensor, key: torch.Tensor, value: torch.Tensor
+        self,
+        query: torch.Tensor,
+        key: torch.Tensor,
+        value: torch.Tensor,
+        query_scale: Optional[float] = None,
     ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
         """Transform query, key and value.
 
@@ -210,6 +214,8 @@ class MultiHeadedAttention(nn.Module):
             query (torch.Tensor): Query tensor (#batch, time1, size).
             key (torch.Tensor): Key tensor (#batch, time2, size).
             value (torch.Tensor): Value tensor (#batch, time2, size).
+            query_scale (float): Optional factor applied to the projected
+                query, i.e. the attention temperature used by ERG.
 
         Returns:
             torch.Tensor: Transformed query tensor, size
@@ -221,7 +227,10 @@ class MultiHeadedAttention(nn.Module):
 
         """
         n_batch = query.size(0)
-        q = self.linear_q(query).view(n_batch, -1, self.h, self.d_k)
+        q = self.linear_q(query)
+        if query_scale is not None:
+            q = q * query_scale
+        q = q.view(n_batch, -1, self.h, self.d_k)
         k = self.linear_k(key).view(n_batch, -1, self.h, self.d_k)
         v = self.linear_v(value).view(n_batch, -1, self.h, self.d_k)
         q = q.transpose(1, 2)  # (batch, head, time1, d_k)
@@ -280,6 +289,7 @@ class MultiHeadedAttention(nn.Module):
         mask: torch.Tensor = torch.ones((0, 0, 0), dtype=torch.bool),
         pos_emb: torch.Tensor = torch.empty(0),
         cache: torch.Tensor = torch.zeros((0, 0, 0, 0)),
+        query_scale: Optional[float] = None,
     ) -> Tuple[torch.Tensor, torch.Tensor]:
         """Compute scaled dot product attention.
 
@@ -302,6 +312,8 @@ class MultiHeadedAttention(nn.Module):
             cache (torch.Tensor): Cache tensor (1, head, cache_t, d_k * 2),
                 where `cache_t == chunk_size * num_decoding_left_chunks`
                 and `head * d_k == size`
+            query_scale (float): Optional factor applied to the projected
+                query, see `forward_qkv`.
 
 
         Returns:
@@ -311,7 +323,7 @@ class MultiHeadedAttention(nn.Module):
                 and `head * d_k == size`
 
         """
-        q, k, v = self.forward_qkv(query, key, value)
+        q, k, v = self.forward_qkv(query, key, value, query_scale)
         if cache.size(0) > 0:
             key_cache, value_cache = torch.split(cache, cache.size(-1) // 2, dim=-1)
             k = torch.cat([key_cache, k], dim=2)
@@ -375,6 +387,7 @@ class RelPositionMultiHeadedAttention(MultiHeadedAttention):
         mask: torch.Tensor = torch.ones((0, 0, 0), dtype=torch.bool),
         pos_emb: torch.Tensor = torch.empty(0),
         cache: torch.Tensor = torch.zeros((0, 0, 0, 0)),
+        query_scale: Optional[float] = None,
     ) -> Tuple[torch.Tensor, torch.Tensor]:
         """Compute 'Scaled Dot Product Attention' with rel. positional encoding.
         Args:
@@ -388,13 +401,15 @@ class RelPositionMultiHeadedAttention(MultiHeadedAttention):
             cache (torch.Tensor): Cache tensor (1, head, cache_t, d_k * 2),
                 where `cache_t == chunk_size * num_decoding_left_chunks`
                 and `head * d_k == size`
+            query_scale (float): Optional factor applied to the projected
+                query, see `forward_qkv`.
         Returns:
             torch.Tensor: Output tensor (#batch, time1, d_model).
             torch.Tensor: Cache tensor (1, head, cache_t + time1, d_k * 2)
                 where `cache_t == chunk_size * num_decoding_left_chunks`
                 and `head * d_k == size`
         """
-        q, k, v = self.forward_qkv(query, key, value)
+        q, k, v = self.forward_qkv(query, key, value, query_scale)
         q = q.transpose(1, 2)  # (batch, time1, head, d_k)
 
         if cache.size(0) > 0:
@@ -643,6 +658,7 @@ class ConformerEncoderLayer(nn.Module):
         mask_pad: torch.Tensor = torch.ones((0, 0, 0), dtype=torch.bool),
         att_cache: torch.Tensor = torch.zeros((0, 0, 0, 0)),
         cnn_cache: torch.Tensor = torch.zeros((0, 0, 0, 0)),
+        query_scale: Optional[float] = None,
     ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
         """Compute encoded features.
 
@@ -658,6 +674,8 @@ class ConformerEncoderLayer(nn.Module):
                 (#batch=1, head, cache_t1, d_k * 2), head * d_k == size.
             cnn_cache (torch.Tensor): Convolution cache in conformer layer
                 (#batch=1, size, cache_t2)
+            query_scale (float): Optional factor applied to the self-attention
+                query projection.
         Returns:
             torch.Tensor: Output tensor (#batch, time, size).
             torch.Tensor: Mask tensor (#batch, time, time).
@@ -679,7 +697,9 @@ class ConformerEncoderLayer(nn.Module):
         residual = x
         if self.normalize_before:
             x = self.norm_mha(x)
-        x_att, new_att_cache = self.self_attn(x, x, x, mask, pos_emb, att_cache)
+        x_att, new_att_cache = self.self_attn(
+            x, x, x, mask, pos_emb, att_cache, query_scale=query_scale
+        )
         x = residual + self.dropout(x_att)
         if not self.normalize_before:
             x = self.norm_mha(x)
@@ -1016,9 +1036,13 @@ class ConformerEncoder(torch.nn.Module):
         chunk_masks: torch.Tensor,
         pos_emb: torch.Tensor,
         mask_pad: torch.Tensor,
+        layer_query_scales: Optional[Dict[int, float]] = None,
     ) -> torch.Tensor:
-        for layer in self.encoders:
-            xs, chunk_masks, _, _ = layer(xs, chunk_masks, pos_emb, mask_pad)
+        for i, layer in enumerate(self.encoders):
+            query_scale = layer_query_scales.get(i) if layer_query_scales else None
+            xs, chunk_masks, _, _ = layer(
+                xs, chunk_masks, pos_emb, mask_pad, query_scale=query_scale
+            )
         return xs
 
     @torch.jit.unused
@@ -1041,6 +1065,7 @@ class ConformerEncoder(torch.nn.Module):
         pad_mask: torch.Tensor,
         decoding_chunk_size: int = 0,
         num_decoding_left_chunks: int = -1,
+        layer_query_scales: Optional[Dict[int, float]] = None,
     ) -> Tuple[torch.Tensor, torch.Tensor]:
         """Embed positions in tensor.
 
@@ -1055,6 +1080,8 @@ class ConformerEncoder(torch.nn.Module):
             the chunk size is decoding_chunk_size.
                 >=0: use num_decoding_left_chunks
                 <0: use all left chunks
+            layer_query_scales: optional {layer index: factor} applied to the
+                self-attention queries of those layers (ERG), inference only
         Returns:
             encoder output tensor xs, and subsampled masks
             xs: padded output tensor (B, T' ~= T/subsample_rate, D)
@@ -1081,7 +1108,9 @@ class ConformerEncoder(torch.nn.Module):
         if self.gradient_checkpointing and self.training:
             xs = self.forward_layers_checkpointed(xs, chunk_masks, pos_emb, mask_pad)
         else:
-            xs = self.forward_layers(xs, chunk_masks, pos_emb, mask_pad)
+            xs = self.forward_layers(
+                xs, chunk_masks, pos_emb, mask_pad, layer_query_scales
+            )
         if self.normalize_before:
             xs = self.after_norm(xs)
         # Here we assume the mask is not changed in encoder layers, so just
@@ -3,37 +3,48 @@ import re
 import textwrap
 from functools import cached_property
 
-import pypinyin
 import torch
-from hangul_romanize import Transliter
-from hangul_romanize.rule import academic
-from num2words import num2words
-from spacy.lang.ar import Arabic
-from spacy.lang.en import English
-from spacy.lang.es import Spanish
-from spacy.lang.ja import Japanese
-from spacy.lang.zh import Chinese
 from tokenizers import Tokenizer
 
 from .zh_num2words import TextNorm as zh_num2words
 from typing import Dict, List, Optional, Set, Union
 
 
+# spaCy, pypinyin, hangul_romanize and num2words are imported on first use, most lyrics need
+# only one of them and importing all of them dominated the import time of the pipeline
+
+
 # copy from https://github.com/coqui-ai/TTS/blob/dbf1a08a0d4e47fdad6172e433eeb34bc6b13b4e/TTS/tts/layers/xtts/tokenizer.py
 def get_spacy_lang(lang):
     if lang == "zh":
+        from spacy.lang.zh import Chinese
+
         return Chinese()
     elif lang == "ja":
+        from spacy.lang.ja import Japanese
+
         return Japanese()
     elif lang == "ar":
+        from spacy.lang.ar import Arabic
+
         return Arabic()
     elif lang == "es":
+        from spacy.lang.es import Spanish
+
         return Spanish()
     else:
+        from spacy.lang.en import English
+
         # For most languages, Enlish does the job
         return English()
 
 
+def num2words(*args, **kwargs):
+    from num2words import num2words as _num2words
+
+    return _num2words(*args, **kwargs)
+
+
 def split_sentence(text, lang, text_split_length=250):
     """Preprocess the input text"""
     text_splits = []
@@ -593,6 +604,8 @@ def basic_cleaners(text):
 
 
 def chinese_transliterate(text):
+    import pypinyin
+
     return "".join(
         [
             p[0]
@@ -613,6 +626,9 @@ def japanese_cleaners(text, katsu):
 
 
 def korean_transliterate(text):
+    from hangul_romanize import Transliter
+    from hangul_romanize.rule import academic
+
     r = Transliter(academic)
     return r.translit(text)
 
@@ -0,0 +1,72 @@
+"""
+ACE-Step: A Step Towards Music Generation Foundation Model
+
+https://github.com/ace-step/ACE-Step
+
+Apache 2.0 License
+"""
+
+from contextlib import contextmanager
+from typing import Iterable
+
+import torch
+import torch.nn.functional as F
+from torch import nn
+
+
+class QueryScaledLinear(nn.Linear):
+    """
+    `nn.Linear` whose output is multiplied by a runtime `query_scale` buffer (1.0 by default).
+
+    Used for the UMT5 self-attention query projections, so ERG can lower their temperature by
+    changing a buffer value instead of registering forward hooks. The buffer is not persistent
+    and the parameters are shared with the replaced layer, so state dict keys are unchanged.
+    """
+
+    @classmethod
+    def from_linear(cls, linear: nn.Linear) -> "QueryScaledLinear":
+        module = cls.__new__(cls)
+        nn.Module.__init__(module)
+        module.in_features = linear.in_features
+        module.out_features = linear.out_features
+        module.weight = linear.weight
+        module.bias = linear.bias
+        module.register_buffer(
+            "query_scale",
+            torch.ones((), device=linear.weight.device, dtype=linear.weight.dtype),
+            persistent=False,
+        )
+        return module
+
+    def forward(self, input: torch.Tensor) -> torch.Tensor:
+        return F.linear(input, self.weight, self.bias) * self.query_scale
+
+
+def _unwrap(model: nn.Module) -> nn.Module:
+    # torch.compile wraps the module, the swap has to happen on the original one
+    return getattr(model, "_orig_mod", model)
+
+
+def install_query_scale(text_encoder_model: nn.Module) -> nn.Module:
+    """Replaces the self-attention query projection of every UMT5 encoder block, idempotent."""
+    model = _unwrap(text_encoder_model)
+    for block in model.encoder.block:
+        self_attention = block.layer[0].SelfAttention
+        if not isinstance(self_attention.q, QueryScaledLinear):
+            self_attention.q = QueryScaledLinear.from_linear(self_attention.q)
+    return text_encoder_model
+
+
+@contextmanager
+def query_temperature(text_encoder_model: nn.Module, tau: float, layers: Iterable[int]):
+    """Scales the self-attention queries of `layers` by `tau` for the duration of the block."""
+    install_query_scale(text_encoder_model)
+    blocks = _unwrap(text_encoder_model).encoder.block
+    scaled = [blocks[i].layer[0].SelfAttention.q for i in layers]
+    for module in scaled:
+        module.query_scale.fill_(tau)
+    try:
+        yield
+    finally:
+        for module in scaled:
+            module.query_scale.fill_(1.0)
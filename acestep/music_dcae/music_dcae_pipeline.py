@@ -7,6 +7,7 @@ Apache 2.0 License
 """
 
 import os
+import math
 import torch
 from diffusers import AutoencoderDC
 import torchaudio
@@ -21,12 +22,63 @@ try:
 except ImportError:
     from music_vocoder import ADaMoSHiFiGANV1
 
+from acestep.resampling import get_resampler, resample
+
 
 root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DEFAULT_PRETRAINED_PATH = os.path.join(root_dir, "checkpoints", "music_dcae_f8c8")
 VOCODER_PRETRAINED_PATH = os.path.join(root_dir, "checkpoints", "music_vocoder")
 
 
+class StreamingResampler:
+    """
+    Resamples a signal that arrives in chunks. Each call keeps enough left and right
+    context around the filter kernel so that the concatenated output matches resampling
+    the whole signal in one go.
+    """
+
+    def __init__(self, orig_freq, new_freq):
+        gcd = math.gcd(orig_freq, new_freq)
+        self.orig_period = orig_freq // gcd
+        self.new_period = new_freq // gcd
+        self.orig_freq = orig_freq
+        self.new_freq = new_freq
+        kernel_width = getattr(get_resampler(orig_freq, new_freq), "width", 16)
+        self.context = self.orig_period * math.ceil((kernel_width + 1) / self.orig_period)
+        self._history = None
+        self._pending = None
+
+    def _resample(self, num_samples, final):
+        history = self._pending[..., :0] if self._history is None else self._history
+        right = num_samples if final else num_samples + self.context
+        segment = torch.cat([history, self._pending[..., :right]], dim=-1)
+        out = resample(segment, self.orig_freq, self.new_freq)
+        start = history.shape[-1] // self.orig_period * self.new_period
+        if final:
+            out = out[..., start:]
+        else:
+            out = out[..., start : start + num_samples // self.orig_period * self.new_period]
+        consumed = torch.cat([history, self._pending[..., :num_samples]], dim=-1)
+        self._history = consumed[..., -self.context :]
+        self._pending = self._pending[..., num_samples:]
+        return out
+
+    def process(self, chunk):
+        if self._pending is None:
+            self._pending = chunk
+        else:
+            self._pending = torch.cat([self._pending, chunk], dim=-1)
+        usable = (self._pending.shape[-1] - self.context) // self.orig_period * self.orig_period
+        if usable <= 0:
+            return chunk[..., :0]
+        return self._resample(usable, final=False)
+
+    def flush(self):
+        if self._pending is None or self._pending.shape[-1] == 0:
+            return None
+        return self._resample(self._pending.shape[-1], final=True)
+
+
 class MusicDCAE(ModelMixin, ConfigMixin, FromOriginalModelMixin):
     @register_to_config
     def __init__(
@@ -37,13 +89,17 @@ class MusicDCAE(ModelMixin, ConfigMixin, FromOriginalModelMixin):
     ):
         super(MusicDCAE, self).__init__()
 
-        self.dcae = AutoencoderDC.from_pretrained(dcae_checkpoint_path)
-        self.vocoder = ADaMoSHiFiGANV1.from_pretrained(vocoder_checkpoint_path)
+        # a None path leaves the sub model to the caller, see from_modules
+        self.dcae = None if dcae_checkpoint_path is None else AutoencoderDC.from_pretrained(dcae_checkpoint_path)
+        self.vocoder = (
+            None if vocoder_checkpoint_path is None else ADaMoSHiFiGANV1.from_pretrained(vocoder_checkpoint_path)
+        )
 
         if source_sample_rate is None:
             source_sample_rate = 48000
 
-        self.resampler = torchaudio.transforms.Resample(source_sample_rate, 44100)
+        # resampling kernels come from the shared registry in acestep.resampling
+        self.source_sample_rate = source_sample_rate
 
         self.transform = transforms.Compose(
             [
@@ -58,6 +114,21 @@ class MusicDCAE(ModelMixin, ConfigMixin, FromOriginalModelMixin):
         self.latent_chunk_size = self.mel_chunk_size // self.time_dimention_multiple
         self.scale_factor = 0.1786
         self.shift_factor = -1.9091
+        # rough peak vocoder activations per output sample of one mel row, sizes the decode chunks
+        self.vocoder_activations_per_sample = 32
+        self._crossfade_window_cache = {}
+
+    @classmethod
+    def from_modules(cls, dcae, vocoder, source_sample_rate=None):
+        """Wraps already loaded DCAE and vocoder models, e.g. from acestep.weight_bundles."""
+        model = cls(
+            source_sample_rate=source_sample_rate,
+            dcae_checkpoint_path=None,
+            vocoder_checkpoint_path=None,
+        )
+        model.dcae = dcae
+        model.vocoder = vocoder
+        return model
 
     def load_audio(self, audio_path):
         audio, sr = torchaudio.load(audio_path)
@@ -80,16 +151,10 @@ class MusicDCAE(ModelMixin, ConfigMixin, FromOriginalModelMixin):
             audio_lengths = audio_lengths.to(audios.device)
 
         # audios: N x 2 x T, 48kHz
-        device = audios.device
-        dtype = audios.dtype
-
         if sr is None:
-            sr = 48000
-            resampler = self.resampler
-        else:
-            resampler = torchaudio.transforms.Resample(sr, 44100).to(device).to(dtype)
+            sr = self.source_sample_rate
 
-        audio = resampler(audios)
+        audio = resample(audios, sr, 44100)
 
         max_audio_len = audio.shape[-1]
         if max_audio_len % (8 * 512) != 0:
@@ -111,31 +176,71 @@ class MusicDCAE(ModelMixin, ConfigMixin, FromOriginalModelMixin):
         latents = (latents - self.shift_factor) * self.scale_factor
         return latents, latent_lengths
 
+    def _vocoder_rows_per_chunk(self, num_rows, mel_frames, memory_budget=None):
+        """
+        How many (item, channel) mel rows fit in one vocoder call within ``memory_budget``
+        bytes, by default half of the free device memory (no limit on the CPU).
+        """
+        if memory_budget is None:
+            if self.device.type != "cuda":
+                return num_rows
+            free_memory, _ = torch.cuda.mem_get_info(self.device)
+            memory_budget = free_memory // 2
+        element_size = next(self.vocoder.parameters()).element_size()
+        row_bytes = (
+            mel_frames * 512 * self.vocoder_activations_per_sample * element_size
+        )
+        return max(1, min(num_rows, memory_budget // max(row_bytes, 1)))
+
+    def _vocode_rows(self, mel_rows, memory_budget=None):
+        """
+        Vocodes (N, n_mels, T) mel rows into an (N, samples) tensor on the device, as few
+        calls as the memory budget allows. Chunks shrink further if a call runs out of memory.
+        """
+        num_rows = mel_rows.shape[0]
+        rows_per_chunk = self._vocoder_rows_per_chunk(
+            num_rows, mel_rows.shape[-1], memory_budget
+        )
+        wavs = None
+        start = 0
+        while start < num_rows:
+            end = min(num_rows, start + rows_per_chunk)
+            try:
+                wav = self.vocoder.decode(mel_rows[start:end]).squeeze(1)
+            except torch.cuda.OutOfMemoryError:
+                if rows_per_chunk == 1:
+                    raise
+                rows_per_chunk = max(1, rows_per_chunk // 2)
+                torch.cuda.empty_cache()
+                continue
+            if wavs is None:
+                wavs = wav.new_empty((num_rows, wav.shape[-1]))
+            wavs[start:end] = wav
+            start = end
+        return wavs
+
     @torch.no_grad()
-    def decode(self, latents, audio_lengths=None, sr=None):
+    def decode(self, latents, audio_lengths=None, sr=None, memory_budget=None):
         latents = latents / self.scale_factor + self.shift_factor
 
-        pred_wavs = []
-
+        mels = []
         for latent in latents:
-            mels = self.dcae.decoder(latent.unsqueeze(0))
-            mels = mels * 0.5 + 0.5
-            mels = mels * (self.max_mel_value - self.min_mel_value) + self.min_mel_value
-
-            # wav = self.vocoder.decode(mels[0]).squeeze(1)
-            # decode waveform for each channels to reduce vram footprint
-            wav_ch1 = self.vocoder.decode(mels[:,0,:,:]).squeeze(1).cpu()
-            wav_ch2 = self.vocoder.decode(mels[:,1,:,:]).squeeze(1).cpu()
-            wav = torch.cat([wav_ch1, wav_ch2],dim=0)
-
-            if sr is not None:
-                resampler = (
-                    torchaudio.transforms.Resample(44100, sr)
-                )
-                wav = resampler(wav.cpu().float())
-            else:
-                sr = 44100
-            pred_wavs.append(wav)
+            mel = self.dcae.decoder(latent.unsqueeze(0))
+            mel = mel * 0.5 + 0.5
+            mel = mel * (self.max_mel_value - self.min_mel_value) + self.min_mel_value
+            mels.append(mel)
+        mels = torch.cat(mels, dim=0)  # (B, channels, n_mels, T)
+
+        # both channels of every item through the vocoder together, a single copy to the host
+        batch_size, num_channels = mels.shape[:2]
+        wavs = self._vocode_rows(mels.flatten(0, 1), memory_budget=memory_budget)
+        wavs = wavs.view(batch_size, num_channels, -1).cpu()
+
+        if sr is not None:
+            wavs = resample(wavs.float(), 44100, sr)
+        else:
+            sr = 44100
+        pred_wavs = list(wavs.unbind(0))
 
         if audio_lengths is not None:
             pred_wavs = [
@@ -143,19 +248,12 @@ class MusicDCAE(ModelMixin, ConfigMixin, FromOriginalModelMixin):
             ]
         return sr, pred_wavs
 
-    @torch.no_grad()
-    def decode_overlap(self, latents, audio_lengths=None, sr=None):
+    def _decode_overlap_mels(self, current_latent):
         """
-        Decodes latents into waveforms using an overlapped DCAE and Vocoder.
+        Decodes a single (1, C, H, W_latent) latent into a denormalized mel spectrogram
+        using overlapped DCAE windows.
         """
-        print("Using Overlapped DCAE and Vocoder")
-
-        MODEL_INTERNAL_SR = 44100
         DCAE_LATENT_TO_MEL_STRIDE = 8
-        VOCODER_AUDIO_SAMPLES_PER_MEL_FRAME = 512
-
-        pred_wavs = []
-        final_output_sr = sr if sr is not None else MODEL_INTERNAL_SR
 
         # --- DCAE Parameters ---
         # dcae_win_len_latent: Window length in the latent domain for DCAE processing
@@ -169,6 +267,101 @@ class MusicDCAE(ModelMixin, ConfigMixin, FromOriginalModelMixin):
         # dcae_mel_overlap_len: Overlap length in the mel domain to be trimmed/blended
         dcae_mel_overlap_len = dcae_mel_win_len // 4
 
+        latent_len = current_latent.shape[3]
+
+        # the kept segments tile the latent exactly, so the mel length is known up front
+        concatenated_mels = None
+        mel_capacity = latent_len * DCAE_LATENT_TO_MEL_STRIDE
+        mel_filled = 0
+        if latent_len == 0:
+            pass # No mel segments to generate
+        else:
+            # Determine anchor points for DCAE windows
+            # An anchor marks a reference point for a window slice.
+            # Window slice: current_latent[..., anchor - offset : anchor - offset + win_len]
+            # First anchor ensures window starts at 0. Last anchor ensures tail is covered.
+            dcae_anchors = list(range(dcae_anchor_offset, latent_len - dcae_anchor_offset, dcae_anchor_hop))
+            if not dcae_anchors: # If latent is too short for the range, use one anchor
+                dcae_anchors = [dcae_anchor_offset]
+            
+            for i, anchor in enumerate(dcae_anchors):
+                win_start_idx = max(0, anchor - dcae_anchor_offset)
+                win_end_idx = min(latent_len, win_start_idx + dcae_win_len_latent)
+                
+                dcae_input_segment = current_latent[:, :, :, win_start_idx:win_end_idx]
+                if dcae_input_segment.shape[3] == 0: continue
+
+                mel_output_full = self.dcae.decoder(dcae_input_segment) # (1, C, H_mel, W_mel_fixed_from_dcae)
+
+                is_first = (i == 0)
+                is_last = (i == len(dcae_anchors) - 1)
+
+                if is_first and is_last: # Only one segment
+                    # Use mel corresponding to actual input latent length
+                    true_mel_content_len = dcae_input_segment.shape[3] * DCAE_LATENT_TO_MEL_STRIDE
+                    mel_to_keep = mel_output_full[:, :, :, :min(true_mel_content_len, mel_output_full.shape[3])]
+                elif is_first: # First segment, trim end overlap
+                    mel_to_keep = mel_output_full[:, :, :, :-dcae_mel_overlap_len]
+                elif is_last: # Last segment, trim start overlap
+                    # And ensure we only take content relevant to the (potentially partial) last latent window
+                    # The mel_output_full is fixed length. The useful part starts after overlap.
+                    # The length of the useful part depends on how much of dcae_input_segment was actual content.
+                    # For simplicity in overlap-add, typically trim fixed overlap.
+                    # If dcae_input_segment was shorter than dcae_win_len_latent, mel_output_full might contain padding effects.
+                    # Standard OLA keeps the corresponding tail.
+                    mel_to_keep = mel_output_full[:, :, :, dcae_mel_overlap_len:]
+                else: # Middle segment, trim both overlaps
+                    mel_to_keep = mel_output_full[:, :, :, dcae_mel_overlap_len:-dcae_mel_overlap_len]
+                
+                keep_len = min(mel_to_keep.shape[3], mel_capacity - mel_filled)
+                if keep_len > 0:
+                    if concatenated_mels is None:
+                        concatenated_mels = mel_output_full.new_empty(
+                            mel_output_full.shape[:3] + (mel_capacity,)
+                        )
+                    concatenated_mels[:, :, :, mel_filled:mel_filled + keep_len] = mel_to_keep[:, :, :, :keep_len]
+                    mel_filled += keep_len
+        
+        if concatenated_mels is None:
+            num_mel_channels = current_latent.shape[1]
+            mel_height = self.dcae.decoder_output_mel_height
+            concatenated_mels = torch.empty(
+                (1, num_mel_channels, mel_height, 0),
+                device=current_latent.device, dtype=current_latent.dtype
+            )
+        else:
+            concatenated_mels = concatenated_mels[:, :, :, :mel_filled]
+
+        # Denormalize mels, in place on the buffer
+        concatenated_mels.mul_(0.5).add_(0.5)
+        concatenated_mels.mul_(self.max_mel_value - self.min_mel_value).add_(self.min_mel_value)
+        return concatenated_mels
+
+    def _crossfade_windows(self, length, device):
+        """Fade-out / fade-in ramps of ``length`` samples, built once per device."""
+        key = (length, str(device))
+        windows = self._crossfade_window_cache.get(key)
+        if windows is None:
+            windows = (
+                torch.linspace(1, 0, length, device=device).view(1, 1, -1),
+                torch.linspace(0, 1, length, device=device).view(1, 1, -1),
+            )
+            self._crossfade_window_cache[key] = windows
+        return windows
+
+    def _iter_overlap_vocoder(self, concatenated_mels):
+        """
+        Runs the vocoder over overlapping mel windows and yields ``(start_sample, wav)``
+        at 44.1kHz as soon as each window is final. ``wav`` is (C_audio, Samples).
+        The last ``crossfade_len_audio`` samples are held back until the next window
+        has been crossfaded into them, and flushed at the end.
+
+        Nothing is concatenated: the crossfade is written in place into the head of the new
+        window and the yielded chunks are views of the vocoder outputs, so every sample is
+        copied at most once whatever the song length.
+        """
+        VOCODER_AUDIO_SAMPLES_PER_MEL_FRAME = 512
+
         # --- Vocoder Parameters ---
         # vocoder_win_len_audio: Audio samples per vocoder processing window
         vocoder_win_len_audio = 512 * 512 # Example: 262144 samples
@@ -180,177 +373,171 @@ class MusicDCAE(ModelMixin, ConfigMixin, FromOriginalModelMixin):
         vocoder_input_mel_frames_per_block = vocoder_win_len_audio // VOCODER_AUDIO_SAMPLES_PER_MEL_FRAME
         
         crossfade_len_audio = 128 # Audio samples for crossfading vocoder outputs
-        cf_win_tail = torch.linspace(1, 0, crossfade_len_audio, device=self.device).unsqueeze(0).unsqueeze(0)
-        cf_win_head = torch.linspace(0, 1, crossfade_len_audio, device=self.device).unsqueeze(0).unsqueeze(0)
-
-        for latent_idx, latent_item in enumerate(latents):
-            latent_item = latent_item.to(self.device)
-            current_latent = (latent_item / self.scale_factor + self.shift_factor).unsqueeze(0) # (1, C, H, W_latent)
-            latent_len = current_latent.shape[3]
-
-            # 1. DCAE: Latent to Mel Spectrogram (Overlapped)
-            mels_segments = []
-            if latent_len == 0:
-                pass # No mel segments to generate
-            else:
-                # Determine anchor points for DCAE windows
-                # An anchor marks a reference point for a window slice.
-                # Window slice: current_latent[..., anchor - offset : anchor - offset + win_len]
-                # First anchor ensures window starts at 0. Last anchor ensures tail is covered.
-                dcae_anchors = list(range(dcae_anchor_offset, latent_len - dcae_anchor_offset, dcae_anchor_hop))
-                if not dcae_anchors: # If latent is too short for the range, use one anchor
-                    dcae_anchors = [dcae_anchor_offset]
-                
-                for i, anchor in enumerate(dcae_anchors):
-                    win_start_idx = max(0, anchor - dcae_anchor_offset)
-                    win_end_idx = min(latent_len, win_start_idx + dcae_win_len_latent)
-                    
-                    dcae_input_segment = current_latent[:, :, :, win_start_idx:win_end_idx]
-                    if dcae_input_segment.shape[3] == 0: continue
-
-                    mel_output_full = self.dcae.decoder(dcae_input_segment) # (1, C, H_mel, W_mel_fixed_from_dcae)
-
-                    is_first = (i == 0)
-                    is_last = (i == len(dcae_anchors) - 1)
-
-                    if is_first and is_last: # Only one segment
-                        # Use mel corresponding to actual input latent length
-                        true_mel_content_len = dcae_input_segment.shape[3] * DCAE_LATENT_TO_MEL_STRIDE
-                        mel_to_keep = mel_output_full[:, :, :, :min(true_mel_content_len, mel_output_full.shape[3])]
-                    elif is_first: # First segment, trim end overlap
-                        mel_to_keep = mel_output_full[:, :, :, :-dcae_mel_overlap_len]
-                    elif is_last: # Last segment, trim start overlap
-                        # And ensure we only take content relevant to the (potentially partial) last latent window
-                        # The mel_output_full is fixed length. The useful part starts after overlap.
-                        # The length of the useful part depends on how much of dcae_input_segment was actual content.
-                        # For simplicity in overlap-add, typically trim fixed overlap.
-                        # If dcae_input_segment was shorter than dcae_win_len_latent, mel_output_full might contain padding effects.
-                        # Standard OLA keeps the corresponding tail.
-                        mel_to_keep = mel_output_full[:, :, :, dcae_mel_overlap_len:]
-                    else: # Middle segment, trim both overlaps
-                        mel_to_keep = mel_output_full[:, :, :, dcae_mel_overlap_len:-dcae_mel_overlap_len]
-                    
-                    if mel_to_keep.shape[3] > 0:
-                        mels_segments.append(mel_to_keep)
+        cf_win_tail, cf_win_head = self._crossfade_windows(crossfade_len_audio, self.device)
+
+        mel_total_frames = concatenated_mels.shape[3]
+        if mel_total_frames == 0:
+            return
+
+        # Initial vocoder window
+        # Vocoder expects (C_mel, H_mel, W_mel_block)
+        mel_block = concatenated_mels[0, :, :, :vocoder_input_mel_frames_per_block].to(self.device)
+        
+        # Pad mel_block if it's shorter than vocoder_input_mel_frames_per_block (e.g. very short audio)
+        if 0 < mel_block.shape[2] < vocoder_input_mel_frames_per_block:
+            pad_len = vocoder_input_mel_frames_per_block - mel_block.shape[2]
+            mel_block = torch.nn.functional.pad(mel_block, (0, pad_len), mode='constant', value=0) # Pad last dim
+        
+        current_audio_output = self.vocoder.decode(mel_block) # (C_audio, 1, Samples)
+        current_audio_output = current_audio_output[:, :, :-vocoder_overlap_len_audio] # Remove end overlap
+
+        # Only the not yet emitted tail (a view into the last window) is kept around
+        emitted_samples = 0
+        ready_len = current_audio_output.shape[2] - crossfade_len_audio
+        if ready_len > 0:
+            yield emitted_samples, current_audio_output[:, :, :ready_len].squeeze(1)
+            emitted_samples += ready_len
+            current_audio_output = current_audio_output[:, :, ready_len:]
+
+        # p_audio_samples tracks the start of the *next* audio segment to generate (in conceptual total audio samples)
+        p_audio_samples = vocoder_hop_len_audio 
+        conceptual_total_audio_len_native_sr = mel_total_frames * VOCODER_AUDIO_SAMPLES_PER_MEL_FRAME
+        
+        # The loop for subsequent windows
+        while p_audio_samples < conceptual_total_audio_len_native_sr:
+            mel_frame_start = p_audio_samples // VOCODER_AUDIO_SAMPLES_PER_MEL_FRAME
+            mel_frame_end = mel_frame_start + vocoder_input_mel_frames_per_block
             
-            if not mels_segments:
-                num_mel_channels = current_latent.shape[1]
-                mel_height = self.dcae.decoder_output_mel_height
-                concatenated_mels = torch.empty(
-                    (1, num_mel_channels, mel_height, 0),
-                    device=current_latent.device, dtype=current_latent.dtype
+            if mel_frame_start >= mel_total_frames: break # No more mel frames
+
+            mel_block = concatenated_mels[0, :, :, mel_frame_start:min(mel_frame_end, mel_total_frames)].to(self.device)
+            
+            if mel_block.shape[2] == 0: break # Should not happen if mel_frame_start is valid
+
+            # Pad if current mel_block is too short (end of sequence)
+            if mel_block.shape[2] < vocoder_input_mel_frames_per_block:
+                pad_len = vocoder_input_mel_frames_per_block - mel_block.shape[2]
+                mel_block = torch.nn.functional.pad(mel_block, (0, pad_len), mode='constant', value=0)
+
+            new_audio_win = self.vocoder.decode(mel_block) # (C_audio, 1, Samples)
+
+            # Crossfade the held back tail into the head of the new window, in place
+            # Determine actual crossfade length based on available audio
+            actual_cf_len = min(crossfade_len_audio, current_audio_output.shape[2], new_audio_win.shape[2] - (vocoder_overlap_len_audio - crossfade_len_audio))
+            segment_start = vocoder_overlap_len_audio
+            if actual_cf_len > 0: # Ensure valid slice lengths for crossfade
+                tail_part = current_audio_output[:, :, -actual_cf_len:]
+                head_part = new_audio_win[:, :, vocoder_overlap_len_audio - actual_cf_len : vocoder_overlap_len_audio]
+                head_part.copy_(
+                    tail_part * cf_win_tail[:, :, :actual_cf_len]
+                    + head_part * cf_win_head[:, :, :actual_cf_len]
                 )
+                segment_start -= actual_cf_len
+                # the rest of the held back tail (if the crossfade was shortened) goes out first
+                leftover = current_audio_output[:, :, :-actual_cf_len]
+            else:
+                leftover = current_audio_output
+            if leftover.shape[2] > 0:
+                yield emitted_samples, leftover.squeeze(1)
+                emitted_samples += leftover.shape[2]
+
+            # Non-overlapping part of new_audio_win, starting with the crossfade
+            is_final_append = (p_audio_samples + vocoder_hop_len_audio >= conceptual_total_audio_len_native_sr)
+            if is_final_append:
+                segment = new_audio_win[:, :, segment_start:]
             else:
-                concatenated_mels = torch.cat(mels_segments, dim=3)
+                segment = new_audio_win[:, :, segment_start:-vocoder_overlap_len_audio]
 
-            # Denormalize mels
-            concatenated_mels = concatenated_mels * 0.5 + 0.5
-            concatenated_mels = concatenated_mels * (self.max_mel_value - self.min_mel_value) + self.min_mel_value
+            ready_len = segment.shape[2] - crossfade_len_audio
+            if ready_len > 0:
+                yield emitted_samples, segment[:, :, :ready_len].squeeze(1)
+                emitted_samples += ready_len
+                current_audio_output = segment[:, :, ready_len:]
+            else:
+                current_audio_output = segment
             
-            mel_total_frames = concatenated_mels.shape[3]
+            p_audio_samples += vocoder_hop_len_audio
 
-            # 2. Vocoder: Mel Spectrogram to Waveform (Overlapped)
-            if mel_total_frames == 0:
-                # Assuming mono or stereo output based on mel channels (typically mono for vocoder from single mel)
-                num_audio_channels = 1 # Or determine from vocoder capabilities / mel channels
-                final_wav = torch.zeros((num_audio_channels, 0), device=self.device, dtype=torch.float32)
-            else:
-                # Initial vocoder window
-                # Vocoder expects (C_mel, H_mel, W_mel_block)
-                mel_block = concatenated_mels[0, :, :, :vocoder_input_mel_frames_per_block].to(self.device)
-                
-                # Pad mel_block if it's shorter than vocoder_input_mel_frames_per_block (e.g. very short audio)
-                if 0 < mel_block.shape[2] < vocoder_input_mel_frames_per_block:
-                    pad_len = vocoder_input_mel_frames_per_block - mel_block.shape[2]
-                    mel_block = torch.nn.functional.pad(mel_block, (0, pad_len), mode='constant', value=0) # Pad last dim
-                
-                current_audio_output = self.vocoder.decode(mel_block) # (C_audio, 1, Samples)
-                current_audio_output = current_audio_output[:, :, :-vocoder_overlap_len_audio] # Remove end overlap
+        # Flush the held back tail
+        if current_audio_output.shape[2] > 0:
+            yield emitted_samples, current_audio_output.squeeze(1)
 
-                # p_audio_samples tracks the start of the *next* audio segment to generate (in conceptual total audio samples)
-                p_audio_samples = vocoder_hop_len_audio 
-                conceptual_total_audio_len_native_sr = mel_total_frames * VOCODER_AUDIO_SAMPLES_PER_MEL_FRAME
-                
-                pbar_total = 1 + max(0, (conceptual_total_audio_len_native_sr - (vocoder_win_len_audio - vocoder_overlap_len_audio))) // vocoder_hop_len_audio
-                
-                # Use tqdm if you want a progress bar for the vocoder part
-                # with tqdm(total=pbar_total, desc=f"Vocoder {latent_idx+1}/{len(latents)}", leave=False) as pbar:
-                # pbar.update(1) # For initial window
-                # The loop for subsequent windows
-                while p_audio_samples < conceptual_total_audio_len_native_sr:
-                    mel_frame_start = p_audio_samples // VOCODER_AUDIO_SAMPLES_PER_MEL_FRAME
-                    mel_frame_end = mel_frame_start + vocoder_input_mel_frames_per_block
-                    
-                    if mel_frame_start >= mel_total_frames: break # No more mel frames
-
-                    mel_block = concatenated_mels[0, :, :, mel_frame_start:min(mel_frame_end, mel_total_frames)].to(self.device)
-                    
-                    if mel_block.shape[2] == 0: break # Should not happen if mel_frame_start is valid
-
-                    # Pad if current mel_block is too short (end of sequence)
-                    if mel_block.shape[2] < vocoder_input_mel_frames_per_block:
-                        pad_len = vocoder_input_mel_frames_per_block - mel_block.shape[2]
-                        mel_block = torch.nn.functional.pad(mel_block, (0, pad_len), mode='constant', value=0)
-
-                    new_audio_win = self.vocoder.decode(mel_block) # (C_audio, 1, Samples)
-
-                    # Crossfade
-                    # Determine actual crossfade length based on available audio
-                    actual_cf_len = min(crossfade_len_audio, current_audio_output.shape[2], new_audio_win.shape[2] - (vocoder_overlap_len_audio - crossfade_len_audio))
-                    if actual_cf_len > 0: # Ensure valid slice lengths for crossfade
-                        tail_part = current_audio_output[:, :, -actual_cf_len:]
-                        head_part = new_audio_win[:, :, vocoder_overlap_len_audio - actual_cf_len : vocoder_overlap_len_audio]
-                        
-                        crossfaded_segment = tail_part * cf_win_tail[:,:,:actual_cf_len] + \
-                                             head_part * cf_win_head[:,:,:actual_cf_len]
-                        
-                        current_audio_output = torch.cat([current_audio_output[:, :, :-actual_cf_len], crossfaded_segment], dim=2)
-
-                    # Append non-overlapping part of new_audio_win
-                    is_final_append = (p_audio_samples + vocoder_hop_len_audio >= conceptual_total_audio_len_native_sr)
-                    if is_final_append:
-                        segment_to_append = new_audio_win[:, :, vocoder_overlap_len_audio:]
-                    else:
-                        segment_to_append = new_audio_win[:, :, vocoder_overlap_len_audio:-vocoder_overlap_len_audio]
-                    
-                    current_audio_output = torch.cat([current_audio_output, segment_to_append], dim=2)
-                    
-                    p_audio_samples += vocoder_hop_len_audio
-                    # pbar.update(1) # if using tqdm
-                
-                final_wav = current_audio_output.squeeze(1) # (C_audio, Samples)
+    def num_output_samples(self, latent_length, sr=None):
+        """Number of waveform samples decoded from ``latent_length`` latent frames at ``sr``."""
+        MODEL_INTERNAL_SR = 44100
+        final_output_sr = sr if sr is not None else MODEL_INTERNAL_SR
+        return int(latent_length * self.time_dimention_multiple * 512 * final_output_sr / MODEL_INTERNAL_SR)
 
-            # 3. Resampling (if necessary)
-            if final_output_sr != MODEL_INTERNAL_SR and final_wav.numel() > 0:
-                # Resample expects CPU tensor if using torchaudio.transforms on older versions or for some backends
-                resampler = torchaudio.transforms.Resample(
-                    MODEL_INTERNAL_SR, final_output_sr, dtype=final_wav.dtype
-                )
-                final_wav = resampler(final_wav.cpu()).to(self.device) # Move back to device if needed later
-            
-            pred_wavs.append(final_wav)
-
-        # 4. Final Truncation
-        processed_pred_wavs = []
-        for i, wav in enumerate(pred_wavs):
-            # Calculate expected length based on original latent, at the FINAL output sample rate
-            _num_latent_frames = latents[i].shape[-1] # Use original latent item for shape
-            _num_mel_frames = _num_latent_frames * DCAE_LATENT_TO_MEL_STRIDE
-            _conceptual_native_audio_len = _num_mel_frames * VOCODER_AUDIO_SAMPLES_PER_MEL_FRAME
-            max_possible_len = int(_conceptual_native_audio_len * final_output_sr / MODEL_INTERNAL_SR)
-
-            current_wav_len = wav.shape[1]
-            
-            if audio_lengths is not None:
-                # User-provided length is the primary target, capped by actual and max possible
-                target_len = min(audio_lengths[i], current_wav_len, max_possible_len)
+    @torch.no_grad()
+    def decode_overlap_stream(self, latent, sr=None):
+        """
+        Decodes a single latent (C, H, W_latent) with the overlapped DCAE and Vocoder,
+        yielding ``(start_sample, wav_chunk)`` pairs as each vocoder window completes.
+        Chunks are float32 CPU tensors of shape (C_audio, Samples) at ``sr``; concatenated
+        they equal the ``decode_overlap`` output for the same latent.
+        """
+        MODEL_INTERNAL_SR = 44100
+        final_output_sr = sr if sr is not None else MODEL_INTERNAL_SR
+
+        latent = latent.to(self.device)
+        current_latent = (latent / self.scale_factor + self.shift_factor).unsqueeze(0) # (1, C, H, W_latent)
+        concatenated_mels = self._decode_overlap_mels(current_latent)
+
+        max_possible_len = self.num_output_samples(latent.shape[-1], sr=final_output_sr)
+        resampler = None
+        if final_output_sr != MODEL_INTERNAL_SR:
+            resampler = StreamingResampler(MODEL_INTERNAL_SR, final_output_sr)
+
+        emitted_samples = 0
+        for _, wav_chunk in self._iter_overlap_vocoder(concatenated_mels):
+            wav_chunk = wav_chunk.cpu().float()
+            if resampler is not None:
+                wav_chunk = resampler.process(wav_chunk)
+            wav_chunk = wav_chunk[:, : max_possible_len - emitted_samples]
+            if wav_chunk.shape[1] > 0:
+                yield emitted_samples, wav_chunk
+                emitted_samples += wav_chunk.shape[1]
+            if emitted_samples >= max_possible_len:
+                return
+
+        wav_chunk = resampler.flush() if resampler is not None else None
+        if wav_chunk is not None:
+            wav_chunk = wav_chunk[:, : max_possible_len - emitted_samples]
+            if wav_chunk.shape[1] > 0:
+                yield emitted_samples, wav_chunk
+
+    @torch.no_grad()
+    def decode_overlap(self, latents, audio_lengths=None, sr=None):
+        """
+        Decodes latents into waveforms using an overlapped DCAE and Vocoder.
+        """
+        print("Using Overlapped DCAE and Vocoder")
+
+        MODEL_INTERNAL_SR = 44100
+        final_output_sr = sr if sr is not None else MODEL_INTERNAL_SR
+
+        pred_wavs = []
+        for i, latent_item in enumerate(latents):
+            # chunks are copied straight into a buffer of the final length
+            wav = None
+            filled = 0
+            for start_sample, wav_chunk in self.decode_overlap_stream(latent_item, sr=final_output_sr):
+                if wav is None:
+                    wav = wav_chunk.new_empty(
+                        (wav_chunk.shape[0], self.num_output_samples(latent_item.shape[-1], sr=final_output_sr))
+                    )
+                wav[:, start_sample:start_sample + wav_chunk.shape[1]] = wav_chunk
+                filled = start_sample + wav_chunk.shape[1]
+            if wav is None:
+                wav = torch.zeros((1, 0), dtype=torch.float32)
             else:
-                # No user length, use max possible capped by actual
-                target_len = min(max_possible_len, current_wav_len)
-            
-            processed_pred_wavs.append(wav[:, :max(0, target_len)].cpu()) # Ensure length is non-negative
+                wav = wav[:, :filled]
+
+            if audio_lengths is not None:
+                wav = wav[:, :max(0, audio_lengths[i])]
+            pred_wavs.append(wav)
 
-        return final_output_sr, processed_pred_wavs
+        return final_output_sr, pred_wavs
 
     def forward(self, audios, audio_lengths=None, sr=None):
         latents, latent_lengths = self.encode(
@@ -16,7 +16,11 @@ from loguru import logger
 from tqdm import tqdm
 import json
 import math
+import contextlib
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from huggingface_hub import snapshot_download
+from huggingface_hub.utils import LocalEntryNotFoundError
 
 # from diffusers.pipelines.pipeline_utils import DiffusionPipeline
 from acestep.schedulers.scheduling_flow_match_euler_discrete import (
@@ -28,16 +32,54 @@ from acestep.schedulers.scheduling_flow_match_heun_discrete import (
 from acestep.schedulers.scheduling_flow_match_pingpong import (
     FlowMatchPingPongScheduler,
 )
+from acestep.schedulers.scheduling_flow_match_dpmsolver_multistep import (
+    FlowMatchDPMSolverMultistepScheduler,
+)
+from acestep.schedulers.scheduling_flow_match_adaptive import (
+    FlowMatchAdaptiveScheduler,
+)
 from diffusers.pipelines.stable_diffusion_3.pipeline_stable_diffusion_3 import (
     retrieve_timesteps,
 )
 from diffusers.utils.torch_utils import randn_tensor
 from diffusers.utils.peft_utils import set_weights_and_activate_adapters
-from transformers import UMT5EncoderModel, AutoTokenizer
+from transformers import UMT5Config, UMT5EncoderModel, AutoTokenizer
 
 from acestep.language_segmentation import LangSegment, language_filters
 from acestep.music_dcae.music_dcae_pipeline import MusicDCAE
-from acestep.models.ace_step_transformer import ACEStepTransformer2DModel
+from acestep.weight_bundles import find_bundles, load_bundle, prefetch_files
+from acestep.quantized_export import (
+    check_manifest,
+    default_quantized_dir,
+    export_quantized_checkpoint,
+    load_quantized_component,
+    read_manifest,
+)
+from acestep.cpu_tuning import (
+    DEFAULT_CPU_TUNING_FILE,
+    apply_cpu_settings,
+    autotune_cpu,
+    cpu_autocast,
+    host_key,
+    load_cpu_settings,
+    save_cpu_settings,
+)
+from acestep.profiling import PipelineProfiler, resolve_profile_dir
+from acestep.cpu_quantization import (
+    int8_cache_path,
+    load_int8_component,
+    quantize_dynamic_int8,
+    save_int8_component,
+)
+from acestep.models.ace_step_transformer import (
+    ACEStepTransformer2DModel,
+    StepFeatureCache,
+)
+from acestep.models.customer_attention_processor import CrossAttentionKVCache
+from acestep.models.text_encoder_query_scale import (
+    install_query_scale,
+    query_temperature,
+)
 from acestep.models.lyrics_utils.lyric_tokenizer import VoiceBpeTokenizer
 from acestep.apg_guidance import (
     apg_forward,
@@ -47,7 +89,19 @@ from acestep.apg_guidance import (
     cfg_double_condition_forward,
 )
 import torchaudio
-from .cpu_offload import cpu_offload
+from .cpu_offload import CpuOffloader, cpu_offload
+from .compile_cache import (
+    DEFAULT_COMPILE_CACHE_DIR,
+    DEFAULT_WARMUP_DURATIONS,
+    compile_cache_key,
+    compile_counters,
+    compile_report,
+    compile_transformer_blocks,
+    configure_compile_cache,
+    raise_cache_size_limit,
+    save_compile_artifacts,
+    warmup_cache_size_limit,
+)
 
 
 torch.backends.cudnn.benchmark = False
@@ -86,8 +140,50 @@ def ensure_directory_exists(directory):
         os.makedirs(directory)
 
 
+def split_lyrics_for_windows(lyrics, num_windows):
+    """
+    Splits ``lyrics`` line-wise into ``num_windows`` consecutive parts of similar length for
+    long-form generation. Structure tags stay with the lines after them, and a part that starts
+    in the middle of a section repeats that section's tag.
+    """
+    groups = []
+    pending = []
+    for line in lyrics.split("\n"):
+        line = line.strip()
+        if not line:
+            continue
+        pending.append(line)
+        if not structure_pattern.fullmatch(line):
+            groups.append(pending)
+            pending = []
+    if pending:
+        if groups:
+            groups[-1].extend(pending)
+        else:
+            groups.append(pending)
+
+    parts = [[] for _ in range(num_windows)]
+    for j, group in enumerate(groups):
+        parts[j * num_windows // len(groups)].extend(group)
+
+    section_tag = None
+    for part in parts:
+        if part and section_tag is not None and not structure_pattern.fullmatch(part[0]):
+            part.insert(0, section_tag)
+        for line in part:
+            if structure_pattern.fullmatch(line):
+                section_tag = line
+    return ["\n".join(part) for part in parts]
+
+
+# what ACEStepPipeline.__call__ returns per generated item, see its output_mode argument
+OUTPUT_MODES = ("path", "tensor", "pcm16_bytes", "callback")
+
+
 REPO_ID = "ACE-Step/ACE-Step-v1-3.5B"
-REPO_ID_QUANT = REPO_ID + "-q4-K-M" # ??? update this i guess
+# text2music arguments whose __call__ default differs from the text2music_diffusion_process one,
+# the compile warm-up uses those of __call__
+WARMUP_CALL_DEFAULTS = {"guidance_interval_decay": 0.0, "use_erg_lyric": True, "use_erg_diffusion": True}
 
 
 # class ACEStepPipeline(DiffusionPipeline):
@@ -103,6 +199,15 @@ class ACEStepPipeline:
         cpu_offload=False,
         quantized=False,
         overlapped_decode=False,
+        weight_bundles=True,
+        parallel_load=True,
+        compile_cache_dir=None,
+        duration_buckets=None,
+        cpu_int8=False,
+        quantized_dir=None,
+        cpu_autotune=False,
+        cpu_tuning_file=None,
+        profile=None,
         **kwargs,
     ):
         if not checkpoint_dir:
@@ -135,9 +240,44 @@ class ACEStepPipeline:
         self.device = device
         self.loaded = False
         self.torch_compile = torch_compile
+        # compiled kernels persist under <compile_cache_dir>/<model hash, torch version, dtype, device>
+        self.compile_cache_root = compile_cache_dir or DEFAULT_COMPILE_CACHE_DIR
+        self.compile_cache_dir = None
+        self.last_compile_report = {}
+        # text2music pads the latents up to the next of these durations (seconds) and masks the
+        # padding, so compiled graphs see a few fixed shapes; None or empty keeps the exact length
+        self.duration_buckets = sorted(float(d) for d in duration_buckets) if duration_buckets else []
         self.cpu_offload = cpu_offload
         self.quantized = quantized
+        # export of acestep.quantized_export, default <checkpoint_dir>/quantized
+        self.quantized_dir = quantized_dir
+        # per-host thread count / autocast / memory format on CPU, see acestep.cpu_tuning;
+        # saved settings are always applied, cpu_autotune measures them when there are none
+        self.cpu_autotune = cpu_autotune
+        self.cpu_tuning_file = cpu_tuning_file or DEFAULT_CPU_TUNING_FILE
+        self.cpu_autocast_dtype = None
+        # Chrome traces of every call, see acestep.profiling; None reads ACE_PROFILE
+        profile_dir = resolve_profile_dir(profile)
+        self.profiler = PipelineProfiler(profile_dir, device) if profile_dir else None
+        self.last_profile_trace = None
+        # dynamic int8 Linear layers in the transformer and UMT5, see acestep.cpu_quantization
+        self.cpu_int8 = cpu_int8 and device.type == "cpu"
+        if cpu_int8 and not self.cpu_int8:
+            logger.warning(f"cpu_int8 only applies to CPU inference, ignored on {device}")
+        if self.cpu_int8:
+            # the int8 kernels take float32 activations and inductor does not lower them
+            self.dtype = torch.float32
+            self.torch_compile = False
         self.overlapped_decode = overlapped_decode
+        # load pre-cast safetensors bundles when exported, see acestep.weight_bundles
+        self.weight_bundles = weight_bundles
+        # overlap disk reads and the tokenizers with the model loads in load_checkpoint
+        self.parallel_load = parallel_load
+        # counters of the last text2music_diffusion_process call
+        self.last_diffusion_stats = {}
+        # single worker for background_write, files are written in submission order
+        self._write_executor = None
+        self._pending_writes = []
 
     def cleanup_memory(self):
         """Clean up GPU and CPU memory to prevent VRAM overflow during multiple generations."""
@@ -154,7 +294,13 @@ class ACEStepPipeline:
         import gc
         gc.collect()
 
-    def get_checkpoint_path(self, checkpoint_dir, repo):
+    @staticmethod
+    def get_checkpoint_path(checkpoint_dir, repo, local_files_only=False):
+        """
+        ``checkpoint_dir`` if it holds the components, else the snapshot of ``repo`` in the Hugging Face
+        cache at ``checkpoint_dir``. With ``local_files_only`` nothing is downloaded and a missing
+        snapshot raises LocalEntryNotFoundError.
+        """
         checkpoint_dir_models = None
         
         if checkpoint_dir is not None:
@@ -171,7 +317,10 @@ class ACEStepPipeline:
                 checkpoint_dir_models = checkpoint_dir
         
         if checkpoint_dir_models is None:
-            if checkpoint_dir is None:
+            if local_files_only:
+                checkpoint_dir_models = snapshot_download(repo, cache_dir=checkpoint_dir, local_files_only=True)
+                logger.info(f"Load models from: {checkpoint_dir_models}")
+            elif checkpoint_dir is None:
                 logger.info(f"Download models from Hugging Face: {repo}")
                 checkpoint_dir_models = snapshot_download(repo)
             else:
@@ -179,16 +328,78 @@ class ACEStepPipeline:
                 checkpoint_dir_models = snapshot_download(repo, cache_dir=checkpoint_dir)
         return checkpoint_dir_models
 
+    def _compile_transformer(self, durations=DEFAULT_WARMUP_DURATIONS, batch_sizes=(1,)):
+        cache_key = compile_cache_key(self.ace_step_transformer, self.dtype, self.device)
+        self.compile_cache_dir = configure_compile_cache(
+            os.path.join(self.compile_cache_root, cache_key),
+            cache_size_limit=warmup_cache_size_limit(durations, batch_sizes, erg_query_scales=True),
+        )
+        # the generation loop calls decode(), which the wrapper below does not compile
+        compile_transformer_blocks(self.ace_step_transformer)
+        self.ace_step_transformer = torch.compile(self.ace_step_transformer)
+
+    @staticmethod
+    def load_lyric_frontend():
+        lang_segment = LangSegment()
+        lang_segment.setfilters(language_filters.default)
+        return lang_segment, VoiceBpeTokenizer()
+
+    def export_quantized(self, checkpoint_dir=None, scheme="int4wo"):
+        """
+        Writes the quantized export of acestep.quantized_export for the dtype and device of this
+        pipeline, which load_quantized_checkpoint then accepts. Returns the export directory.
+        """
+        checkpoint_dir = self.get_checkpoint_path(checkpoint_dir or self.checkpoint_dir, REPO_ID)
+        return export_quantized_checkpoint(
+            checkpoint_dir, self.quantized_dir, scheme=scheme, dtype=self.dtype, device=self.device
+        )
+
     def load_checkpoint(self, checkpoint_dir=None, export_quantized_weights=False):
         checkpoint_dir = self.get_checkpoint_path(checkpoint_dir, REPO_ID)
+        if export_quantized_weights:
+            # kept for old callers, the export is python -m acestep.quantized_export
+            self.export_quantized(checkpoint_dir)
         dcae_checkpoint_path = os.path.join(checkpoint_dir, "music_dcae_f8c8")
         vocoder_checkpoint_path = os.path.join(checkpoint_dir, "music_vocoder")
         ace_step_checkpoint_path = os.path.join(checkpoint_dir, "ace_step_transformer")
         text_encoder_checkpoint_path = os.path.join(checkpoint_dir, "umt5-base")
 
-        self.ace_step_transformer = ACEStepTransformer2DModel.from_pretrained(
-            ace_step_checkpoint_path, torch_dtype=self.dtype
-        )
+        bundles = find_bundles(checkpoint_dir, self.dtype) if self.weight_bundles else None
+        if bundles is not None:
+            logger.info(f"Load weight bundles from: {os.path.dirname(bundles['ace_step_transformer'])}")
+
+        # The models themselves are built one after another: the empty-weight contexts of
+        # accelerate / transformers patch torch.nn.Module globally and are not thread-safe.
+        # The workers read the weight files of the later components into the page cache while
+        # the earlier ones deserialize, and load the tokenizers, which touch no torch modules.
+        executor = ThreadPoolExecutor(max_workers=4 if self.parallel_load else 1)
+        if self.parallel_load:
+            if bundles is not None:
+                prefetch_paths = [bundles[name] for name in ("music_dcae", "music_vocoder", "text_encoder")]
+            else:
+                prefetch_paths = [dcae_checkpoint_path, vocoder_checkpoint_path, text_encoder_checkpoint_path]
+            if self.cpu_int8 and os.path.isfile(int8_cache_path(checkpoint_dir, "text_encoder")):
+                prefetch_paths[-1] = int8_cache_path(checkpoint_dir, "text_encoder")
+            for path in prefetch_paths:
+                executor.submit(prefetch_files, path)
+        text_tokenizer_future = executor.submit(AutoTokenizer.from_pretrained, text_encoder_checkpoint_path)
+        lyric_frontend_future = executor.submit(self.load_lyric_frontend)
+
+        int8_transformer = None
+        if self.cpu_int8:
+            int8_transformer = load_int8_component(
+                "ace_step_transformer",
+                ACEStepTransformer2DModel.load_config(ace_step_checkpoint_path),
+                int8_cache_path(checkpoint_dir, "ace_step_transformer"),
+            )
+        if int8_transformer is not None:
+            self.ace_step_transformer = int8_transformer
+        elif bundles is not None:
+            self.ace_step_transformer = load_bundle(bundles["ace_step_transformer"])
+        else:
+            self.ace_step_transformer = ACEStepTransformer2DModel.from_pretrained(
+                ace_step_checkpoint_path, torch_dtype=self.dtype
+            )
         # self.ace_step_transformer.to(self.device).eval().to(self.dtype)
         if self.cpu_offload:
             self.ace_step_transformer = (
@@ -198,13 +409,22 @@ class ACEStepPipeline:
             self.ace_step_transformer = (
                 self.ace_step_transformer.to(self.device).eval().to(self.dtype)
             )
+        if self.cpu_int8 and int8_transformer is None:
+            quantize_dynamic_int8(self.ace_step_transformer)
+            save_int8_component(self.ace_step_transformer, int8_cache_path(checkpoint_dir, "ace_step_transformer"))
         if self.torch_compile:
-            self.ace_step_transformer = torch.compile(self.ace_step_transformer)
+            self._compile_transformer()
 
-        self.music_dcae = MusicDCAE(
-            dcae_checkpoint_path=dcae_checkpoint_path,
-            vocoder_checkpoint_path=vocoder_checkpoint_path,
-        )
+        if bundles is not None:
+            self.music_dcae = MusicDCAE.from_modules(
+                load_bundle(bundles["music_dcae"]),
+                load_bundle(bundles["music_vocoder"]),
+            )
+        else:
+            self.music_dcae = MusicDCAE(
+                dcae_checkpoint_path=dcae_checkpoint_path,
+                vocoder_checkpoint_path=vocoder_checkpoint_path,
+            )
         # self.music_dcae.to(self.device).eval().to(self.dtype)
         if self.cpu_offload:  # might be redundant
             self.music_dcae = self.music_dcae.to("cpu").eval().to(self.dtype)
@@ -213,119 +433,258 @@ class ACEStepPipeline:
         if self.torch_compile:
             self.music_dcae = torch.compile(self.music_dcae)
 
-        lang_segment = LangSegment()
-        lang_segment.setfilters(language_filters.default)
-        self.lang_segment = lang_segment
-        self.lyric_tokenizer = VoiceBpeTokenizer()
+        self.lang_segment, self.lyric_tokenizer = lyric_frontend_future.result()
 
-        text_encoder_model = UMT5EncoderModel.from_pretrained(
-            text_encoder_checkpoint_path, torch_dtype=self.dtype
-        ).eval()
+        int8_text_encoder = None
+        if self.cpu_int8:
+            int8_text_encoder = load_int8_component(
+                "text_encoder",
+                UMT5Config.from_pretrained(text_encoder_checkpoint_path).to_dict(),
+                int8_cache_path(checkpoint_dir, "text_encoder"),
+            )
+        if int8_text_encoder is not None:
+            text_encoder_model = int8_text_encoder
+        elif bundles is not None:
+            text_encoder_model = load_bundle(bundles["text_encoder"])
+        else:
+            text_encoder_model = UMT5EncoderModel.from_pretrained(
+                text_encoder_checkpoint_path, torch_dtype=self.dtype
+            ).eval()
         # text_encoder_model = text_encoder_model.to(self.device).to(self.dtype)
         if self.cpu_offload:
             text_encoder_model = text_encoder_model.to("cpu").eval().to(self.dtype)
         else:
             text_encoder_model = text_encoder_model.to(self.device).eval().to(self.dtype)
         text_encoder_model.requires_grad_(False)
+        install_query_scale(text_encoder_model)
+        if self.cpu_int8 and int8_text_encoder is None:
+            # after install_query_scale, so the scaled query projections stay in float32
+            quantize_dynamic_int8(text_encoder_model)
+            save_int8_component(text_encoder_model, int8_cache_path(checkpoint_dir, "text_encoder"))
         self.text_encoder_model = text_encoder_model
         if self.torch_compile:
             self.text_encoder_model = torch.compile(self.text_encoder_model)
 
-        self.text_tokenizer = AutoTokenizer.from_pretrained(
-            text_encoder_checkpoint_path
-        )
+        self.text_tokenizer = text_tokenizer_future.result()
+        executor.shutdown(wait=True)
+        self.apply_cpu_tuning()
         self.loaded = True
 
-        # compile
-        if self.torch_compile:
-            if export_quantized_weights:
-                from torch.ao.quantization import (
-                    quantize_,
-                    Int4WeightOnlyConfig,
-                )
-
-                group_size = 128
-                use_hqq = True
-                quantize_(
-                    self.ace_step_transformer,
-                    Int4WeightOnlyConfig(group_size=group_size, use_hqq=use_hqq),
-                )
-                quantize_(
-                    self.text_encoder_model,
-                    Int4WeightOnlyConfig(group_size=group_size, use_hqq=use_hqq),
-                )
+    def find_quantized_export(self, checkpoint_dir=None):
+        """
+        Resolves ``checkpoint_dir`` like load_checkpoint, from local files only, and looks for a usable
+        export of acestep.quantized_export (default ``<resolved checkpoint>/quantized``). Returns the
+        checkpoint directory, the export directory, its manifest and the reason the export cannot be
+        loaded, None if it can.
+        """
+        checkpoint_dir = checkpoint_dir or self.checkpoint_dir
+        try:
+            checkpoint_dir = self.get_checkpoint_path(checkpoint_dir, REPO_ID, local_files_only=True)
+        except LocalEntryNotFoundError:
+            quantized_dir = self.quantized_dir or default_quantized_dir(checkpoint_dir)
+            return checkpoint_dir, quantized_dir, None, f"no local checkpoint in {checkpoint_dir}"
+        quantized_dir = self.quantized_dir or default_quantized_dir(checkpoint_dir)
+        manifest = read_manifest(quantized_dir)
+        reason = "no quantized export" if manifest is None else check_manifest(manifest, self.device, self.dtype)
+        missing = [
+            name for name in ("music_dcae_f8c8", "music_vocoder", "umt5-base")
+            if not os.path.isdir(os.path.join(checkpoint_dir, name))
+        ]
+        if reason is None and missing:
+            reason = f"{checkpoint_dir} lacks {', '.join(missing)}"
+        return checkpoint_dir, quantized_dir, manifest, reason
 
-                # save quantized weights
-                torch.save(
-                    self.ace_step_transformer.state_dict(),
-                    os.path.join(
-                        ace_step_checkpoint_path, "diffusion_pytorch_model_int4wo.bin"
-                    ),
-                )
-                print(
-                    "Quantized Weights Saved to: ",
-                    os.path.join(
-                        ace_step_checkpoint_path, "diffusion_pytorch_model_int4wo.bin"
-                    ),
-                )
-                torch.save(
-                    self.text_encoder_model.state_dict(),
-                    os.path.join(text_encoder_checkpoint_path, "pytorch_model_int4wo.bin"),
-                )
-                print(
-                    "Quantized Weights Saved to: ",
-                    os.path.join(text_encoder_checkpoint_path, "pytorch_model_int4wo.bin"),
+    def load_quantized_checkpoint(self, checkpoint_dir=None):
+        """
+        Loads the transformer and UMT5 from a local export of acestep.quantized_export and the DCAE,
+        the vocoder and the tokenizers from ``checkpoint_dir``, without network access. Falls back
+        to load_checkpoint when there is no usable export.
+        """
+        checkpoint_dir, quantized_dir, manifest, reason = self.find_quantized_export(checkpoint_dir)
+        if reason is None:
+            try:
+                ace_step_transformer = load_quantized_component(
+                    quantized_dir, manifest, "ace_step_transformer", self.device
                 )
+                text_encoder_model = load_quantized_component(quantized_dir, manifest, "text_encoder", self.device)
+            except Exception as e:
+                reason = f"loading failed: {e}"
+        if reason is not None:
+            logger.warning(f"Quantized checkpoint unavailable in {quantized_dir} ({reason}), loading the full one")
+            self.quantized = False
+            return self.load_checkpoint(checkpoint_dir)
+        logger.info(f"Load {manifest['scheme']} quantized weights from: {quantized_dir}")
+
+        # the quantized models stay on the device, CpuOffloader skips them
+        self.ace_step_transformer = ace_step_transformer
+        if self.torch_compile:
+            self._compile_transformer()
+        install_query_scale(text_encoder_model)
+        self.text_encoder_model = text_encoder_model
+        if self.torch_compile:
+            self.text_encoder_model = torch.compile(self.text_encoder_model)
 
-    def load_quantized_checkpoint(self, checkpoint_dir=None):
-        checkpoint_dir = self.get_checkpoint_path(checkpoint_dir, REPO_ID_QUANT)
         dcae_checkpoint_path = os.path.join(checkpoint_dir, "music_dcae_f8c8")
         vocoder_checkpoint_path = os.path.join(checkpoint_dir, "music_vocoder")
-        ace_step_checkpoint_path = os.path.join(checkpoint_dir, "ace_step_transformer")
-        text_encoder_checkpoint_path = os.path.join(checkpoint_dir, "umt5-base")
-
-        self.music_dcae = MusicDCAE(
-            dcae_checkpoint_path=dcae_checkpoint_path,
-            vocoder_checkpoint_path=vocoder_checkpoint_path,
-        )
+        bundles = find_bundles(checkpoint_dir, self.dtype) if self.weight_bundles else None
+        if bundles is not None:
+            self.music_dcae = MusicDCAE.from_modules(
+                load_bundle(bundles["music_dcae"]),
+                load_bundle(bundles["music_vocoder"]),
+            )
+        else:
+            self.music_dcae = MusicDCAE(
+                dcae_checkpoint_path=dcae_checkpoint_path,
+                vocoder_checkpoint_path=vocoder_checkpoint_path,
+            )
         if self.cpu_offload:
-            self.music_dcae.eval().to(self.dtype).to('cpu')  # FIXED: CPU for offload
+            self.music_dcae = self.music_dcae.to("cpu").eval().to(self.dtype)
         else:
-            self.music_dcae.eval().to(self.dtype).to(self.device)
-        self.music_dcae = torch.compile(self.music_dcae)
+            self.music_dcae = self.music_dcae.to(self.device).eval().to(self.dtype)
+        if self.torch_compile:
+            self.music_dcae = torch.compile(self.music_dcae)
 
-        self.ace_step_transformer = ACEStepTransformer2DModel.from_pretrained(ace_step_checkpoint_path)
-        self.ace_step_transformer.eval().to(self.dtype).to('cpu')
-        self.ace_step_transformer = torch.compile(self.ace_step_transformer)
-        self.ace_step_transformer.load_state_dict(
-            torch.load(
-                os.path.join(ace_step_checkpoint_path, "diffusion_pytorch_model_int4wo.bin"),
-                map_location='cpu' if self.cpu_offload else self.device,  # FIXED: CPU map for offload
-            ),assign=True
+        self.text_tokenizer = AutoTokenizer.from_pretrained(os.path.join(checkpoint_dir, "umt5-base"))
+        self.lang_segment, self.lyric_tokenizer = self.load_lyric_frontend()
+        self.apply_cpu_tuning()
+        self.loaded = True
+
+    def apply_cpu_tuning(self, retune=False):
+        """
+        Applies the CPU settings saved for this host and pipeline profile, tuning them first when
+        there are none and cpu_autotune is set (or ``retune``). Returns the settings or None.
+        """
+        if self.device.type != "cpu":
+            return None
+        key = host_key(self.dtype, "int8" if self.cpu_int8 else "")
+        settings = None if retune else load_cpu_settings(self.cpu_tuning_file, key)
+        if settings is None and (self.cpu_autotune or retune):
+            settings = autotune_cpu(self)
+            save_cpu_settings(self.cpu_tuning_file, key, settings)
+            logger.info(f"CPU settings saved to: {self.cpu_tuning_file}")
+        if settings is None:
+            return None
+        apply_cpu_settings(settings, self.music_dcae)
+        self.cpu_autocast_dtype = torch.bfloat16 if settings["autocast_bf16"] else None
+        return settings
+
+    def _run_compile_warmup(
+        self, durations, batch_sizes, encoder_lengths, infer_steps, use_erg_tag, generation_kwargs
+    ):
+        # a short generation rather than bare decode calls: the blocks then see the inputs of real
+        # steps, i.e. the empty and the filled cross-attention KV cache, the precomputed rotary tables
+        # and the ERG query scales, inside and outside the guidance interval
+        config = getattr(self.ace_step_transformer, "_orig_mod", self.ace_step_transformer).config
+        for duration in durations:
+            for batch_size in batch_sizes:
+                # two encoder lengths, so that dynamo also builds the graph with a dynamic text length
+                for encoder_length in encoder_lengths:
+                    text_length = encoder_length // 2
+                    lyric_length = encoder_length - text_length
+                    encoder_text_hidden_states = torch.randn(
+                        batch_size, text_length, config.text_embedding_dim, device=self.device, dtype=self.dtype
+                    )
+                    random_generators, _ = self.set_seeds(batch_size, [0] * batch_size)
+                    self.text2music_diffusion_process(
+                        duration=duration,
+                        encoder_text_hidden_states=encoder_text_hidden_states,
+                        text_attention_mask=torch.ones(batch_size, text_length, device=self.device, dtype=torch.long),
+                        speaker_embds=torch.zeros(
+                            batch_size, config.speaker_embedding_dim, device=self.device, dtype=self.dtype
+                        ),
+                        lyric_token_ids=torch.randint(
+                            0, config.lyric_encoder_vocab_size, (batch_size, lyric_length), device=self.device
+                        ),
+                        lyric_mask=torch.ones(batch_size, lyric_length, device=self.device, dtype=torch.long),
+                        random_generators=random_generators,
+                        infer_steps=infer_steps,
+                        encoder_text_hidden_states_null=(
+                            torch.randn_like(encoder_text_hidden_states) if use_erg_tag else None
+                        ),
+                        **generation_kwargs,
+                    )
+
+    @staticmethod
+    def guidance_batch_sizes(batch_size=1, batched_guidance=False, guidance_scale_text=0.0, guidance_scale_lyric=0.0):
+        """
+        Batch sizes the transformer runs at for these guidance settings: ``batch_size`` alone outside
+        the guidance interval, and with batched guidance cond, uncond and, with double-condition
+        guidance, the text-only branch stacked in one forward.
+        """
+        if not batched_guidance:
+            return (batch_size,)
+        num_passes = 3 if guidance_scale_text > 1.0 and guidance_scale_lyric > 1.0 else 2
+        return (batch_size, num_passes * batch_size)
+
+    @staticmethod
+    def duration_frame_length(duration):
+        return int(duration * 44100 / 512 / 8)
+
+    def bucket_frame_length(self, frame_length):
+        """Latent length of the smallest duration bucket holding ``frame_length`` frames."""
+        for duration in self.duration_buckets:
+            bucket_length = self.duration_frame_length(duration)
+            if bucket_length >= frame_length:
+                return bucket_length
+        return frame_length
+
+    def warmup_compile(
+        self,
+        durations=DEFAULT_WARMUP_DURATIONS,
+        batch_sizes=(1,),
+        encoder_lengths=(96, 192),
+        infer_steps=4,
+        use_erg_tag=True,
+        **generation_kwargs,
+    ):
+        """
+        Compiles the transformer blocks for the latent lengths of ``durations`` (seconds) up front, so
+        the first songs of those lengths do not pay for the compilation, and saves the artifacts to
+        the compile cache. Returns the compile report of the warm-up, empty without torch_compile.
+
+        The warm-up runs ``infer_steps`` steps of text2music for every duration and ``batch_size``.
+        ``use_erg_tag`` and ``generation_kwargs`` (guidance, ERG, batched_guidance, scheduler, ...)
+        must be those of the generations to warm up for, as given to __call__, and default to its
+        defaults: other settings build other graphs.
+        """
+        generation_kwargs = {**WARMUP_CALL_DEFAULTS, **generation_kwargs}
+        if not self.loaded:
+            if self.quantized:
+                self.load_quantized_checkpoint(self.checkpoint_dir)
+            else:
+                self.load_checkpoint(self.checkpoint_dir)
+        if not self.torch_compile:
+            return {}
+        # the transformer was compiled at load time, before the warm-up shapes were known
+        guidance_batch_sizes = sorted(
+            {
+                size
+                for batch_size in batch_sizes
+                for size in self.guidance_batch_sizes(
+                    batch_size,
+                    generation_kwargs.get("batched_guidance", False),
+                    generation_kwargs.get("guidance_scale_text", 0.0),
+                    generation_kwargs.get("guidance_scale_lyric", 0.0),
+                )
+            }
         )
-        self.ace_step_transformer.torchao_quantized = True
-
-        self.text_encoder_model = UMT5EncoderModel.from_pretrained(text_encoder_checkpoint_path)
-        self.text_encoder_model.eval().to(self.dtype).to('cpu')
-        self.text_encoder_model = torch.compile(self.text_encoder_model)
-        self.text_encoder_model.load_state_dict(
-            torch.load(
-                os.path.join(text_encoder_checkpoint_path, "pytorch_model_int4wo.bin"),
-                map_location='cpu' if self.cpu_offload else self.device,  # FIXED: CPU map for offload
-            ), assign=True
+        raise_cache_size_limit(
+            warmup_cache_size_limit(
+                durations, guidance_batch_sizes, erg_query_scales=generation_kwargs["use_erg_diffusion"]
+            )
         )
-        self.text_encoder_model.torchao_quantized = True
 
-        self.text_tokenizer = AutoTokenizer.from_pretrained(
-            text_encoder_checkpoint_path
+        before = compile_counters()
+        start_time = time.time()
+        self._run_compile_warmup(
+            durations, batch_sizes, encoder_lengths, infer_steps, use_erg_tag, generation_kwargs
         )
-
-        lang_segment = LangSegment()
-        lang_segment.setfilters(language_filters.default)
-        self.lang_segment = lang_segment
-        self.lyric_tokenizer = VoiceBpeTokenizer()
-
-        self.loaded = True
+        save_compile_artifacts(self.compile_cache_dir)
+        report = compile_report(since=before)
+        report["warmup_seconds"] = round(time.time() - start_time, 2)
+        self.last_compile_report = report
+        logger.info(f"torch.compile warm-up for {list(durations)} s: {report}")
+        return report
 
     @cpu_offload("text_encoder_model")
     def get_text_embeddings(self, texts, text_max_length=256):
@@ -361,27 +720,12 @@ class ACEStepPipeline:
             self.text_encoder_model.to(self.device)
 
         def forward_with_temperature(inputs, tau=0.01, l_min=8, l_max=10):
-            handlers = []
-
-            def hook(module, input, output):
-                output[:] *= tau
-                return output
-
-            for i in range(l_min, l_max):
-                handler = (
-                    self.text_encoder_model.encoder.block[i]
-                    .layer[0]
-                    .SelfAttention.q.register_forward_hook(hook)
-                )
-                handlers.append(handler)
-
-            with torch.no_grad():
+            with torch.no_grad(), query_temperature(
+                self.text_encoder_model, tau, range(l_min, l_max)
+            ):
                 outputs = self.text_encoder_model(**inputs)
                 last_hidden_states = outputs.last_hidden_state
 
-            for hook in handlers:
-                hook.remove()
-
             return last_hidden_states
 
         last_hidden_states = forward_with_temperature(inputs, tau, l_min, l_max)
@@ -435,6 +779,27 @@ class ACEStepPipeline:
             language = "en"
         return language
 
+    def get_lyric_inputs(self, lyrics, batch_size, debug=False):
+        """Lyric token ids and mask of shape (batch_size, n), a single 0 token for empty lyrics."""
+        lyric_token_idx = torch.tensor([0]).repeat(batch_size, 1).to(self.device).long()
+        lyric_mask = torch.tensor([0]).repeat(batch_size, 1).to(self.device).long()
+        if len(lyrics) > 0:
+            lyric_token_idx = self.tokenize_lyrics(lyrics, debug=debug)
+            lyric_mask = [1] * len(lyric_token_idx)
+            lyric_token_idx = (
+                torch.tensor(lyric_token_idx)
+                .unsqueeze(0)
+                .to(self.device)
+                .repeat(batch_size, 1)
+            )
+            lyric_mask = (
+                torch.tensor(lyric_mask)
+                .unsqueeze(0)
+                .to(self.device)
+                .repeat(batch_size, 1)
+            )
+        return lyric_token_idx, lyric_mask
+
     def tokenize_lyrics(self, lyrics, debug=False):
         lines = lyrics.split("\n")
         lyric_token_idx = [261]
@@ -563,6 +928,7 @@ class ACEStepPipeline:
         return noise_pred_src, noise_pred_tar
 
     @torch.no_grad()
+    @cpu_autocast
     def flowedit_diffusion_process(
         self,
         encoder_text_hidden_states,
@@ -794,6 +1160,12 @@ class ACEStepPipeline:
                 shift=3.0,
                 sigma_max=sigma_max
             )
+        elif scheduler_type == "dpm++":
+            scheduler = FlowMatchDPMSolverMultistepScheduler(
+                num_train_timesteps=1000,
+                shift=3.0,
+                sigma_max=sigma_max,
+            )
 
         infer_steps = int(sigma_max * infer_steps)
         timesteps, num_inference_steps = retrieve_timesteps(
@@ -808,6 +1180,7 @@ class ACEStepPipeline:
 
     @cpu_offload("ace_step_transformer")
     @torch.no_grad()
+    @cpu_autocast
     def text2music_diffusion_process(
         self,
         duration,
@@ -842,6 +1215,12 @@ class ACEStepPipeline:
         audio2audio_enable=False,
         ref_audio_strength=0.5,
         ref_latents=None,
+        batched_guidance=False,
+        use_cross_attention_kv_cache=True,
+        feature_cache_threshold=0.0,
+        guidance_reuse_interval=1,
+        adaptive_tolerance=0.05,
+        adaptive_max_evals=None,
     ):
 
         logger.info(
@@ -886,6 +1265,27 @@ class ACEStepPipeline:
                 num_train_timesteps=1000,
                 shift=3.0,
             )
+        elif scheduler_type == "dpm++":
+            # multistep DPM-Solver++, one evaluation per step, ~10-15 steps
+            scheduler = FlowMatchDPMSolverMultistepScheduler(
+                num_train_timesteps=1000,
+                shift=3.0,
+            )
+        elif scheduler_type == "adaptive":
+            # error-controlled step size, infer_steps is the cap on evaluations
+            scheduler = FlowMatchAdaptiveScheduler(
+                num_train_timesteps=1000,
+                shift=3.0,
+                rtol=adaptive_tolerance,
+                atol=adaptive_tolerance,
+                max_evals=adaptive_max_evals or infer_steps,
+            )
+        adaptive = isinstance(scheduler, FlowMatchAdaptiveScheduler)
+        if adaptive and (len(oss_steps) > 0 or audio2audio_enable or src_latents is not None):
+            raise ValueError(
+                "scheduler_type='adaptive' only supports plain text2music generation, "
+                "not oss_steps, audio2audio, repaint or extend"
+            )
 
         frame_length = int(duration * 44100 / 512 / 8)
         if src_latents is not None:
@@ -1032,9 +1432,23 @@ class ACEStepPipeline:
                 if right_pad_frame_length > 0:
                     repaint_mask[:, :, :, -right_pad_frame_length:] = 1.0
                 x0 = gt_latents
+
+                def extend_noise(length, from_end=False):
+                    # the retake noise only spans the source, longer extensions draw their own
+                    if length > retake_latents.shape[-1]:
+                        return randn_tensor(
+                            shape=(bsz, 8, 16, length),
+                            generator=retake_random_generators,
+                            device=self.device,
+                            dtype=self.dtype,
+                        )
+                    if from_end:
+                        return retake_latents[:, :, :, -length:]
+                    return retake_latents[:, :, :, :length]
+
                 padd_list = []
                 if left_pad_frame_length > 0:
-                    padd_list.append(retake_latents[:, :, :, :left_pad_frame_length])
+                    padd_list.append(extend_noise(left_pad_frame_length))
                 padd_list.append(
                     target_latents[
                         :,
@@ -1044,7 +1458,7 @@ class ACEStepPipeline:
                     ]
                 )
                 if right_pad_frame_length > 0:
-                    padd_list.append(retake_latents[:, :, :, -right_pad_frame_length:])
+                    padd_list.append(extend_noise(right_pad_frame_length, from_end=True))
                 target_latents = torch.cat(padd_list, dim=-1)
                 assert (
                     target_latents.shape[-1] == x0.shape[-1]
@@ -1064,7 +1478,30 @@ class ACEStepPipeline:
                 infer_steps=infer_steps,
             )
 
+        # plain text2music is padded to its duration bucket, the padding is masked out of the
+        # transformer, gets zero velocity and is trimmed from the returned latents
+        valid_length = None
+        if (
+            self.duration_buckets
+            and src_latents is None
+            and ref_latents is None
+            and not audio2audio_enable
+            and not adaptive
+        ):
+            bucket_length = self.bucket_frame_length(frame_length)
+            if bucket_length > frame_length:
+                target_latents = torch.nn.functional.pad(target_latents, (0, bucket_length - frame_length))
+                valid_length = frame_length
+                frame_length = bucket_length
+
         attention_mask = torch.ones(bsz, frame_length, device=self.device, dtype=self.dtype)
+        if valid_length is not None:
+            attention_mask[:, valid_length:] = 0
+        transformer_decode = (
+            self.ace_step_transformer.decode
+            if valid_length is None
+            else functools.partial(self.ace_step_transformer.decode, valid_length=valid_length)
+        )
 
         # guidance interval
         start_idx = int(num_inference_steps * ((1 - guidance_interval) / 2))
@@ -1076,25 +1513,13 @@ class ACEStepPipeline:
         momentum_buffer = MomentumBuffer()
 
         def forward_encoder_with_temperature(self, inputs, tau=0.01, l_min=4, l_max=6):
-            handlers = []
-
-            def hook(module, input, output):
-                output[:] *= tau
-                return output
-
-            for i in range(l_min, l_max):
-                handler = self.ace_step_transformer.lyric_encoder.encoders[
-                    i
-                ].self_attn.linear_q.register_forward_hook(hook)
-                handlers.append(handler)
-
             encoder_hidden_states, encoder_hidden_mask = (
-                self.ace_step_transformer.encode(**inputs)
+                self.ace_step_transformer.encode(
+                    **inputs,
+                    lyric_layer_query_scales={i: tau for i in range(l_min, l_max)},
+                )
             )
 
-            for hook in handlers:
-                hook.remove()
-
             return encoder_hidden_states
 
         # P(speaker, text, lyric)
@@ -1157,34 +1582,82 @@ class ACEStepPipeline:
                 )
 
         def forward_diffusion_with_temperature(
-            self, hidden_states, timestep, inputs, tau=0.01, l_min=15, l_max=20
+            self, hidden_states, timestep, inputs, tau=0.01, l_min=15, l_max=20, batch_slice=None
         ):
-            handlers = []
-
-            def hook(module, input, output):
-                output[:] *= tau
-                return output
-
-            for i in range(l_min, l_max):
-                handler = self.ace_step_transformer.transformer_blocks[
-                    i
-                ].attn.to_q.register_forward_hook(hook)
-                handlers.append(handler)
-                handler = self.ace_step_transformer.transformer_blocks[
-                    i
-                ].cross_attn.to_q.register_forward_hook(hook)
-                handlers.append(handler)
-
-            sample = self.ace_step_transformer.decode(
-                hidden_states=hidden_states, timestep=timestep, **inputs
-            ).sample
+            # only the sub-batch selected by batch_slice gets the lower temperature
+            query_scale = tau
+            if batch_slice is not None:
+                query_scale = torch.ones(
+                    hidden_states.shape[0], 1, 1,
+                    device=hidden_states.device,
+                    dtype=hidden_states.dtype,
+                )
+                query_scale[batch_slice] = tau
 
-            for hook in handlers:
-                hook.remove()
+            sample = transformer_decode(
+                hidden_states=hidden_states,
+                timestep=timestep,
+                block_query_scales={i: query_scale for i in range(l_min, l_max)},
+                **inputs,
+            ).sample
 
             return sample
 
-        for i, t in tqdm(enumerate(timesteps), total=num_inference_steps):
+        if batched_guidance and do_classifier_free_guidance:
+            # cond, [text only,] uncond stacked along the batch for a single forward
+            guidance_encoder_states = [encoder_hidden_states]
+            if do_double_condition_guidance and encoder_hidden_states_no_lyric is not None:
+                guidance_encoder_states.append(encoder_hidden_states_no_lyric)
+            guidance_encoder_states.append(encoder_hidden_states_null)
+            num_guidance_passes = len(guidance_encoder_states)
+            batched_encoder_hidden_states = torch.cat(guidance_encoder_states, dim=0)
+            batched_encoder_hidden_mask = encoder_hidden_mask.repeat(num_guidance_passes, 1)
+            batched_attention_mask = attention_mask.repeat(num_guidance_passes, 1)
+
+        # conditioning is fixed from here on, so cross-attention K/V can be reused across steps
+        cross_attention_kv_cache = (
+            CrossAttentionKVCache() if use_cross_attention_kv_cache else None
+        )
+        # opt-in reuse of the deep transformer blocks on slowly-changing steps
+        feature_cache = (
+            StepFeatureCache(
+                feature_cache_threshold,
+                num_steps=None if adaptive else len(timesteps),
+            )
+            if feature_cache_threshold > 0
+            else None
+        )
+        # rotary tables and timestep embeddings for the whole schedule in one go
+        decode_tables = self.ace_step_transformer.precompute_decode_tables(
+            timesteps=timesteps,
+            latent_length=target_latents.shape[-1],
+            encoder_length=encoder_hidden_states.shape[1],
+        )
+
+        # uncond (and text-only) minus cond from the last step that ran every guidance pass
+        guidance_deltas = None
+        reused_guidance_steps = 0
+        transformer_passes = 0
+
+        if adaptive:
+            # the adaptive sampler picks its timesteps as it goes, the guidance interval
+            # is taken over the covered part of the trajectory instead of the step index
+            guidance_start = (1 - guidance_interval) / 2
+            guidance_end = guidance_interval / 2 + 0.5
+            timestep_iterator = tqdm(
+                enumerate(scheduler.iter_timesteps()), total=scheduler.config.max_evals
+            )
+        else:
+            timestep_iterator = tqdm(enumerate(timesteps), total=num_inference_steps)
+        if self.profiler is not None:
+            timestep_iterator = self.profiler.step_events("diffusion_step", timestep_iterator)
+
+        num_evaluations = 0
+        guidance_step = 0
+        for i, t in timestep_iterator:
+            num_evaluations += 1
+            # precomputed rotary / timestep tables only match a fixed schedule
+            table_index = None if adaptive else i
 
             if is_repaint:
                 if i < n_min:
@@ -1198,14 +1671,22 @@ class ACEStepPipeline:
             # expand the latents if we are doing classifier free guidance
             latents = target_latents
 
-            is_in_guidance_interval = start_idx <= i < end_idx
+            if adaptive:
+                is_in_guidance_interval = guidance_start <= scheduler.progress < guidance_end
+            else:
+                is_in_guidance_interval = start_idx <= i < end_idx
             if is_in_guidance_interval and do_classifier_free_guidance:
                 # compute current guidance scale
                 if guidance_interval_decay > 0:
                     # Linearly interpolate to calculate the current guidance scale
-                    progress = (i - start_idx) / (
-                        end_idx - start_idx - 1
-                    )  # 归一化到[0,1]
+                    if adaptive:
+                        progress = (scheduler.progress - guidance_start) / (
+                            guidance_end - guidance_start
+                        )
+                    else:
+                        progress = (i - start_idx) / (
+                            end_idx - start_idx - 1
+                        )  # 归一化到[0,1]
                     current_guidance_scale = (
                         guidance_scale
                         - (guidance_scale - min_guidance_scale)
@@ -1218,51 +1699,141 @@ class ACEStepPipeline:
                 latent_model_input = latents
                 timestep = t.expand(latent_model_input.shape[0])
                 output_length = latent_model_input.shape[-1]
-                # P(x|speaker, text, lyric)
-                noise_pred_with_cond = self.ace_step_transformer.decode(
-                    hidden_states=latent_model_input,
-                    attention_mask=attention_mask,
-                    encoder_hidden_states=encoder_hidden_states,
-                    encoder_hidden_mask=encoder_hidden_mask,
-                    output_length=output_length,
-                    timestep=timestep,
-                ).sample
 
-                noise_pred_with_only_text_cond = None
-                if (
-                    do_double_condition_guidance
-                    and encoder_hidden_states_no_lyric is not None
-                ):
-                    noise_pred_with_only_text_cond = self.ace_step_transformer.decode(
+                reuse_guidance = (
+                    guidance_reuse_interval > 1
+                    and guidance_deltas is not None
+                    and guidance_step % guidance_reuse_interval != 0
+                )
+                guidance_step += 1
+                if reuse_guidance:
+                    # only the conditional pass, the other branches keep their last offset from it
+                    noise_pred_with_cond = transformer_decode(
                         hidden_states=latent_model_input,
                         attention_mask=attention_mask,
-                        encoder_hidden_states=encoder_hidden_states_no_lyric,
+                        encoder_hidden_states=encoder_hidden_states,
                         encoder_hidden_mask=encoder_hidden_mask,
                         output_length=output_length,
                         timestep=timestep,
+                        cross_attention_kv_cache=cross_attention_kv_cache,
+                        decode_tables=decode_tables,
+                        step_index=table_index,
+                        feature_cache=feature_cache,
                     ).sample
-
-                if use_erg_diffusion:
-                    noise_pred_uncond = forward_diffusion_with_temperature(
-                        self,
-                        hidden_states=latent_model_input,
-                        timestep=timestep,
-                        inputs={
-                            "encoder_hidden_states": encoder_hidden_states_null,
-                            "encoder_hidden_mask": encoder_hidden_mask,
-                            "output_length": output_length,
-                            "attention_mask": attention_mask,
-                        },
+                    transformer_passes += 1
+                    reused_guidance_steps += 1
+                    noise_pred_uncond = noise_pred_with_cond + guidance_deltas[-1]
+                    noise_pred_with_only_text_cond = (
+                        noise_pred_with_cond + guidance_deltas[0]
+                        if len(guidance_deltas) == 2
+                        else None
+                    )
+                elif batched_guidance:
+                    num_passes = num_guidance_passes
+                    batched_inputs = {
+                        "encoder_hidden_states": batched_encoder_hidden_states,
+                        "encoder_hidden_mask": batched_encoder_hidden_mask,
+                        "output_length": output_length,
+                        "attention_mask": batched_attention_mask,
+                        "cross_attention_kv_cache": cross_attention_kv_cache,
+                        "decode_tables": decode_tables,
+                        "step_index": table_index,
+                        "feature_cache": feature_cache,
+                    }
+                    batched_latent_model_input = latent_model_input.repeat(num_passes, 1, 1, 1)
+                    batched_timestep = t.expand(batched_latent_model_input.shape[0])
+                    if use_erg_diffusion:
+                        batched_noise_pred = forward_diffusion_with_temperature(
+                            self,
+                            hidden_states=batched_latent_model_input,
+                            timestep=batched_timestep,
+                            inputs=batched_inputs,
+                            batch_slice=slice((num_passes - 1) * bsz, num_passes * bsz),
+                        )
+                    else:
+                        batched_noise_pred = transformer_decode(
+                            hidden_states=batched_latent_model_input,
+                            timestep=batched_timestep,
+                            **batched_inputs,
+                        ).sample
+                    transformer_passes += num_passes
+                    batched_noise_pred = batched_noise_pred.chunk(num_passes, dim=0)
+                    noise_pred_with_cond = batched_noise_pred[0]
+                    noise_pred_uncond = batched_noise_pred[-1]
+                    noise_pred_with_only_text_cond = (
+                        batched_noise_pred[1] if num_passes == 3 else None
                     )
                 else:
-                    noise_pred_uncond = self.ace_step_transformer.decode(
+                    # P(x|speaker, text, lyric)
+                    noise_pred_with_cond = transformer_decode(
                         hidden_states=latent_model_input,
                         attention_mask=attention_mask,
-                        encoder_hidden_states=encoder_hidden_states_null,
+                        encoder_hidden_states=encoder_hidden_states,
                         encoder_hidden_mask=encoder_hidden_mask,
                         output_length=output_length,
                         timestep=timestep,
+                        cross_attention_kv_cache=cross_attention_kv_cache,
+                        decode_tables=decode_tables,
+                        step_index=table_index,
+                        feature_cache=feature_cache,
                     ).sample
+                    transformer_passes += 2
+
+                    noise_pred_with_only_text_cond = None
+                    if (
+                        do_double_condition_guidance
+                        and encoder_hidden_states_no_lyric is not None
+                    ):
+                        noise_pred_with_only_text_cond = transformer_decode(
+                            hidden_states=latent_model_input,
+                            attention_mask=attention_mask,
+                            encoder_hidden_states=encoder_hidden_states_no_lyric,
+                            encoder_hidden_mask=encoder_hidden_mask,
+                            output_length=output_length,
+                            timestep=timestep,
+                            cross_attention_kv_cache=cross_attention_kv_cache,
+                            decode_tables=decode_tables,
+                            step_index=table_index,
+                            feature_cache=feature_cache,
+                        ).sample
+                        transformer_passes += 1
+
+                    if use_erg_diffusion:
+                        noise_pred_uncond = forward_diffusion_with_temperature(
+                            self,
+                            hidden_states=latent_model_input,
+                            timestep=timestep,
+                            inputs={
+                                "encoder_hidden_states": encoder_hidden_states_null,
+                                "encoder_hidden_mask": encoder_hidden_mask,
+                                "output_length": output_length,
+                                "attention_mask": attention_mask,
+                                "cross_attention_kv_cache": cross_attention_kv_cache,
+                                "decode_tables": decode_tables,
+                                "step_index": table_index,
+                                "feature_cache": feature_cache,
+                            },
+                        )
+                    else:
+                        noise_pred_uncond = transformer_decode(
+                            hidden_states=latent_model_input,
+                            attention_mask=attention_mask,
+                            encoder_hidden_states=encoder_hidden_states_null,
+                            encoder_hidden_mask=encoder_hidden_mask,
+                            output_length=output_length,
+                            timestep=timestep,
+                            cross_attention_kv_cache=cross_attention_kv_cache,
+                            decode_tables=decode_tables,
+                            step_index=table_index,
+                            feature_cache=feature_cache,
+                        ).sample
+
+                if guidance_reuse_interval > 1 and not reuse_guidance:
+                    guidance_deltas = [noise_pred_uncond - noise_pred_with_cond]
+                    if noise_pred_with_only_text_cond is not None:
+                        guidance_deltas.insert(
+                            0, noise_pred_with_only_text_cond - noise_pred_with_cond
+                        )
 
                 if (
                     do_double_condition_guidance
@@ -1301,14 +1872,19 @@ class ACEStepPipeline:
             else:
                 latent_model_input = latents
                 timestep = t.expand(latent_model_input.shape[0])
-                noise_pred = self.ace_step_transformer.decode(
+                noise_pred = transformer_decode(
                     hidden_states=latent_model_input,
                     attention_mask=attention_mask,
                     encoder_hidden_states=encoder_hidden_states,
                     encoder_hidden_mask=encoder_hidden_mask,
                     output_length=latent_model_input.shape[-1],
                     timestep=timestep,
+                    cross_attention_kv_cache=cross_attention_kv_cache,
+                    decode_tables=decode_tables,
+                    step_index=table_index,
+                    feature_cache=feature_cache,
                 ).sample
+                transformer_passes += 1
 
             if is_repaint and i >= n_min:
                 t_i = t / 1000
@@ -1334,6 +1910,26 @@ class ACEStepPipeline:
                     generator=random_generators[0],
                 )[0]
 
+        if cross_attention_kv_cache is not None:
+            cross_attention_kv_cache.clear()
+        self.last_diffusion_stats = {
+            "evaluations": num_evaluations,
+            "transformer_passes": transformer_passes,
+            "reused_guidance_steps": reused_guidance_steps,
+        }
+        if adaptive:
+            self.last_diffusion_stats.update(scheduler.stats)
+        logger.info(
+            f"diffusion: {num_evaluations} steps, {transformer_passes} transformer passes, "
+            f"{reused_guidance_steps} steps reused the guidance branches"
+        )
+        if feature_cache is not None:
+            logger.info(
+                f"feature cache: reused {feature_cache.reused_steps} of "
+                f"{feature_cache.reused_steps + feature_cache.computed_steps} transformer passes"
+            )
+            feature_cache.clear()
+
         if is_extend:
             if to_right_pad_gt_latents is not None:
                 target_latents = torch.cat(
@@ -1343,9 +1939,168 @@ class ACEStepPipeline:
                 target_latents = torch.cat(
                     [to_right_pad_gt_latents, target_latents], dim=0
                 )
+        if valid_length is not None:
+            target_latents = target_latents[..., :valid_length]
         return target_latents
 
+    @torch.no_grad()
+    def text2music_long_form_process(
+        self,
+        duration,
+        lyrics,
+        batch_size,
+        window_duration=120.0,
+        overlap_duration=10.0,
+        random_generators=None,
+        retake_random_generators=None,
+        audio_chunk_callback=None,
+        debug=False,
+        **diffusion_kwargs,
+    ):
+        """
+        Generates ``duration`` seconds as a chain of overlapping latent windows of at most
+        ``window_duration`` seconds, so the transformer never sees more than one window.
+
+        Every window after the first is an extend of the tail of the song so far: the first
+        ``overlap - blend`` frames of the overlap are kept fixed through the repaint masking, the
+        last ``blend`` frames are regenerated and crossfaded with the previous window. The lyrics
+        are split over the windows. With ``audio_chunk_callback`` the frames that no later window
+        can change are decoded and handed out after every window, see ``stream_latents2audio``.
+        """
+        frames_per_second = 44100 / 512 / 8
+        total_frames = int(duration * frames_per_second)
+        window_frames = int(window_duration * frames_per_second)
+        overlap_frames = int(overlap_duration * frames_per_second)
+        if window_duration > 240:
+            raise ValueError("long_form_window must be at most 240 seconds")
+        if not 0 < overlap_frames < window_frames // 2:
+            raise ValueError("long_form_overlap must be positive and less than half of long_form_window")
+        if diffusion_kwargs.get("scheduler_type") == "adaptive" and total_frames > window_frames:
+            # checked before the first window, the continuation windows are extends
+            raise ValueError("scheduler_type='adaptive' does not support long-form generation, use a fixed-step one")
+        blend_frames = max(1, overlap_frames // 4)
+        context_frames = overlap_frames - blend_frames
+        step_frames = window_frames - overlap_frames
+        num_windows = 1 + math.ceil(max(0, total_frames - window_frames) / step_frames)
+        lyric_parts = split_lyrics_for_windows(lyrics, num_windows) if lyrics else [""] * num_windows
+        logger.info(
+            f"long-form: {total_frames} frames in {num_windows} windows of {window_frames} "
+            f"frames, {overlap_frames} frames overlap"
+        )
+
+        # durations are passed half a frame up, so the frame counts survive the seconds round trip
+        latents = None
+        emitted_frames = 0
+        stats = {}
+        for window_index, lyric_part in enumerate(lyric_parts):
+            lyric_token_ids, lyric_mask = self.get_lyric_inputs(lyric_part, batch_size, debug=debug)
+            if latents is None:
+                latents = self.text2music_diffusion_process(
+                    duration=(min(window_frames, total_frames) + 0.5) / frames_per_second,
+                    lyric_token_ids=lyric_token_ids,
+                    lyric_mask=lyric_mask,
+                    random_generators=random_generators,
+                    retake_random_generators=retake_random_generators,
+                    **diffusion_kwargs,
+                )
+            else:
+                this_frames = min(window_frames, total_frames - latents.shape[-1] + overlap_frames)
+                context = latents[:, :, :, -overlap_frames:][:, :, :, :context_frames]
+                window_latents = self.text2music_diffusion_process(
+                    duration=(this_frames + 0.5) / frames_per_second,
+                    lyric_token_ids=lyric_token_ids,
+                    lyric_mask=lyric_mask,
+                    random_generators=random_generators,
+                    retake_random_generators=retake_random_generators,
+                    retake_variance=1.0,
+                    add_retake_noise=True,
+                    repaint_start=0,
+                    repaint_end=(this_frames + 0.5) / frames_per_second,
+                    src_latents=context,
+                    **diffusion_kwargs,
+                )
+                fade = torch.linspace(
+                    0, 1, blend_frames + 2, device=latents.device, dtype=latents.dtype
+                )[1:-1]
+                blended = (
+                    latents[:, :, :, -blend_frames:] * (1 - fade)
+                    + window_latents[:, :, :, context_frames:overlap_frames] * fade
+                )
+                latents = torch.cat(
+                    [
+                        latents[:, :, :, :-blend_frames],
+                        blended,
+                        window_latents[:, :, :, overlap_frames:],
+                    ],
+                    dim=-1,
+                )
+            for key, value in self.last_diffusion_stats.items():
+                stats[key] = stats.get(key, 0) + value
+
+            if audio_chunk_callback is not None:
+                # the blend region of the tail still changes with the next window
+                is_last = window_index == num_windows - 1
+                final_frames = latents.shape[-1] if is_last else latents.shape[-1] - blend_frames
+                self.stream_latent_segment(
+                    latents, emitted_frames, final_frames, audio_chunk_callback
+                )
+                emitted_frames = final_frames
+
+        stats["windows"] = num_windows
+        self.last_diffusion_stats = stats
+        return latents
+
+    @cpu_offload("music_dcae")
+    def stream_latent_segment(
+        self, latents, start_frame, end_frame, audio_chunk_callback, sample_rate=48000, context_frames=64
+    ):
+        """
+        Decodes frames ``[start_frame, end_frame)`` of ``latents`` and hands the audio to
+        ``audio_chunk_callback(batch_index, start_sample, wav_chunk)`` with sample positions of
+        the whole latent. Up to ``context_frames`` neighbouring frames on both sides are decoded
+        along and cut off again, so consecutive segments join without audible seams.
+        """
+        if end_frame <= start_frame:
+            return
+        decode_start = max(0, start_frame - context_frames)
+        decode_end = min(latents.shape[-1], end_frame + context_frames)
+        num_samples = self.music_dcae.num_output_samples
+        offset = num_samples(decode_start, sr=sample_rate)
+        start_sample = num_samples(start_frame, sr=sample_rate)
+        end_sample = num_samples(end_frame, sr=sample_rate)
+        with torch.no_grad():
+            for i, latent in enumerate(latents):
+                wav = torch.cat(
+                    [
+                        wav_chunk
+                        for _, wav_chunk in self.music_dcae.decode_overlap_stream(
+                            latent[:, :, decode_start:decode_end], sr=sample_rate
+                        )
+                    ],
+                    dim=1,
+                )
+                audio_chunk_callback(
+                    i, start_sample, wav[:, start_sample - offset : end_sample - offset]
+                )
+
     @cpu_offload("music_dcae")
+    def latents2wavs(
+        self,
+        latents,
+        target_wav_duration_second=30,
+        sample_rate=48000,
+        overlapped_decode=None,
+    ):
+        """Decodes ``latents`` into float32 CPU waveforms (channels, samples), nothing is written."""
+        if overlapped_decode is None:
+            overlapped_decode = self.overlapped_decode
+        with torch.no_grad():
+            if overlapped_decode and target_wav_duration_second > 48:
+                _, pred_wavs = self.music_dcae.decode_overlap(latents, sr=sample_rate)
+            else:
+                _, pred_wavs = self.music_dcae.decode(latents, sr=sample_rate)
+        return [pred_wav.cpu().float() for pred_wav in pred_wavs]
+
     def latents2audio(
         self,
         latents,
@@ -1353,16 +2108,16 @@ class ACEStepPipeline:
         sample_rate=48000,
         save_path=None,
         format="wav",
+        overlapped_decode=None,
     ):
         output_audio_paths = []
         bs = latents.shape[0]
-        pred_latents = latents
-        with torch.no_grad():
-            if self.overlapped_decode and target_wav_duration_second > 48:
-                _, pred_wavs = self.music_dcae.decode_overlap(pred_latents, sr=sample_rate)
-            else:
-                _, pred_wavs = self.music_dcae.decode(pred_latents, sr=sample_rate)
-        pred_wavs = [pred_wav.cpu().float() for pred_wav in pred_wavs]
+        pred_wavs = self.latents2wavs(
+            latents,
+            target_wav_duration_second=target_wav_duration_second,
+            sample_rate=sample_rate,
+            overlapped_decode=overlapped_decode,
+        )
         for i in tqdm(range(bs)):
             output_audio_path = self.save_wav_file(
                 pred_wavs[i],
@@ -1374,9 +2129,66 @@ class ACEStepPipeline:
             output_audio_paths.append(output_audio_path)
         return output_audio_paths
 
+    def latents2audio_stream(self, latents, batch_index=0, sample_rate=48000):
+        """
+        Generator counterpart of ``latents2audio`` for ``latents[batch_index]``: yields
+        ``(start_sample, pcm_chunk)`` as soon as each overlapped DCAE / vocoder window is final,
+        ``pcm_chunk`` being a float32 CPU tensor (channels, samples) at ``sample_rate``.
+
+        Only the window being decoded and the held back crossfade / resampler tail are kept,
+        not the whole waveform. The last chunk is the flushed tail, after it the chunks add up
+        to ``num_audio_samples`` of the latent length. Closing the generator early (``close()``
+        or leaving a ``for`` loop) stops decoding and, with cpu offload, moves the decoder back
+        to the CPU.
+        """
+        offloader = (
+            CpuOffloader(self.music_dcae, self.device)
+            if self.cpu_offload
+            else contextlib.nullcontext()
+        )
+        with offloader:
+            chunks = self.music_dcae.decode_overlap_stream(
+                latents[batch_index], sr=sample_rate
+            )
+            try:
+                for start_sample, pcm_chunk in chunks:
+                    yield start_sample, pcm_chunk
+            finally:
+                chunks.close()
+
+    def stream_latents2audio(self, latents, audio_chunk_callback, sample_rate=48000):
+        """
+        Decodes ``latents`` window by window with the overlapped decoder and hands every
+        finished chunk to ``audio_chunk_callback(batch_index, start_sample, wav_chunk)``
+        instead of writing files. ``wav_chunk`` is a float32 CPU tensor (channels, samples).
+        """
+        for i in range(latents.shape[0]):
+            for start_sample, wav_chunk in self.latents2audio_stream(
+                latents, batch_index=i, sample_rate=sample_rate
+            ):
+                audio_chunk_callback(i, start_sample, wav_chunk)
+
+    @staticmethod
+    def num_audio_samples(audio_duration, sample_rate=48000):
+        """Number of samples per channel produced for a text2music generation of ``audio_duration`` seconds."""
+        frame_length = int(audio_duration * 44100 / 512 / 8)
+        return int(frame_length * 8 * 512 * sample_rate / 44100)
+
+    @staticmethod
+    def wav_to_pcm16_bytes(wav):
+        """Interleaved signed 16-bit little-endian PCM of a float (channels, samples) waveform."""
+        pcm = (wav.clamp(-1.0, 1.0) * 32767.0).round().short()
+        return pcm.t().contiguous().numpy().tobytes()
+
     def save_wav_file(
         self, target_wav, idx, save_path=None, sample_rate=48000, format="wav"
     ):
+        output_path_wav = self.get_output_path(idx, save_path=save_path, format=format)
+        return self.write_wav_file(
+            target_wav, output_path_wav, sample_rate=sample_rate, format=format
+        )
+
+    def get_output_path(self, idx, save_path=None, format="wav"):
         if save_path is None:
             logger.warning("save_path is None, using default path ./outputs/")
             base_path = "./outputs"
@@ -1391,7 +2203,9 @@ class ACEStepPipeline:
                 output_path_wav = os.path.join(save_path, f"output_{time.strftime('%Y%m%d%H%M%S')}_{idx}."+format)
             else:
                 output_path_wav = save_path
+        return output_path_wav
 
+    def write_wav_file(self, target_wav, output_path_wav, sample_rate=48000, format="wav"):
         target_wav = target_wav.float()
         backend = "soundfile"
         if format == "ogg":
@@ -1402,6 +2216,44 @@ class ACEStepPipeline:
         )
         return output_path_wav
 
+    def write_outputs(self, wavs, output_paths, input_params_json, sample_rate=48000, format="wav"):
+        """Writes every waveform to its path and the input params next to it as ``_input_params.json``."""
+        for wav, output_audio_path in zip(wavs, output_paths):
+            self.write_wav_file(wav, output_audio_path, sample_rate=sample_rate, format=format)
+            input_params_json_save_path = output_audio_path.replace(
+                f".{format}", "_input_params.json"
+            )
+            with open(input_params_json_save_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    dict(input_params_json, audio_path=output_audio_path),
+                    f,
+                    indent=4,
+                    ensure_ascii=False,
+                )
+        return output_paths
+
+    def submit_background_write(self, fn, *args, **kwargs):
+        """Runs ``fn`` on the writer thread, see ``wait_for_writes``."""
+        if self._write_executor is None:
+            self._write_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="ace-step-writer"
+            )
+        # keep failed writes around so wait_for_writes can report them
+        self._pending_writes = [
+            future
+            for future in self._pending_writes
+            if not future.done() or future.exception() is not None
+        ]
+        future = self._write_executor.submit(fn, *args, **kwargs)
+        self._pending_writes.append(future)
+        return future
+
+    def wait_for_writes(self):
+        """Blocks until every background write finished, re-raises the first failure."""
+        pending, self._pending_writes = self._pending_writes, []
+        for future in pending:
+            future.result()
+
     @cpu_offload("music_dcae")
     def infer_latents(self, input_audio_path):
         if input_audio_path is None:
@@ -1414,6 +2266,10 @@ class ACEStepPipeline:
 
     def load_lora(self, lora_name_or_path, lora_weight):
         if (lora_name_or_path != self.lora_path or lora_weight != self.lora_weight) and lora_name_or_path != "none":
+            if self.cpu_int8 or self.quantized:
+                raise ValueError(
+                    "LoRA adapters need the float transformer, load the pipeline with cpu_int8=False and quantized=False"
+                )
             if not os.path.exists(lora_name_or_path):
                 lora_download_path = snapshot_download(lora_name_or_path, cache_dir=self.checkpoint_dir)
             else:
@@ -1469,9 +2325,40 @@ class ACEStepPipeline:
         save_path: str = None,
         batch_size: int = 1,
         debug: bool = False,
+        batched_guidance: bool = False,
+        feature_cache_threshold: float = 0.0,
+        guidance_reuse_interval: int = 1,
+        adaptive_tolerance: float = 0.05,
+        adaptive_max_evals: int = None,
+        long_form_window: float = 0.0,
+        long_form_overlap: float = 10.0,
+        audio_chunk_callback=None,
+        output_mode: str = "path",
+        background_write: bool = False,
     ):
+        """
+        ``output_mode`` selects what is returned per generated item, followed by the input params:
+
+        - ``"path"``: file paths, every result is written under ``save_path`` (default).
+        - ``"tensor"``: float32 CPU waveforms (channels, samples) at 48 kHz.
+        - ``"pcm16_bytes"``: interleaved s16le 48 kHz PCM bytes.
+        - ``"callback"``: audio is streamed to ``audio_chunk_callback``, nothing is returned.
+
+        In the in-memory modes files are only written when ``save_path`` is given. With
+        ``background_write`` files are written on a worker thread after returning, see
+        ``wait_for_writes``.
+        """
+        if audio_chunk_callback is not None and output_mode == "path":
+            output_mode = "callback"
+        if output_mode not in OUTPUT_MODES:
+            raise ValueError(f"output_mode must be one of {OUTPUT_MODES}, got {output_mode!r}")
+        if output_mode == "callback" and audio_chunk_callback is None:
+            raise ValueError("output_mode='callback' requires audio_chunk_callback")
 
         start_time = time.time()
+        if self.profiler is not None:
+            self.profiler.start_trace()
+            self.profiler.begin_stage("load_model")
 
         if audio2audio_enable and ref_audio_input is not None:
             task = "audio2audio"
@@ -1486,6 +2373,10 @@ class ACEStepPipeline:
         self.load_lora(lora_name_or_path, lora_weight)
         load_model_cost = time.time() - start_time
         logger.info(f"Model loaded in {load_model_cost:.2f} seconds.")
+        compile_counters_before = compile_counters() if self.torch_compile else None
+        if self.profiler is not None:
+            self.profiler.instrument(self)
+            self.profiler.begin_stage("preprocess")
 
         start_time = time.time()
 
@@ -1513,23 +2404,16 @@ class ACEStepPipeline:
         speaker_embeds = torch.zeros(batch_size, 512).to(self.device).to(self.dtype)
 
         # 6 lyric
-        lyric_token_idx = torch.tensor([0]).repeat(batch_size, 1).to(self.device).long()
-        lyric_mask = torch.tensor([0]).repeat(batch_size, 1).to(self.device).long()
-        if len(lyrics) > 0:
-            lyric_token_idx = self.tokenize_lyrics(lyrics, debug=debug)
-            lyric_mask = [1] * len(lyric_token_idx)
-            lyric_token_idx = (
-                torch.tensor(lyric_token_idx)
-                .unsqueeze(0)
-                .to(self.device)
-                .repeat(batch_size, 1)
-            )
-            lyric_mask = (
-                torch.tensor(lyric_mask)
-                .unsqueeze(0)
-                .to(self.device)
-                .repeat(batch_size, 1)
-            )
+        long_form = (
+            task == "text2music"
+            and long_form_window > 0
+            and audio_duration > long_form_window
+        )
+        if long_form:
+            # tokenized per window in text2music_long_form_process
+            lyric_token_idx, lyric_mask = None, None
+        else:
+            lyric_token_idx, lyric_mask = self.get_lyric_inputs(lyrics, batch_size, debug=debug)
 
         if audio_duration <= 0:
             audio_duration = random.uniform(30.0, 240.0)
@@ -1538,6 +2422,8 @@ class ACEStepPipeline:
         end_time = time.time()
         preprocess_time_cost = end_time - start_time
         start_time = end_time
+        if self.profiler is not None:
+            self.profiler.begin_stage("diffusion")
 
         add_retake_noise = task in ("retake", "repaint", "extend")
         # retake equal to repaint
@@ -1623,6 +2509,40 @@ class ACEStepPipeline:
                 n_avg=edit_n_avg,
                 scheduler_type=scheduler_type,
             )
+        elif long_form:
+            target_latents = self.text2music_long_form_process(
+                duration=audio_duration,
+                lyrics=lyrics,
+                batch_size=batch_size,
+                window_duration=long_form_window,
+                overlap_duration=long_form_overlap,
+                random_generators=random_generators,
+                retake_random_generators=retake_random_generators,
+                audio_chunk_callback=audio_chunk_callback,
+                debug=debug,
+                encoder_text_hidden_states=encoder_text_hidden_states,
+                text_attention_mask=text_attention_mask,
+                speaker_embds=speaker_embeds,
+                guidance_scale=guidance_scale,
+                omega_scale=omega_scale,
+                infer_steps=infer_step,
+                scheduler_type=scheduler_type,
+                cfg_type=cfg_type,
+                guidance_interval=guidance_interval,
+                guidance_interval_decay=guidance_interval_decay,
+                min_guidance_scale=min_guidance_scale,
+                oss_steps=oss_steps,
+                encoder_text_hidden_states_null=encoder_text_hidden_states_null,
+                use_erg_lyric=use_erg_lyric,
+                use_erg_diffusion=use_erg_diffusion,
+                guidance_scale_text=guidance_scale_text,
+                guidance_scale_lyric=guidance_scale_lyric,
+                batched_guidance=batched_guidance,
+                feature_cache_threshold=feature_cache_threshold,
+                guidance_reuse_interval=guidance_reuse_interval,
+                adaptive_tolerance=adaptive_tolerance,
+                adaptive_max_evals=adaptive_max_evals,
+            )
         else:
             target_latents = self.text2music_diffusion_process(
                 duration=audio_duration,
@@ -1655,24 +2575,50 @@ class ACEStepPipeline:
                 audio2audio_enable=audio2audio_enable,
                 ref_audio_strength=ref_audio_strength,
                 ref_latents=ref_latents,
+                batched_guidance=batched_guidance,
+                feature_cache_threshold=feature_cache_threshold,
+                guidance_reuse_interval=guidance_reuse_interval,
+                adaptive_tolerance=adaptive_tolerance,
+                adaptive_max_evals=adaptive_max_evals,
             )
 
         end_time = time.time()
         diffusion_time_cost = end_time - start_time
         start_time = end_time
-
-        output_paths = self.latents2audio(
-            latents=target_latents,
-            target_wav_duration_second=audio_duration,
-            save_path=save_path,
-            format=format,
-        )
+        if self.profiler is not None:
+            self.profiler.begin_stage("latent2audio")
+
+        pred_wavs = []
+        output_paths = []
+        if output_mode == "callback":
+            # streamed output is handed to the caller, nothing is written to disk
+            if not long_form:
+                # long-form windows were already streamed while diffusing
+                self.stream_latents2audio(
+                    latents=target_latents,
+                    audio_chunk_callback=audio_chunk_callback,
+                )
+        else:
+            pred_wavs = self.latents2wavs(
+                latents=target_latents,
+                target_wav_duration_second=audio_duration,
+                # keeps decoder memory bounded like the windowed diffusion
+                overlapped_decode=True if long_form else None,
+            )
+            if output_mode == "path" or save_path is not None:
+                output_paths = [
+                    self.get_output_path(i, save_path=save_path, format=format)
+                    for i in range(len(pred_wavs))
+                ]
 
         # Clean up memory after generation
         self.cleanup_memory()
 
         end_time = time.time()
         latent2audio_time_cost = end_time - start_time
+        if compile_counters_before is not None:
+            # fx_graph_cache_misses > 0 means this call compiled new kernels
+            self.last_compile_report = compile_report(since=compile_counters_before)
         timecosts = {
             "preprocess": preprocess_time_cost,
             "diffusion": diffusion_time_cost,
@@ -1716,14 +2662,39 @@ class ACEStepPipeline:
             "audio2audio_enable": audio2audio_enable,
             "ref_audio_strength": ref_audio_strength,
             "ref_audio_input": ref_audio_input,
+            "batched_guidance": batched_guidance,
+            "feature_cache_threshold": feature_cache_threshold,
+            "guidance_reuse_interval": guidance_reuse_interval,
+            "adaptive_tolerance": adaptive_tolerance,
+            "adaptive_max_evals": adaptive_max_evals,
+            "long_form_window": long_form_window,
+            "long_form_overlap": long_form_overlap,
+            "diffusion_stats": dict(self.last_diffusion_stats),
+            "compile_report": dict(self.last_compile_report) if self.torch_compile else {},
+            "output_mode": output_mode,
+            "sample_rate": 48000,
         }
-        # save input_params_json
-        for output_audio_path in output_paths:
-            input_params_json_save_path = output_audio_path.replace(
-                f".{format}", "_input_params.json"
-            )
-            input_params_json["audio_path"] = output_audio_path
-            with open(input_params_json_save_path, "w", encoding="utf-8") as f:
-                json.dump(input_params_json, f, indent=4, ensure_ascii=False)
-
-        return output_paths + [input_params_json]
+        if self.profiler is not None:
+            self.profiler.begin_stage("write_outputs")
+        # save audio and input_params_json
+        if output_paths:
+            if background_write:
+                self.submit_background_write(
+                    self.write_outputs, pred_wavs, output_paths, dict(input_params_json), format=format
+                )
+            else:
+                self.write_outputs(pred_wavs, output_paths, input_params_json, format=format)
+            input_params_json["audio_path"] = output_paths[-1]
+
+        if output_mode == "path":
+            outputs = output_paths
+        elif output_mode == "tensor":
+            outputs = pred_wavs
+        elif output_mode == "pcm16_bytes":
+            outputs = [self.wav_to_pcm16_bytes(wav) for wav in pred_wavs]
+        else:
+            outputs = []
+        if self.profiler is not None:
+            self.last_profile_trace = self.profiler.save()
+            input_params_json["profile_trace"] = self.last_profile_trace
+        return outputs + [input_params_json]
@@ -0,0 +1,212 @@
+"""
+Opt-in profiler with Chrome trace output.
+
+Enabled with ``ACEStepPipeline(profile=True)`` or a directory, or with the ``ACE_PROFILE``
+environment variable (``1`` or a directory). Each pipeline call then writes
+``<dir>/trace_<time>_<pid>_<n>.json``, which chrome://tracing or https://ui.perfetto.dev open.
+The trace holds:
+
+- the stages of the call, with peak memory per stage;
+- every diffusion step;
+- the self-attention, cross-attention and feed-forward of every transformer block;
+- the lyric encoder and UMT5;
+- every DCAE and vocoder window.
+
+Nothing is hooked or wrapped while the profiler is off, so the pipeline pays nothing for it.
+The module hooks synchronize CUDA so that the spans measure execution rather than kernel launch.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+import torch
+from loguru import logger
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROFILE_ENV_VAR = "ACE_PROFILE"
+DEFAULT_PROFILE_DIR = os.path.join(".", "outputs", "profiles")
+
+
+def resolve_profile_dir(profile=None) -> Optional[str]:
+    """Trace directory for the ``profile`` argument of the pipeline, None when profiling is off."""
+    if profile is None:
+        profile = os.environ.get(PROFILE_ENV_VAR, "")
+        if profile.lower() in ("", "0", "false", "no"):
+            return None
+        if profile.lower() in ("1", "true", "yes"):
+            profile = True
+    if profile is False:
+        return None
+    if profile is True:
+        return DEFAULT_PROFILE_DIR
+    return str(profile)
+
+
+def _max_rss_mb() -> Optional[float]:
+    # high-water mark of the process, kilobytes on Linux and bytes on macOS
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+class PipelineProfiler:
+    def __init__(self, output_dir, device):
+        self.output_dir = output_dir
+        self.device = torch.device(device)
+        self.events: List[Dict] = []
+        self._stage = None
+        self._open_spans: Dict[int, List[float]] = {}
+        self._hooked = set()
+        self._handles = []
+        # numbers the traces of this profiler, so calls within the same millisecond get distinct files
+        self._trace_count = 0
+
+    def _synchronize(self):
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
+
+    @staticmethod
+    def _now_us() -> float:
+        return time.perf_counter_ns() / 1000
+
+    def add_event(self, name, category, start_us, end_us, args=None):
+        self.events.append(
+            {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": start_us,
+                "dur": end_us - start_us,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": args or {},
+            }
+        )
+
+    def start_trace(self):
+        self.events = []
+        self._stage = None
+
+    def begin_stage(self, name):
+        """Ends the running stage, if any, and starts ``name``; the peak memory counters restart."""
+        self.end_stage()
+        self._synchronize()
+        if self.device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats(self.device)
+        self._stage = (name, self._now_us())
+
+    def end_stage(self):
+        if self._stage is None:
+            return
+        self._synchronize()
+        name, start_us = self._stage
+        end_us = self._now_us()
+        memory = {}
+        max_rss_mb = _max_rss_mb()
+        if max_rss_mb is not None:
+            memory["max_rss_mb"] = round(max_rss_mb, 1)
+        if self.device.type == "cuda":
+            memory["cuda_peak_allocated_mb"] = round(torch.cuda.max_memory_allocated(self.device) / 2**20, 1)
+            memory["cuda_peak_reserved_mb"] = round(torch.cuda.max_memory_reserved(self.device) / 2**20, 1)
+        self.add_event(name, "stage", start_us, end_us, memory)
+        # counter track, drawn as a memory graph under the stages
+        self.events.append(
+            {"name": "memory", "ph": "C", "ts": end_us, "pid": os.getpid(), "args": memory}
+        )
+        self._stage = None
+
+    def step_events(self, name, iterable: Iterable):
+        """Yields from ``iterable`` and records the time until the next item as one step."""
+        start_us, index = None, 0
+        try:
+            for index, item in enumerate(iterable):
+                if start_us is not None:
+                    self._synchronize()
+                    self.add_event(name, "step", start_us, self._now_us(), {"step": index - 1})
+                start_us = self._now_us()
+                yield item
+        finally:
+            # also runs when the loop breaks out early and the generator is closed
+            if start_us is not None:
+                self._synchronize()
+                self.add_event(name, "step", start_us, self._now_us(), {"step": index})
+
+    def _hook(self, name, category, first_module, last_module=None, args=None):
+        # the span runs from the forward of first_module to the end of the forward of last_module
+        last_module = last_module or first_module
+        key = id(first_module)
+
+        def pre_hook(module, inputs):
+            self._synchronize()
+            self._open_spans.setdefault(key, []).append(self._now_us())
+
+        def post_hook(module, inputs, output):
+            starts = self._open_spans.get(key)
+            if not starts:
+                return
+            self._synchronize()
+            self.add_event(name, category, starts.pop(), self._now_us(), args)
+
+        self._handles.append(first_module.register_forward_pre_hook(pre_hook))
+        self._handles.append(last_module.register_forward_hook(post_hook))
+
+    def instrument(self, pipeline):
+        """Hooks the models of ``pipeline``; models that were hooked before are skipped."""
+        if pipeline.torch_compile:
+            logger.warning("Profiling: hooks would break the compiled graphs, only stages and steps are traced")
+            return
+        transformer = pipeline.ace_step_transformer
+        if id(transformer) not in self._hooked:
+            self._hooked.add(id(transformer))
+            for index, block in enumerate(transformer.transformer_blocks):
+                self._hook(f"block{index}.self_attn", "transformer", block.attn, args={"block": index})
+                if getattr(block, "add_cross_attention", False):
+                    self._hook(f"block{index}.cross_attn", "transformer", block.cross_attn, args={"block": index})
+                self._hook(f"block{index}.ff", "transformer", block.ff, args={"block": index})
+            self._hook("lyric_encoder", "encoder", transformer.lyric_encoder)
+        text_encoder = pipeline.text_encoder_model
+        if id(text_encoder) not in self._hooked:
+            self._hooked.add(id(text_encoder))
+            self._hook("umt5", "encoder", text_encoder)
+        music_dcae = pipeline.music_dcae
+        if id(music_dcae) not in self._hooked:
+            self._hooked.add(id(music_dcae))
+            self._hook("dcae_window", "decoder", music_dcae.dcae.decoder)
+            # the vocoder is called through decode(), which bypasses its own forward hooks
+            self._hook("vocoder_window", "decoder", music_dcae.vocoder.backbone, music_dcae.vocoder.head)
+
+    def remove_hooks(self):
+        for handle in self._handles:
+            handle.remove()
+        self._handles = []
+        self._hooked = set()
+
+    def summary(self) -> Dict[str, float]:
+        """Total milliseconds per event name of the current trace."""
+        totals = {}
+        for event in self.events:
+            if event["ph"] == "X":
+                totals[event["name"]] = totals.get(event["name"], 0.0) + event["dur"] / 1000
+        return totals
+
+    def save(self) -> str:
+        self.end_stage()
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._trace_count += 1
+        now = time.time()
+        stamp = f"{time.strftime('%Y%m%d%H%M%S', time.localtime(now))}{int(now * 1000) % 1000:03d}"
+        path = os.path.join(self.output_dir, f"trace_{stamp}_{os.getpid()}_{self._trace_count}.json")
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+        stages = {event["name"]: round(event["dur"] / 1000, 1) for event in self.events if event.get("cat") == "stage"}
+        logger.info(f"Profile trace saved to {path}, stages (ms): {stages}")
+        return path
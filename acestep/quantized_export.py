@@ -0,0 +1,196 @@
+"""
+Local quantized checkpoints.
+
+``export_quantized_checkpoint`` quantizes the weights of the transformer and of UMT5 with torchao
+(int4 or int8 weight-only) and writes their state dicts, together with a manifest, into
+``<checkpoint_dir>/quantized/`` (or any other directory). ``load_quantized_component`` rebuilds
+a component from the config stored in the manifest without allocating float weights and assigns
+the quantized tensors, so nothing is downloaded and the float transformer is never read. The DCAE
+and the vocoder are small and stay in the float checkpoint.
+
+    python -m acestep.quantized_export --checkpoint_dir ~/.cache/ace-step/checkpoints --scheme int4wo
+"""
+
+import json
+import os
+import time
+from typing import Dict, Optional
+
+import click
+import torch
+from accelerate import init_empty_weights
+from loguru import logger
+
+from acestep.weight_bundles import COMPONENTS, build_empty_component, dtype_name, load_pretrained_component
+
+QUANTIZED_DIR_NAME = "quantized"
+MANIFEST_FILE_NAME = "manifest.json"
+MANIFEST_FORMAT_VERSION = "1"
+# components that are quantized, the DCAE and the vocoder are loaded from the float checkpoint
+QUANTIZED_COMPONENTS = ("ace_step_transformer", "text_encoder")
+# int4 uses the tinygemm layout, which is packed for the device it was quantized on
+SCHEMES = ("int4wo", "int8wo")
+DEVICE_BOUND_SCHEMES = ("int4wo",)
+
+
+def default_quantized_dir(checkpoint_dir) -> str:
+    return os.path.join(checkpoint_dir, QUANTIZED_DIR_NAME)
+
+
+def _quantization_config(scheme, group_size):
+    from torchao.quantization import Int4WeightOnlyConfig, Int8WeightOnlyConfig
+
+    if scheme == "int4wo":
+        return Int4WeightOnlyConfig(group_size=group_size, use_hqq=True)
+    if scheme == "int8wo":
+        return Int8WeightOnlyConfig()
+    raise ValueError(f"Unknown quantization scheme {scheme!r}, expected one of {SCHEMES}")
+
+
+def _state_dict_bytes(model: torch.nn.Module) -> int:
+    # plain tensors only, quantized tensor subclasses report the shape and dtype they stand for
+    return sum(tensor.nbytes for tensor in model.state_dict().values())
+
+
+def _config(model) -> Dict:
+    # transformers keeps the config on a separate object, diffusers models are their own config
+    config = model.config
+    return config.to_dict() if hasattr(config, "to_dict") else dict(config)
+
+
+def read_manifest(quantized_dir) -> Optional[Dict]:
+    """The manifest of an export in ``quantized_dir``, or None if there is no complete, readable one."""
+    path = os.path.join(quantized_dir, MANIFEST_FILE_NAME)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable quantized manifest {path}: {e}")
+        return None
+    if manifest.get("format_version") != MANIFEST_FORMAT_VERSION:
+        logger.warning(f"Ignoring quantized manifest of format {manifest.get('format_version')}: {path}")
+        return None
+    for component in QUANTIZED_COMPONENTS:
+        entry = manifest.get("components", {}).get(component)
+        if entry is None or not os.path.isfile(os.path.join(quantized_dir, entry["file"])):
+            logger.warning(f"Quantized export in {quantized_dir} has no {component} weights")
+            return None
+    return manifest
+
+
+def check_manifest(manifest: Dict, device, dtype) -> Optional[str]:
+    """Reason why the export cannot be loaded on ``device`` in ``dtype`` here, None if it can."""
+    if manifest["torch_version"] != torch.__version__:
+        return f"exported with torch {manifest['torch_version']}, running {torch.__version__}"
+    device = torch.device(device)
+    if manifest["scheme"] in DEVICE_BOUND_SCHEMES and manifest["device_type"] != device.type:
+        return f"{manifest['scheme']} weights are packed for {manifest['device_type']}, not {device.type}"
+    if manifest["dtype"] != dtype_name(dtype):
+        return f"exported for {manifest['dtype']}, the pipeline runs {dtype_name(dtype)}"
+    return None
+
+
+def load_quantized_component(quantized_dir, manifest: Dict, component, device) -> torch.nn.Module:
+    """Builds ``component`` without weights and assigns the quantized tensors of the export."""
+    entry = manifest["components"][component]
+    # torchao registers its tensor subclasses as safe globals for weights_only loading
+    state_dict = torch.load(os.path.join(quantized_dir, entry["file"]), map_location=device, weights_only=True)
+    with init_empty_weights():
+        model = build_empty_component(component, entry["config"])
+    model.load_state_dict(state_dict, strict=True, assign=True)
+    if hasattr(model, "tie_weights"):
+        model.tie_weights()
+    # CpuOffloader leaves models with this attribute where they are
+    model.torchao_quantized = True
+    return model.eval().requires_grad_(False)
+
+
+def export_quantized_checkpoint(
+    checkpoint_dir,
+    output_dir=None,
+    scheme="int4wo",
+    dtype=torch.bfloat16,
+    device=None,
+    group_size=128,
+) -> str:
+    """
+    Quantizes the transformer and UMT5 of ``checkpoint_dir`` and writes them with a manifest to
+    ``output_dir`` (default ``<checkpoint_dir>/quantized``). The manifest is written last, so an
+    interrupted export is never picked up by the loader. Returns the output directory.
+    """
+    from torchao.quantization import quantize_
+
+    output_dir = output_dir or default_quantized_dir(checkpoint_dir)
+    device = torch.device(device or ("cuda" if torch.cuda.is_available() else "cpu"))
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE_NAME)
+    if os.path.isfile(manifest_path):
+        os.remove(manifest_path)
+
+    components = {}
+    for component in QUANTIZED_COMPONENTS:
+        model = load_pretrained_component(component, os.path.join(checkpoint_dir, COMPONENTS[component]), dtype)
+        model = model.to(device).eval()
+        float_bytes = _state_dict_bytes(model)
+        quantize_(model, _quantization_config(scheme, group_size))
+        file_name = f"{component}_{scheme}.pt"
+        tmp_path = os.path.join(output_dir, file_name + ".tmp")
+        torch.save(model.state_dict(), tmp_path)
+        os.replace(tmp_path, os.path.join(output_dir, file_name))
+        components[component] = {
+            "file": file_name,
+            "config": _config(model),
+            "bytes": os.path.getsize(os.path.join(output_dir, file_name)),
+            "float_bytes": float_bytes,
+        }
+        logger.info(
+            f"{component}: {float_bytes / 2**30:.2f} GB -> {components[component]['bytes'] / 2**30:.2f} GB "
+            f"({scheme}), saved to {file_name}"
+        )
+        del model
+        if device.type == "cuda":
+            torch.cuda.empty_cache()
+
+    import torchao
+
+    manifest = {
+        "format_version": MANIFEST_FORMAT_VERSION,
+        "scheme": scheme,
+        "group_size": group_size if scheme == "int4wo" else None,
+        "dtype": dtype_name(dtype),
+        "device_type": device.type,
+        "torch_version": torch.__version__,
+        "torchao_version": torchao.__version__,
+        "source_checkpoint": os.path.abspath(checkpoint_dir),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "components": components,
+    }
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+    logger.info(f"Quantized checkpoint written to: {output_dir}")
+    return output_dir
+
+
+@click.command()
+@click.option(
+    "--checkpoint_dir", type=str, required=True, help="ACE-Step checkpoint, or the Hugging Face cache holding it"
+)
+@click.option("--output_dir", type=str, default=None, help="Default: <checkpoint>/quantized")
+@click.option("--scheme", type=click.Choice(SCHEMES), default="int4wo", help="int4wo needs CUDA")
+@click.option("--dtype", type=click.Choice(["bfloat16", "float16", "float32"]), default="bfloat16")
+@click.option("--device", type=str, default=None, help="Device the weights are packed for, default: cuda if available")
+@click.option("--group_size", type=int, default=128)
+def main(checkpoint_dir, output_dir, scheme, dtype, device, group_size):
+    # a Hugging Face cache directory resolves to its snapshot, where the loader looks for the export
+    from acestep.pipeline_ace_step import REPO_ID, ACEStepPipeline
+
+    checkpoint_dir = ACEStepPipeline.get_checkpoint_path(checkpoint_dir, REPO_ID, local_files_only=True)
+    export_quantized_checkpoint(checkpoint_dir, output_dir, scheme, getattr(torch, dtype), device, group_size)
+
+
+if __name__ == "__main__":
+    main()
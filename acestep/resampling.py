@@ -0,0 +1,101 @@
+"""
+Shared resampler registry.
+
+``torchaudio.transforms.Resample`` recomputes its sinc kernel on construction, so building one
+per call or per dataset item is wasted work. ``get_resampler`` keeps one module per
+``(orig_freq, new_freq, dtype, device)`` and ``resample`` applies it to any ``(..., time)``
+tensor, batch dimensions included. 44.1 kHz <-> 48 kHz, the conversion after every decode and
+before every encode, goes through a polyphase filter that only touches the non-zero taps of
+each output phase.
+"""
+
+import math
+import threading
+from typing import Dict, List, Tuple
+
+import torch
+import torch.nn.functional as F
+import torchaudio
+
+# conversions that take the polyphase path of ``resample``
+POLYPHASE_RATES = {(44100, 48000), (48000, 44100)}
+
+_resamplers: Dict[tuple, torchaudio.transforms.Resample] = {}
+_polyphase_filters: Dict[tuple, Tuple[List[int], torch.Tensor, int]] = {}
+_lock = threading.Lock()
+
+
+def get_resampler(orig_freq, new_freq, dtype=torch.float32, device="cpu") -> torchaudio.transforms.Resample:
+    """Cached ``Resample`` module for the conversion, with its kernel in ``dtype`` on ``device``."""
+    key = (int(orig_freq), int(new_freq), dtype, torch.device(device))
+    with _lock:
+        resampler = _resamplers.get(key)
+        if resampler is None:
+            resampler = torchaudio.transforms.Resample(int(orig_freq), int(new_freq))
+            resampler = resampler.to(device=device, dtype=dtype).eval()
+            _resamplers[key] = resampler
+    return resampler
+
+
+def _get_polyphase_filter(orig_freq, new_freq, dtype, device):
+    """
+    Splits the sinc kernel of ``get_resampler`` into one short filter per output phase:
+    (start offsets, taps of shape (phases, num_taps), padding width).
+    """
+    key = (int(orig_freq), int(new_freq), dtype, torch.device(device))
+    with _lock:
+        cached = _polyphase_filters.get(key)
+    if cached is not None:
+        return cached
+
+    resampler = get_resampler(orig_freq, new_freq, dtype, device)
+    kernel = resampler.kernel[:, 0]  # (new_freq / gcd, orig_freq / gcd + 2 * width)
+    kernel_len = kernel.shape[1]
+    nonzero = (kernel != 0).int()
+    starts = nonzero.argmax(dim=1)
+    ends = kernel_len - nonzero.flip(1).argmax(dim=1)
+    num_taps = int((ends - starts).max())
+    starts = starts.clamp(max=kernel_len - num_taps).tolist()
+    taps = torch.stack([kernel[phase, start : start + num_taps] for phase, start in enumerate(starts)])
+    cached = (starts, taps, resampler.width)
+    with _lock:
+        _polyphase_filters[key] = cached
+    return cached
+
+
+def _polyphase_resample(waveform, orig_freq, new_freq):
+    # same padding, block layout and output length as torchaudio's sinc resampling
+    gcd = math.gcd(int(orig_freq), int(new_freq))
+    orig_step = int(orig_freq) // gcd
+    new_step = int(new_freq) // gcd
+    starts, taps, width = _get_polyphase_filter(orig_freq, new_freq, waveform.dtype, waveform.device)
+
+    shape = waveform.shape
+    length = shape[-1]
+    x = F.pad(waveform.reshape(-1, length), (width, width + orig_step))
+    num_blocks = (x.shape[-1] - (orig_step + 2 * width)) // orig_step + 1
+    out = x.new_empty((x.shape[0], num_blocks, new_step))
+    for phase, start in enumerate(starts):
+        frames = x[:, start:].unfold(-1, taps.shape[1], orig_step)[:, :num_blocks]
+        out[:, :, phase] = frames @ taps[phase]
+    target_length = math.ceil(new_step * length / orig_step)
+    return out.reshape(x.shape[0], -1)[:, :target_length].reshape(shape[:-1] + (-1,))
+
+
+def resample(waveform: torch.Tensor, orig_freq, new_freq) -> torch.Tensor:
+    """
+    Resamples ``waveform`` of shape (..., time) from ``orig_freq`` to ``new_freq`` with a cached
+    kernel matching its dtype and device. All leading dimensions are resampled in one call.
+    """
+    if int(orig_freq) == int(new_freq):
+        return waveform
+    if (int(orig_freq), int(new_freq)) in POLYPHASE_RATES and waveform.is_floating_point():
+        return _polyphase_resample(waveform, orig_freq, new_freq)
+    return get_resampler(orig_freq, new_freq, waveform.dtype, waveform.device)(waveform)
+
+
+def clear_resampler_cache():
+    """Drops all cached kernels, e.g. before unloading a device."""
+    with _lock:
+        _resamplers.clear()
+        _polyphase_filters.clear()
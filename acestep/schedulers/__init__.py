@@ -1,9 +1,13 @@
 from .scheduling_flow_match_euler_discrete import FlowMatchEulerDiscreteScheduler
 from .scheduling_flow_match_heun_discrete import FlowMatchHeunDiscreteScheduler  
 from .scheduling_flow_match_pingpong import FlowMatchPingPongScheduler
+from .scheduling_flow_match_dpmsolver_multistep import FlowMatchDPMSolverMultistepScheduler
+from .scheduling_flow_match_adaptive import FlowMatchAdaptiveScheduler
 
 __all__ = [
     "FlowMatchEulerDiscreteScheduler",
     "FlowMatchHeunDiscreteScheduler", 
     "FlowMatchPingPongScheduler",
+    "FlowMatchDPMSolverMultistepScheduler",
+    "FlowMatchAdaptiveScheduler",
 ]
\ No newline at end of file
@@ -0,0 +1,118 @@
+"""
+ACE-Step: A Step Towards Music Generation Foundation Model
+
+https://github.com/ace-step/ACE-Step
+
+Apache 2.0 License
+"""
+
+import math
+from typing import Optional, Union
+
+import torch
+
+
+def logistic_function(x, L=0.9, U=1.1, x_0=0.0, k=1):
+    # L = Lower bound
+    # U = Upper bound
+    # x_0 = Midpoint (x corresponding to y = 1.0)
+    # k = Steepness, can adjust based on preference
+    if isinstance(x, torch.Tensor):
+        return L + (U - L) * torch.sigmoid(k * (x.to(torch.float32) - x_0))
+    if hasattr(x, "__len__"):
+        return L + (U - L) * torch.sigmoid(k * (torch.as_tensor(x, dtype=torch.float32) - x_0))
+    return L + (U - L) / (1 + math.exp(-k * (x - x_0)))
+
+
+class FusedFlowMatchStep:
+    """
+    Shared update of the flow-matching schedulers.
+
+    Built once per schedule: the sigmas are mirrored on the host so per-step scalars never need a device
+    sync, the rescaled omega is cached, and the update runs in-place in a float32 work buffer. The result
+    is written to one of two preallocated output buffers used in turn, so a returned sample stays valid
+    until the step after next. Clone it if it has to live longer than that.
+    """
+
+    def __init__(self, sigmas: Optional[torch.Tensor] = None):
+        # without sigmas (variable-step samplers) only the buffers and the omega rescale are used
+        self.sigmas = sigmas.to(torch.float32) if sigmas is not None else None
+        self.host_sigmas = self.sigmas.cpu().tolist() if sigmas is not None else []
+        self.sigma_deltas = [
+            sigma_next - sigma
+            for sigma, sigma_next in zip(self.host_sigmas[:-1], self.host_sigmas[1:])
+        ]
+        self._omega = None
+        self._rescaled_omega = None
+        self._work = None
+        self._noise = None
+        self._outputs = [None, None]
+        self._next_output = 0
+
+    def rescale_omega(self, omega: Union[float, torch.Tensor]):
+        if isinstance(omega, torch.Tensor) or hasattr(omega, "__len__"):
+            return logistic_function(omega, k=0.1)
+        if omega != self._omega:
+            self._omega = omega
+            self._rescaled_omega = logistic_function(omega, k=0.1)
+        return self._rescaled_omega
+
+    @staticmethod
+    def _ensure(buffer: Optional[torch.Tensor], like: torch.Tensor, dtype: torch.dtype):
+        if (
+            buffer is None
+            or buffer.shape != like.shape
+            or buffer.dtype != dtype
+            or buffer.device != like.device
+        ):
+            buffer = torch.empty(like.shape, dtype=dtype, device=like.device)
+        return buffer
+
+    def work_buffer(self, like: torch.Tensor) -> torch.Tensor:
+        self._work = self._ensure(self._work, like, torch.float32)
+        return self._work
+
+    def noise_buffer(self, like: torch.Tensor) -> torch.Tensor:
+        self._noise = self._ensure(self._noise, like, torch.float32)
+        return self._noise
+
+    def output(self, work: torch.Tensor, dtype: torch.dtype) -> torch.Tensor:
+        index = self._next_output
+        self._next_output = 1 - index
+        self._outputs[index] = self._ensure(self._outputs[index], work, dtype)
+        return self._outputs[index].copy_(work)
+
+    def mean_shift_update(
+        self,
+        sample: torch.Tensor,
+        direction: torch.Tensor,
+        scale: Union[float, torch.Tensor],
+        omega: Union[float, torch.Tensor],
+        out_dtype: torch.dtype,
+    ) -> torch.Tensor:
+        """
+        Computes ``sample + (dx - dx.mean()) * omega + dx.mean()`` with ``dx = scale * direction``
+        for the whole batch at once, without intermediate allocations.
+        """
+        work = self.work_buffer(direction)
+        work.copy_(direction)
+        mean = work.mean()
+        work.mul_(scale * omega).add_(sample)
+        work.add_(mean * (scale * (1 - omega)))
+        return self.output(work, out_dtype)
+
+    def pingpong(
+        self,
+        step_index: int,
+        sample: torch.Tensor,
+        model_output: torch.Tensor,
+        generator: Optional[torch.Generator] = None,
+    ) -> torch.Tensor:
+        """``(1 - sigma_next) * (sample - sigma * model_output) + sigma_next * noise``"""
+        sigma = self.host_sigmas[step_index]
+        sigma_next = self.host_sigmas[step_index + 1]
+        work = self.work_buffer(model_output)
+        work.copy_(model_output).mul_(-sigma).add_(sample).mul_(1 - sigma_next)
+        noise = self.noise_buffer(model_output).normal_(generator=generator)
+        work.add_(noise, alpha=sigma_next)
+        return self.output(work, model_output.dtype)
@@ -0,0 +1,278 @@
+# Copyright 2024 Stability AI, Katherine Crowson and The HuggingFace Team. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import torch
+
+from diffusers.configuration_utils import ConfigMixin, register_to_config
+from diffusers.utils import BaseOutput, logging
+from diffusers.schedulers.scheduling_utils import SchedulerMixin
+
+from .flow_match_fused_step import FusedFlowMatchStep
+
+
+logger = logging.get_logger(__name__)  # pylint: disable=invalid-name
+
+
+@dataclass
+class FlowMatchAdaptiveSchedulerOutput(BaseOutput):
+    """
+    Output class for the scheduler's `step` function output.
+
+    Args:
+        prev_sample (`torch.FloatTensor` of shape `(batch_size, num_channels, height, width)` for images):
+            Computed sample `(x_{t-1})` of previous timestep. `prev_sample` should be used as next model input in the
+            denoising loop.
+    """
+
+    prev_sample: torch.FloatTensor
+
+
+class FlowMatchAdaptiveScheduler(SchedulerMixin, ConfigMixin):
+    """
+    Error-controlled variable-step sampler for the flow-matching ODE.
+
+    Every step evaluates the model once. The update pairs Euler with a variable-step Adams-Bashforth 2 estimate
+    built from the previous velocity, and their difference is the local error estimate. A step is accepted with the
+    AB2 result when the scaled error is at most 1, and the next step size comes from a PI controller. A rejected
+    step is retried with a smaller step from the same velocities, without another model evaluation. Step sizes are
+    controlled in the unshifted time, so `shift` still concentrates steps where the fixed schedules put them, and
+    `max_evals` caps the evaluations of one generation.
+
+    The timesteps are not known in advance: iterate `iter_timesteps()` and call `step` once per timestep.
+
+    Args:
+        num_train_timesteps (`int`, defaults to 1000):
+            The number of diffusion steps to train the model.
+        shift (`float`, defaults to 1.0):
+            The shift value for the timestep schedule.
+        sigma_max (`float`, defaults to 1.0):
+            Unshifted time the trajectory starts from.
+        rtol (`float`, defaults to 0.05):
+            Relative tolerance of the local error.
+        atol (`float`, defaults to 0.05):
+            Absolute tolerance of the local error.
+        max_evals (`int`, defaults to 60):
+            Maximum number of model evaluations, the last steps are stretched to reach the end within it.
+        safety (`float`, defaults to 0.9):
+            Safety factor of the step size controller.
+        min_factor (`float`, defaults to 0.2):
+            Smallest step size change per step.
+        max_factor (`float`, defaults to 5.0):
+            Largest step size change per step.
+    """
+
+    _compatibles = []
+    order = 1
+
+    @register_to_config
+    def __init__(
+        self,
+        num_train_timesteps: int = 1000,
+        shift: float = 1.0,
+        sigma_max: Optional[float] = 1.0,
+        rtol: float = 0.05,
+        atol: float = 0.05,
+        max_evals: int = 60,
+        safety: float = 0.9,
+        min_factor: float = 0.2,
+        max_factor: float = 5.0,
+    ):
+        self.timesteps = None
+        self.num_inference_steps = None
+        self._fused_step = None
+        self._device = None
+        self._reset(initial_steps=max_evals)
+
+    def _reset(self, initial_steps: int):
+        self._u = self.config.sigma_max
+        self._h = self.config.sigma_max / max(initial_steps, 1)
+        self._prev_velocity = None
+        self._prev_delta = None
+        self._prev_error = None
+        self.num_evals = 0
+        self.num_rejected = 0
+        self.finished = False
+
+    def _sigma(self, u: float) -> float:
+        shift = self.config.shift
+        return shift * u / (1 + (shift - 1) * u)
+
+    @property
+    def step_index(self):
+        """
+        Number of steps taken so far.
+        """
+        return self.num_evals
+
+    @property
+    def progress(self) -> float:
+        """
+        Fraction of the unshifted trajectory already covered, 0 at the start and 1 at the end. This is what the
+        step index over the step count is for the fixed schedules, e.g. for the guidance interval.
+        """
+        return 1.0 - self._u / self.config.sigma_max
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "evaluations": self.num_evals,
+            "rejected_steps": self.num_rejected,
+        }
+
+    def set_timesteps(
+        self,
+        num_inference_steps: int = None,
+        device: Union[str, torch.device] = None,
+        sigmas: Optional[List[float]] = None,
+        mu: Optional[float] = None,
+    ):
+        """
+        Resets the sampler. `num_inference_steps` only sets the initial step size, `self.timesteps` holds the matching
+        fixed grid for callers that need a nominal schedule.
+
+        Args:
+            num_inference_steps (`int`):
+                Step count whose uniform step size the controller starts from.
+            device (`str` or `torch.device`, *optional*):
+                The device to which the timesteps should be moved to. If `None`, the timesteps are not moved.
+        """
+        if sigmas is not None:
+            raise ValueError("FlowMatchAdaptiveScheduler chooses its own timesteps, custom sigmas are not supported")
+
+        self.num_inference_steps = num_inference_steps
+        self._device = device
+        u = np.linspace(self.config.sigma_max, 1.0 / self.config.num_train_timesteps, num_inference_steps)
+        sigmas = torch.from_numpy(np.array([self._sigma(value) for value in u])).to(dtype=torch.float32, device=device)
+        self.timesteps = sigmas * self.config.num_train_timesteps
+        self._fused_step = None
+        self._reset(initial_steps=num_inference_steps)
+
+    def iter_timesteps(self) -> Iterator[torch.Tensor]:
+        """Yields the current timestep until the trajectory reaches sigma 0, `step` must be called in between."""
+        while not self.finished:
+            yield torch.tensor(
+                self._sigma(self._u) * self.config.num_train_timesteps,
+                dtype=torch.float32,
+                device=self._device,
+            )
+
+    def _get_fused_step(self):
+        if self._fused_step is None:
+            self._fused_step = FusedFlowMatchStep()
+        return self._fused_step
+
+    def step(
+        self,
+        model_output: torch.FloatTensor,
+        timestep: Union[float, torch.FloatTensor],
+        sample: torch.FloatTensor,
+        generator: Optional[torch.Generator] = None,
+        return_dict: bool = True,
+        omega: Union[float, np.array] = 0.0,
+    ) -> Union[FlowMatchAdaptiveSchedulerOutput, Tuple]:
+        """
+        Advance the sample by one accepted step.
+
+        Args:
+            model_output (`torch.FloatTensor`):
+                The direct output (velocity) from learned diffusion model.
+            timestep (`float`):
+                The current timestep, as yielded by `iter_timesteps`.
+            sample (`torch.FloatTensor`):
+                A current instance of a sample created by the diffusion process.
+            generator (`torch.Generator`, *optional*):
+                Unused, the sampler is deterministic.
+            return_dict (`bool`):
+                Whether or not to return a [`FlowMatchAdaptiveSchedulerOutput`] or tuple.
+            omega (`float`):
+                Mean shift strength, as in [`FlowMatchEulerDiscreteScheduler.step`].
+
+        Returns:
+            [`FlowMatchAdaptiveSchedulerOutput`] or `tuple`:
+                If return_dict is `True`, [`FlowMatchAdaptiveSchedulerOutput`] is returned, otherwise a tuple is
+                returned where the first element is the sample tensor.
+        """
+        if self.finished:
+            raise ValueError("The trajectory already reached sigma 0, call `set_timesteps` to start a new one")
+
+        fused_step = self._get_fused_step()
+
+        self.omega_bef_rescale = omega
+        omega = fused_step.rescale_omega(omega)
+        self.omega_aft_rescale = omega
+
+        # Upcast to avoid precision issues when computing prev_sample
+        sample = sample.to(torch.float32)
+        velocity = model_output.to(torch.float32)
+        self.num_evals += 1
+
+        u = self._u
+        sigma = self._sigma(u)
+        # smallest step that still reaches u == 0 within the remaining evaluations
+        remaining = self.config.max_evals - self.num_evals
+        h_floor = u if remaining <= 0 else u / (remaining + 1)
+        h = min(max(self._h, h_floor), u)
+
+        error = None
+        while True:
+            u_next = u - h if u - h > 1e-6 else 0.0
+            delta = self._sigma(u_next) - sigma
+            if self._prev_velocity is None:
+                # nothing to compare with yet, plain Euler
+                dx = delta * velocity
+                break
+            ratio = delta / self._prev_delta
+            # AB2 - Euler, the local error estimate
+            difference = (0.5 * ratio * delta) * (velocity - self._prev_velocity)
+            scale = self.config.atol + self.config.rtol * sample.abs()
+            error = (difference / scale).square().mean().sqrt().item()
+            if error <= 1.0 or h <= h_floor:
+                dx = delta * velocity + difference
+                break
+            self.num_rejected += 1
+            h = max(h * max(self.config.min_factor, self.config.safety * error ** -0.5), h_floor)
+
+        # PI controller for the next step size
+        if error is not None:
+            if error == 0.0:
+                factor = self.config.max_factor
+            else:
+                factor = self.config.safety * error ** -0.35
+                if self._prev_error:
+                    factor *= self._prev_error ** 0.2
+                factor = min(self.config.max_factor, max(self.config.min_factor, factor))
+            self._h = h * factor
+            self._prev_error = max(error, 1e-4)
+        else:
+            self._h = h
+
+        self._prev_velocity = velocity
+        self._prev_delta = delta
+        self._u = u_next
+        self.finished = u_next == 0.0
+
+        # mean shift of the update, as in the Euler scheduler
+        prev_sample = fused_step.mean_shift_update(sample, dx, 1.0, omega, model_output.dtype)
+
+        if not return_dict:
+            return (prev_sample,)
+
+        return FlowMatchAdaptiveSchedulerOutput(prev_sample=prev_sample)
+
+    def __len__(self):
+        return self.config.num_train_timesteps
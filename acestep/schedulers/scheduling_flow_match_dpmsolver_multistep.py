@@ -0,0 +1,409 @@
+# Copyright 2024 Stability AI, Katherine Crowson and The HuggingFace Team. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+from dataclasses import dataclass
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+import torch
+
+from diffusers.configuration_utils import ConfigMixin, register_to_config
+from diffusers.utils import BaseOutput, logging
+from diffusers.schedulers.scheduling_utils import SchedulerMixin
+
+from .flow_match_fused_step import FusedFlowMatchStep
+
+
+logger = logging.get_logger(__name__)  # pylint: disable=invalid-name
+
+
+@dataclass
+class FlowMatchDPMSolverMultistepSchedulerOutput(BaseOutput):
+    """
+    Output class for the scheduler's `step` function output.
+
+    Args:
+        prev_sample (`torch.FloatTensor` of shape `(batch_size, num_channels, height, width)` for images):
+            Computed sample `(x_{t-1})` of previous timestep. `prev_sample` should be used as next model input in the
+            denoising loop.
+    """
+
+    prev_sample: torch.FloatTensor
+
+
+class FlowMatchDPMSolverMultistepScheduler(SchedulerMixin, ConfigMixin):
+    """
+    DPM-Solver++ multistep scheduler for the flow-matching ODE.
+
+    With `x_t = (1 - sigma) * x_0 + sigma * noise` the velocity predicted by the model gives the data prediction
+    `x_0 = x_t - sigma * v`, and the solver integrates in `lambda = log((1 - sigma) / sigma)` reusing the data
+    predictions of the previous steps (2M / 3M). Each step costs a single model evaluation, so 10-15 steps get
+    close to what Euler needs ~27 for. The `omega` mean shift of the Euler scheduler is applied to the update.
+
+    This model inherits from [`SchedulerMixin`] and [`ConfigMixin`]. Check the superclass documentation for the generic
+    methods the library implements for all schedulers such as loading and saving.
+
+    Args:
+        num_train_timesteps (`int`, defaults to 1000):
+            The number of diffusion steps to train the model.
+        timestep_spacing (`str`, defaults to `"linspace"`):
+            The way the timesteps should be scaled. Refer to Table 2 of the [Common Diffusion Noise Schedules and
+            Sample Steps are Flawed](https://huggingface.co/papers/2305.08891) for more information.
+        shift (`float`, defaults to 1.0):
+            The shift value for the timestep schedule.
+        solver_order (`int`, defaults to 2):
+            Order of the multistep solver, 1, 2 or 3.
+        lower_order_final (`bool`, defaults to `True`):
+            Whether to lower the order on the last steps, which keeps short schedules stable.
+    """
+
+    _compatibles = []
+    order = 1
+
+    @register_to_config
+    def __init__(
+        self,
+        num_train_timesteps: int = 1000,
+        shift: float = 1.0,
+        use_dynamic_shifting=False,
+        base_shift: Optional[float] = 0.5,
+        max_shift: Optional[float] = 1.15,
+        base_image_seq_len: Optional[int] = 256,
+        max_image_seq_len: Optional[int] = 4096,
+        sigma_max: Optional[float] = 1.0,
+        solver_order: int = 2,
+        lower_order_final: bool = True,
+    ):
+        if solver_order not in (1, 2, 3):
+            raise ValueError(f"solver_order must be 1, 2 or 3, got {solver_order}")
+
+        timesteps = np.linspace(
+            1.0, sigma_max*num_train_timesteps, num_train_timesteps, dtype=np.float32
+        )[::-1].copy()
+        timesteps = torch.from_numpy(timesteps).to(dtype=torch.float32)
+
+        sigmas = timesteps / num_train_timesteps
+        if not use_dynamic_shifting:
+            # when use_dynamic_shifting is True, we apply the timestep shifting on the fly based on the image resolution
+            sigmas = shift * sigmas / (1 + (shift - 1) * sigmas)
+
+        self.timesteps = sigmas * num_train_timesteps
+
+        self._step_index = None
+        self._begin_index = None
+        self._fused_step = None
+        self.model_outputs = []
+
+        self.sigmas = sigmas.to("cpu")  # to avoid too much CPU/GPU communication
+        self.sigma_min = self.sigmas[-1].item()
+        self.sigma_max = self.sigmas[0].item()
+
+    @property
+    def step_index(self):
+        """
+        The index counter for current timestep. It will increase 1 after each scheduler step.
+        """
+        return self._step_index
+
+    @property
+    def begin_index(self):
+        """
+        The index for the first timestep. It should be set from pipeline with `set_begin_index` method.
+        """
+        return self._begin_index
+
+    # Copied from diffusers.schedulers.scheduling_dpmsolver_multistep.DPMSolverMultistepScheduler.set_begin_index
+    def set_begin_index(self, begin_index: int = 0):
+        """
+        Sets the begin index for the scheduler. This function should be run from pipeline before the inference.
+
+        Args:
+            begin_index (`int`):
+                The begin index for the scheduler.
+        """
+        self._begin_index = begin_index
+
+    def scale_noise(
+        self,
+        sample: torch.FloatTensor,
+        timestep: Union[float, torch.FloatTensor],
+        noise: Optional[torch.FloatTensor] = None,
+    ) -> torch.FloatTensor:
+        """
+        Forward process in flow-matching
+
+        Args:
+            sample (`torch.FloatTensor`):
+                The input sample.
+            timestep (`int`, *optional*):
+                The current timestep in the diffusion chain.
+
+        Returns:
+            `torch.FloatTensor`:
+                A scaled input sample.
+        """
+        # Make sure sigmas and timesteps have the same device and dtype as original_samples
+        sigmas = self.sigmas.to(device=sample.device, dtype=sample.dtype)
+
+        if sample.device.type == "mps" and torch.is_floating_point(timestep):
+            # mps does not support float64
+            schedule_timesteps = self.timesteps.to(sample.device, dtype=torch.float32)
+            timestep = timestep.to(sample.device, dtype=torch.float32)
+        else:
+            schedule_timesteps = self.timesteps.to(sample.device)
+            timestep = timestep.to(sample.device)
+
+        # self.begin_index is None when scheduler is used for training, or pipeline does not implement set_begin_index
+        if self.begin_index is None:
+            step_indices = [
+                self.index_for_timestep(t, schedule_timesteps) for t in timestep
+            ]
+        elif self.step_index is not None:
+            # add_noise is called after first denoising step (for inpainting)
+            step_indices = [self.step_index] * timestep.shape[0]
+        else:
+            # add noise is called before first denoising step to create initial latent(img2img)
+            step_indices = [self.begin_index] * timestep.shape[0]
+
+        sigma = sigmas[step_indices].flatten()
+        while len(sigma.shape) < len(sample.shape):
+            sigma = sigma.unsqueeze(-1)
+
+        sample = sigma * noise + (1.0 - sigma) * sample
+
+        return sample
+
+    def _sigma_to_t(self, sigma):
+        return sigma * self.config.num_train_timesteps
+
+    def time_shift(self, mu: float, sigma: float, t: torch.Tensor):
+        return math.exp(mu) / (math.exp(mu) + (1 / t - 1) ** sigma)
+
+    def set_timesteps(
+        self,
+        num_inference_steps: int = None,
+        device: Union[str, torch.device] = None,
+        sigmas: Optional[List[float]] = None,
+        mu: Optional[float] = None,
+    ):
+        """
+        Sets the discrete timesteps used for the diffusion chain (to be run before inference).
+
+        Args:
+            num_inference_steps (`int`):
+                The number of diffusion steps used when generating samples with a pre-trained model.
+            device (`str` or `torch.device`, *optional*):
+                The device to which the timesteps should be moved to. If `None`, the timesteps are not moved.
+        """
+
+        if self.config.use_dynamic_shifting and mu is None:
+            raise ValueError(
+                " you have a pass a value for `mu` when `use_dynamic_shifting` is set to be `True`"
+            )
+
+        if sigmas is None:
+            self.num_inference_steps = num_inference_steps
+            timesteps = np.linspace(
+                self._sigma_to_t(self.sigma_max),
+                self._sigma_to_t(self.sigma_min),
+                num_inference_steps,
+            )
+
+            sigmas = timesteps / self.config.num_train_timesteps
+
+        if self.config.use_dynamic_shifting:
+            sigmas = self.time_shift(mu, 1.0, sigmas)
+        else:
+            sigmas = self.config.shift * sigmas / (1 + (self.config.shift - 1) * sigmas)
+
+        sigmas = torch.from_numpy(sigmas).to(dtype=torch.float32, device=device)
+        timesteps = sigmas * self.config.num_train_timesteps
+
+        self.timesteps = timesteps.to(device=device)
+        self.sigmas = torch.cat([sigmas, torch.zeros(1, device=sigmas.device)])
+
+        self._step_index = None
+        self._begin_index = None
+        self._fused_step = None
+        self.model_outputs = []
+
+    def index_for_timestep(self, timestep, schedule_timesteps=None):
+        if schedule_timesteps is None:
+            schedule_timesteps = self.timesteps
+
+        indices = (schedule_timesteps == timestep).nonzero()
+
+        # The sigma index that is taken for the **very** first `step`
+        # is always the second index (or the last index if there is only 1)
+        # This way we can ensure we don't accidentally skip a sigma in
+        # case we start in the middle of the denoising schedule (e.g. for image-to-image)
+        pos = 1 if len(indices) > 1 else 0
+
+        return indices[pos].item()
+
+    def _init_step_index(self, timestep):
+        if self.begin_index is None:
+            if isinstance(timestep, torch.Tensor):
+                timestep = timestep.to(self.timesteps.device)
+            self._step_index = self.index_for_timestep(timestep)
+        else:
+            self._step_index = self._begin_index
+
+    def _get_fused_step(self):
+        if self._fused_step is None:
+            self._fused_step = FusedFlowMatchStep(self.sigmas)
+        return self._fused_step
+
+    def _lambda(self, sigma: float) -> float:
+        if sigma <= 0.0:
+            return math.inf
+        if sigma >= 1.0:
+            return -math.inf
+        return math.log(1.0 - sigma) - math.log(sigma)
+
+    def _multistep_update(self, sample, sigmas, step_order):
+        """
+        DPM-Solver++ update from `sigmas[0]` to `sigmas[-1]` using the last `step_order` data predictions,
+        in float32. `sigmas` holds the current and previous sigmas (most recent first) followed by the next one.
+        """
+        sigma_s0, sigma_t = sigmas[0], sigmas[-1]
+        alpha_s0, alpha_t = 1.0 - sigma_s0, 1.0 - sigma_t
+        m0 = self.model_outputs[-1]
+
+        # first order written without lambdas, so it also covers sigma == 1 and sigma_next == 0:
+        # alpha_t * (exp(-h) - 1) == alpha_s0 * sigma_t / sigma_s0 - alpha_t
+        x_t = (sigma_t / sigma_s0) * sample - (alpha_s0 * sigma_t / sigma_s0 - alpha_t) * m0
+        if step_order == 1:
+            return x_t
+
+        lambda_t = self._lambda(sigma_t)
+        lambda_s0 = self._lambda(sigma_s0)
+        lambda_s1 = self._lambda(sigmas[1])
+        h = lambda_t - lambda_s0
+        exp_h = math.exp(-h)
+        m1 = self.model_outputs[-2]
+        r0 = (lambda_s0 - lambda_s1) / h
+        if step_order == 2:
+            D1 = (1.0 / r0) * (m0 - m1)
+            return x_t - 0.5 * (alpha_t * (exp_h - 1.0)) * D1
+
+        lambda_s2 = self._lambda(sigmas[2])
+        m2 = self.model_outputs[-3]
+        r1 = (lambda_s1 - lambda_s2) / h
+        D1_0 = (1.0 / r0) * (m0 - m1)
+        D1_1 = (1.0 / r1) * (m1 - m2)
+        D1 = D1_0 + (r0 / (r0 + r1)) * (D1_0 - D1_1)
+        D2 = (1.0 / (r0 + r1)) * (D1_0 - D1_1)
+        return (
+            x_t
+            + (alpha_t * ((exp_h - 1.0) / h + 1.0)) * D1
+            - (alpha_t * ((exp_h - 1.0 + h) / h**2 - 0.5)) * D2
+        )
+
+    def step(
+        self,
+        model_output: torch.FloatTensor,
+        timestep: Union[float, torch.FloatTensor],
+        sample: torch.FloatTensor,
+        generator: Optional[torch.Generator] = None,
+        return_dict: bool = True,
+        omega: Union[float, np.array] = 0.0,
+    ) -> Union[FlowMatchDPMSolverMultistepSchedulerOutput, Tuple]:
+        """
+        Predict the sample from the previous timestep with the multistep solver.
+
+        Args:
+            model_output (`torch.FloatTensor`):
+                The direct output (velocity) from learned diffusion model.
+            timestep (`float`):
+                The current discrete timestep in the diffusion chain.
+            sample (`torch.FloatTensor`):
+                A current instance of a sample created by the diffusion process.
+            generator (`torch.Generator`, *optional*):
+                Unused, the solver is deterministic.
+            return_dict (`bool`):
+                Whether or not to return a [`FlowMatchDPMSolverMultistepSchedulerOutput`] or tuple.
+            omega (`float`):
+                Mean shift strength, as in [`FlowMatchEulerDiscreteScheduler.step`].
+
+        Returns:
+            [`FlowMatchDPMSolverMultistepSchedulerOutput`] or `tuple`:
+                If return_dict is `True`, [`FlowMatchDPMSolverMultistepSchedulerOutput`] is returned, otherwise a
+                tuple is returned where the first element is the sample tensor.
+        """
+
+        fused_step = self._get_fused_step()
+
+        self.omega_bef_rescale = omega
+        omega = fused_step.rescale_omega(omega)
+        self.omega_aft_rescale = omega
+
+        if (
+            isinstance(timestep, int)
+            or isinstance(timestep, torch.IntTensor)
+            or isinstance(timestep, torch.LongTensor)
+        ):
+            raise ValueError(
+                (
+                    "Passing integer indices (e.g. from `enumerate(timesteps)`) as timesteps to"
+                    " `FlowMatchDPMSolverMultistepScheduler.step()` is not supported. Make sure to pass"
+                    " one of the `scheduler.timesteps` as a timestep."
+                ),
+            )
+
+        if self.step_index is None:
+            self._init_step_index(timestep)
+
+        # Upcast to avoid precision issues when computing prev_sample
+        sample = sample.to(torch.float32)
+        sigma = fused_step.host_sigmas[self.step_index]
+        sigma_next = fused_step.host_sigmas[self.step_index + 1]
+
+        # data prediction x_0 = x_t - sigma * v
+        self.model_outputs.append(sample - sigma * model_output.to(torch.float32))
+        self.model_outputs = self.model_outputs[-self.config.solver_order :]
+
+        # previous sigmas with a finite lambda only, sigma == 1 has none
+        history = [sigma]
+        for offset in range(1, len(self.model_outputs)):
+            previous_sigma = fused_step.host_sigmas[self.step_index - offset]
+            if previous_sigma >= 1.0:
+                break
+            history.append(previous_sigma)
+        step_order = len(history)
+        if sigma_next <= 0.0:
+            step_order = 1
+        elif self.config.lower_order_final:
+            step_order = min(step_order, len(fused_step.host_sigmas) - 1 - self.step_index)
+        if sigma >= 1.0:
+            step_order = 1
+
+        x_t = self._multistep_update(sample, history[:step_order] + [sigma_next], step_order)
+
+        # mean shift of the update, as in the Euler scheduler
+        prev_sample = fused_step.mean_shift_update(
+            sample, x_t - sample, 1.0, omega, model_output.dtype
+        )
+
+        # upon completion increase step index by one
+        self._step_index += 1
+
+        if not return_dict:
+            return (prev_sample,)
+
+        return FlowMatchDPMSolverMultistepSchedulerOutput(prev_sample=prev_sample)
+
+    def __len__(self):
+        return self.config.num_train_timesteps
@@ -23,6 +23,8 @@ from diffusers.configuration_utils import ConfigMixin, register_to_config
 from diffusers.utils import BaseOutput, logging
 from diffusers.schedulers.scheduling_utils import SchedulerMixin
 
+from .flow_match_fused_step import FusedFlowMatchStep
+
 
 logger = logging.get_logger(__name__)  # pylint: disable=invalid-name
 
@@ -87,6 +89,7 @@ class FlowMatchEulerDiscreteScheduler(SchedulerMixin, ConfigMixin):
 
         self._step_index = None
         self._begin_index = None
+        self._fused_step = None
 
         self.sigmas = sigmas.to("cpu")  # to avoid too much CPU/GPU communication
         self.sigma_min = self.sigmas[-1].item()
@@ -218,6 +221,7 @@ class FlowMatchEulerDiscreteScheduler(SchedulerMixin, ConfigMixin):
 
         self._step_index = None
         self._begin_index = None
+        self._fused_step = None
 
     def index_for_timestep(self, timestep, schedule_timesteps=None):
         if schedule_timesteps is None:
@@ -241,6 +245,11 @@ class FlowMatchEulerDiscreteScheduler(SchedulerMixin, ConfigMixin):
         else:
             self._step_index = self._begin_index
 
+    def _get_fused_step(self):
+        if self._fused_step is None:
+            self._fused_step = FusedFlowMatchStep(self.sigmas)
+        return self._fused_step
+
     def step(
         self,
         model_output: torch.FloatTensor,
@@ -282,24 +291,10 @@ class FlowMatchEulerDiscreteScheduler(SchedulerMixin, ConfigMixin):
                 returned, otherwise a tuple is returned where the first element is the sample tensor.
         """
 
-        def logistic_function(x, L=0.9, U=1.1, x_0=0.0, k=1):
-            # L = Lower bound
-            # U = Upper bound
-            # x_0 = Midpoint (x corresponding to y = 1.0)
-            # k = Steepness, can adjust based on preference
-
-            if isinstance(x, torch.Tensor):
-                device_ = x.device
-                x = x.to(torch.float).cpu().numpy()
-
-            new_x = L + (U - L) / (1 + np.exp(-k * (x - x_0)))
-
-            if isinstance(new_x, np.ndarray):
-                new_x = torch.from_numpy(new_x).to(device_)
-            return new_x
+        fused_step = self._get_fused_step()
 
         self.omega_bef_rescale = omega
-        omega = logistic_function(omega, k=0.1)
+        omega = fused_step.rescale_omega(omega)
         self.omega_aft_rescale = omega
 
         if (
@@ -318,21 +313,17 @@ class FlowMatchEulerDiscreteScheduler(SchedulerMixin, ConfigMixin):
         if self.step_index is None:
             self._init_step_index(timestep)
 
-        # Upcast to avoid precision issues when computing prev_sample
-        sample = sample.to(torch.float32)
-
-        sigma = self.sigmas[self.step_index]
-        sigma_next = self.sigmas[self.step_index + 1]
-
         ## --
-        ## mean shift 1
-        dx = (sigma_next - sigma) * model_output
-        m = dx.mean()
-        # print(dx.shape) # torch.Size([1, 16, 128, 128])
-        # print(f'm: {m}') # m: -0.0014209747314453125
-        # raise NotImplementedError
-        dx_ = (dx - m) * omega + m
-        prev_sample = sample + dx_
+        ## mean shift 1, computed in float32 without intermediate tensors:
+        ## dx = (sigma_next - sigma) * model_output
+        ## prev_sample = sample + (dx - dx.mean()) * omega + dx.mean()
+        prev_sample = fused_step.mean_shift_update(
+            sample,
+            model_output,
+            fused_step.sigma_deltas[self.step_index],
+            omega,
+            model_output.dtype,
+        )
 
         # ## --
         # ## mean shift 2
@@ -388,9 +379,6 @@ class FlowMatchEulerDiscreteScheduler(SchedulerMixin, ConfigMixin):
         # prev_sample = sample + (sigma_next - sigma) * model_output * omega
         # # raise NotImplementedError
 
-        # Cast sample back to model compatible dtype
-        prev_sample = prev_sample.to(model_output.dtype)
-
         # upon completion increase step index by one
         self._step_index += 1
 
@@ -23,6 +23,8 @@ from diffusers.utils import BaseOutput, logging
 from diffusers.utils.torch_utils import randn_tensor
 from diffusers.schedulers.scheduling_utils import SchedulerMixin
 
+from .flow_match_fused_step import FusedFlowMatchStep
+
 
 logger = logging.get_logger(__name__)  # pylint: disable=invalid-name
 
@@ -80,6 +82,7 @@ class FlowMatchHeunDiscreteScheduler(SchedulerMixin, ConfigMixin):
 
         self._step_index = None
         self._begin_index = None
+        self._fused_step = None
 
         self.sigmas = sigmas.to("cpu")  # to avoid too much CPU/GPU communication
         self.sigma_min = self.sigmas[-1].item()
@@ -179,6 +182,7 @@ class FlowMatchHeunDiscreteScheduler(SchedulerMixin, ConfigMixin):
 
         self._step_index = None
         self._begin_index = None
+        self._fused_step = None
 
     def index_for_timestep(self, timestep, schedule_timesteps=None):
         if schedule_timesteps is None:
@@ -206,6 +210,11 @@ class FlowMatchHeunDiscreteScheduler(SchedulerMixin, ConfigMixin):
     def state_in_first_order(self):
         return self.dt is None
 
+    def _get_fused_step(self):
+        if self._fused_step is None:
+            self._fused_step = FusedFlowMatchStep(self.sigmas)
+        return self._fused_step
+
     def step(
         self,
         model_output: torch.FloatTensor,
@@ -247,24 +256,10 @@ class FlowMatchHeunDiscreteScheduler(SchedulerMixin, ConfigMixin):
                 returned, otherwise a tuple is returned where the first element is the sample tensor.
         """
 
-        def logistic_function(x, L=0.9, U=1.1, x_0=0.0, k=1):
-            # L = Lower bound
-            # U = Upper bound
-            # x_0 = Midpoint (x corresponding to y = 1.0)
-            # k = Steepness, can adjust based on preference
-
-            if isinstance(x, torch.Tensor):
-                device_ = x.device
-                x = x.to(torch.float).cpu().numpy()
-
-            new_x = L + (U - L) / (1 + np.exp(-k * (x - x_0)))
-
-            if isinstance(new_x, np.ndarray):
-                new_x = torch.from_numpy(new_x).to(device_)
-            return new_x
+        fused_step = self._get_fused_step()
 
         self.omega_bef_rescale = omega
-        omega = logistic_function(omega, k=0.1)
+        omega = fused_step.rescale_omega(omega)
         self.omega_aft_rescale = omega
 
         if (
@@ -286,13 +281,14 @@ class FlowMatchHeunDiscreteScheduler(SchedulerMixin, ConfigMixin):
         # Upcast to avoid precision issues when computing prev_sample
         sample = sample.to(torch.float32)
 
+        # host copies of the sigmas keep gamma and dt as python floats, without a device sync per step
         if self.state_in_first_order:
-            sigma = self.sigmas[self.step_index]
-            sigma_next = self.sigmas[self.step_index + 1]
+            sigma = fused_step.host_sigmas[self.step_index]
+            sigma_next = fused_step.host_sigmas[self.step_index + 1]
         else:
             # 2nd order / Heun's method
-            sigma = self.sigmas[self.step_index - 1]
-            sigma_next = self.sigmas[self.step_index]
+            sigma = fused_step.host_sigmas[self.step_index - 1]
+            sigma_next = fused_step.host_sigmas[self.step_index]
 
         gamma = (
             min(s_churn / (len(self.sigmas) - 1), 2**0.5 - 1)
@@ -344,13 +340,10 @@ class FlowMatchHeunDiscreteScheduler(SchedulerMixin, ConfigMixin):
         # original sample way
         # prev_sample = sample + derivative * dt
 
-        dx = derivative * dt
-        m = dx.mean()
-        dx_ = (dx - m) * omega + m
-        prev_sample = sample + dx_
-
-        # Cast sample back to model compatible dtype
-        prev_sample = prev_sample.to(model_output.dtype)
+        # mean shift: dx = derivative * dt, prev_sample = sample + (dx - dx.mean()) * omega + dx.mean()
+        prev_sample = fused_step.mean_shift_update(
+            sample, derivative, dt, omega, model_output.dtype
+        )
 
         # upon completion increase step index by one
         self._step_index += 1
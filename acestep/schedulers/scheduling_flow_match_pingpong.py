@@ -23,6 +23,8 @@ from diffusers.configuration_utils import ConfigMixin, register_to_config
 from diffusers.utils import BaseOutput, logging
 from diffusers.schedulers.scheduling_utils import SchedulerMixin
 
+from .flow_match_fused_step import FusedFlowMatchStep
+
 
 logger = logging.get_logger(__name__)  # pylint: disable=invalid-name
 
@@ -87,6 +89,7 @@ class FlowMatchPingPongScheduler(SchedulerMixin, ConfigMixin):
 
         self._step_index = None
         self._begin_index = None
+        self._fused_step = None
 
         self.sigmas = sigmas.to("cpu")  # to avoid too much CPU/GPU communication
         self.sigma_min = self.sigmas[-1].item()
@@ -218,6 +221,7 @@ class FlowMatchPingPongScheduler(SchedulerMixin, ConfigMixin):
 
         self._step_index = None
         self._begin_index = None
+        self._fused_step = None
 
     def index_for_timestep(self, timestep, schedule_timesteps=None):
         if schedule_timesteps is None:
@@ -241,6 +245,11 @@ class FlowMatchPingPongScheduler(SchedulerMixin, ConfigMixin):
         else:
             self._step_index = self._begin_index
 
+    def _get_fused_step(self):
+        if self._fused_step is None:
+            self._fused_step = FusedFlowMatchStep(self.sigmas)
+        return self._fused_step
+
     def step(
         self,
         model_output: torch.FloatTensor,
@@ -282,24 +291,10 @@ class FlowMatchPingPongScheduler(SchedulerMixin, ConfigMixin):
                 returned, otherwise a tuple is returned where the first element is the sample tensor.
         """
 
-        def logistic_function(x, L=0.9, U=1.1, x_0=0.0, k=1):
-            # L = Lower bound
-            # U = Upper bound
-            # x_0 = Midpoint (x corresponding to y = 1.0)
-            # k = Steepness, can adjust based on preference
-
-            if isinstance(x, torch.Tensor):
-                device_ = x.device
-                x = x.to(torch.float).cpu().numpy()
-
-            new_x = L + (U - L) / (1 + np.exp(-k * (x - x_0)))
-
-            if isinstance(new_x, np.ndarray):
-                new_x = torch.from_numpy(new_x).to(device_)
-            return new_x
+        fused_step = self._get_fused_step()
 
         self.omega_bef_rescale = omega
-        omega = logistic_function(omega, k=0.1)
+        omega = fused_step.rescale_omega(omega)
         self.omega_aft_rescale = omega
 
         if (
@@ -318,18 +313,11 @@ class FlowMatchPingPongScheduler(SchedulerMixin, ConfigMixin):
         if self.step_index is None:
             self._init_step_index(timestep)
 
-        # Upcast to avoid precision issues when computing prev_sample
-        sample = sample.to(torch.float32)
-
-        sigma = self.sigmas[self.step_index]
-        sigma_next = self.sigmas[self.step_index + 1]
-
-        denoised = sample - sigma * model_output
-        noise = torch.empty_like(sample).normal_(generator=generator)
-        prev_sample = (1 - sigma_next) * denoised + sigma_next * noise
-
-        # Cast sample back to model compatible dtype
-        prev_sample = prev_sample.to(model_output.dtype)
+        # denoised = sample - sigma * model_output
+        # prev_sample = (1 - sigma_next) * denoised + sigma_next * noise, computed in float32
+        prev_sample = fused_step.pingpong(
+            self.step_index, sample, model_output, generator=generator
+        )
 
         # upon completion increase step index by one
         self._step_index += 1
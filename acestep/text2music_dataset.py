@@ -11,6 +11,7 @@ from pathlib import Path
 import re
 from acestep.language_segmentation import LangSegment
 from acestep.models.lyrics_utils.lyric_tokenizer import VoiceBpeTokenizer
+from acestep.resampling import resample
 import warnings
 
 warnings.simplefilter("ignore", category=FutureWarning)
@@ -416,7 +417,7 @@ class Text2MusicDataset(Dataset):
 
         # Resample if needed
         if sr != 48000:
-            audio = torchaudio.transforms.Resample(sr, 48000)(audio)
+            audio = resample(audio, sr, 48000)
 
         # Clip values to [-1.0, 1.0]
         audio = torch.clamp(audio, -1.0, 1.0)
@@ -236,11 +236,11 @@ def create_text2music_ui(
 
             with gr.Accordion("Advanced Settings", open=False):
                 scheduler_type = gr.Radio(
-                    ["euler", "heun", "pingpong"],
+                    ["euler", "heun", "pingpong", "dpm++", "adaptive"],
                     value="euler",
                     label="Scheduler Type",
                     elem_id="scheduler_type",
-                    info="Scheduler type for the generation. euler is recommended. heun will take more time. pingpong use SDE",
+                    info="Scheduler type for the generation. euler is recommended. heun will take more time. pingpong use SDE. dpm++ needs fewer steps (10-15). adaptive picks its own step sizes, infer steps is the upper limit",
                 )
                 cfg_type = gr.Radio(
                     ["cfg", "apg", "cfg_star"],
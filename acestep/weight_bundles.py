@@ -0,0 +1,246 @@
+"""
+Memory-mapped, pre-cast weight bundles.
+
+``from_pretrained`` deserializes every weight in full precision and the pipeline casts it to its
+dtype afterwards, so each model is materialized twice per load. A bundle is one safetensors file
+per component, already in the target dtype, with the model config in its metadata. Loading maps
+the file and hands zero-copy tensor views to an empty model skeleton, so a reload after eviction
+is bound by the page cache instead of by deserialization.
+
+Bundles live in ``<checkpoint>/bundles/<dtype>/<component>.safetensors``, next to the components
+the pipeline loads: in the snapshot directory when the checkpoint sits in a Hugging Face cache.
+They are written by
+
+    python -m acestep.weight_bundles --checkpoint_dir ~/.cache/ace-step/checkpoints --dtype bfloat16
+
+where ``--checkpoint_dir`` is the checkpoint itself or the cache holding it, like the
+``checkpoint_dir`` of the pipeline.
+"""
+
+import json
+import mmap
+import os
+import struct
+from typing import Dict, Optional, Tuple
+
+import click
+import torch
+from accelerate import init_empty_weights
+from diffusers import AutoencoderDC
+from loguru import logger
+from safetensors.torch import save_file
+from transformers import UMT5Config, UMT5EncoderModel
+
+from acestep.models.ace_step_transformer import ACEStepTransformer2DModel
+from acestep.music_dcae.music_vocoder import ADaMoSHiFiGANV1
+
+BUNDLE_DIR_NAME = "bundles"
+WEIGHT_FILE_EXTENSIONS = (".safetensors", ".bin", ".pt", ".pth")
+BUNDLE_FORMAT_VERSION = "1"
+
+# bundle component -> checkpoint sub directory it is exported from
+COMPONENTS = {
+    "ace_step_transformer": "ace_step_transformer",
+    "music_dcae": "music_dcae_f8c8",
+    "music_vocoder": "music_vocoder",
+    "text_encoder": "umt5-base",
+}
+
+_SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+def load_pretrained_component(component, path, dtype):
+    if component == "ace_step_transformer":
+        return ACEStepTransformer2DModel.from_pretrained(path, torch_dtype=dtype)
+    if component == "music_dcae":
+        return AutoencoderDC.from_pretrained(path, torch_dtype=dtype)
+    if component == "music_vocoder":
+        return ADaMoSHiFiGANV1.from_pretrained(path, torch_dtype=dtype)
+    if component == "text_encoder":
+        return UMT5EncoderModel.from_pretrained(path, torch_dtype=dtype)
+    raise ValueError(f"Unknown bundle component: {component}")
+
+
+def build_empty_component(component, config):
+    if component == "ace_step_transformer":
+        return ACEStepTransformer2DModel.from_config(config)
+    if component == "music_dcae":
+        return AutoencoderDC.from_config(config)
+    if component == "music_vocoder":
+        return ADaMoSHiFiGANV1.from_config(config)
+    if component == "text_encoder":
+        return UMT5EncoderModel(UMT5Config.from_dict(config))
+    raise ValueError(f"Unknown bundle component: {component}")
+
+
+def _config_json(model) -> str:
+    # transformers keeps the config on a separate object, diffusers models are their own config
+    config = model.config if hasattr(model.config, "to_json_string") else model
+    return config.to_json_string()
+
+
+def dtype_name(dtype: torch.dtype) -> str:
+    return str(dtype).replace("torch.", "")
+
+
+def bundle_path(checkpoint_dir, component, dtype) -> str:
+    return os.path.join(checkpoint_dir, BUNDLE_DIR_NAME, dtype_name(dtype), f"{component}.safetensors")
+
+
+def find_bundles(checkpoint_dir, dtype) -> Optional[Dict[str, str]]:
+    """Paths of all component bundles for ``dtype``, or None unless every one of them exists."""
+    paths = {component: bundle_path(checkpoint_dir, component, dtype) for component in COMPONENTS}
+    if all(os.path.isfile(path) for path in paths.values()):
+        return paths
+    return None
+
+
+def save_bundle(model: torch.nn.Module, path, component, dtype=torch.bfloat16):
+    """
+    Writes the state dict of ``model`` with floating point tensors cast to ``dtype``. Tensors that
+    share storage (tied embeddings) are stored once and recorded as aliases.
+    """
+    tensors, aliases, seen = {}, {}, {}
+    for name, tensor in model.state_dict().items():
+        key = (tensor.untyped_storage().data_ptr(), tensor.storage_offset(), tuple(tensor.shape), tensor.stride())
+        if key in seen:
+            aliases[name] = seen[key]
+            continue
+        seen[key] = name
+        target_dtype = dtype if tensor.is_floating_point() else tensor.dtype
+        # clone so that no two saved tensors share memory, safetensors refuses that
+        tensors[name] = tensor.detach().to(device="cpu", dtype=target_dtype).clone()
+
+    metadata = {
+        "format": "pt",
+        "bundle_version": BUNDLE_FORMAT_VERSION,
+        "component": component,
+        "dtype": dtype_name(dtype),
+        "config": _config_json(model),
+        "aliases": json.dumps(aliases),
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    save_file(tensors, tmp_path, metadata=metadata)
+    os.replace(tmp_path, path)
+
+
+def load_state_dict_mmap(path) -> Tuple[Dict[str, torch.Tensor], Dict[str, str]]:
+    """
+    Maps a safetensors file and returns (state dict, metadata). The tensors are views of the
+    mapping, nothing is read until a page is touched. The mapping is copy-on-write, so in-place
+    updates stay private to the process and never reach the file.
+    """
+    with open(path, "rb") as f:
+        (header_len,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_len))
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    metadata = header.pop("__metadata__", None) or {}
+    data_start = 8 + header_len
+    state_dict = {}
+    for name, info in header.items():
+        dtype = _SAFETENSORS_DTYPES[info["dtype"]]
+        start, end = info["data_offsets"]
+        if end == start:
+            state_dict[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        count = (end - start) // torch.empty((), dtype=dtype).element_size()
+        tensor = torch.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + start)
+        state_dict[name] = tensor.view(info["shape"])
+    return state_dict, metadata
+
+
+def load_bundle(path, device=None) -> torch.nn.Module:
+    """
+    Builds the component stored in ``path`` without allocating its weights and assigns the
+    mapped tensors as parameters. With ``device`` None or "cpu" the weights stay mapped.
+    """
+    state_dict, metadata = load_state_dict_mmap(path)
+    if metadata.get("bundle_version") != BUNDLE_FORMAT_VERSION:
+        raise ValueError(f"{path} is not a weight bundle of version {BUNDLE_FORMAT_VERSION}, re-export it")
+    for name, target in json.loads(metadata["aliases"]).items():
+        state_dict[name] = state_dict[target]
+
+    with init_empty_weights():
+        model = build_empty_component(metadata["component"], json.loads(metadata["config"]))
+    model.load_state_dict(state_dict, strict=True, assign=True)
+    if hasattr(model, "tie_weights"):
+        model.tie_weights()
+    model.eval()
+    if device is not None:
+        model = model.to(device)
+    return model
+
+
+def prefetch_files(path, chunk_size=16 << 20) -> int:
+    """
+    Reads the weight files at ``path`` (a file or a directory) once so that a following load is
+    served from the page cache. Pure I/O, safe to run on a worker thread next to a model load.
+    Returns the number of bytes read.
+    """
+    if os.path.isfile(path):
+        files = [path]
+    else:
+        files = sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(path)
+            for name in names
+            if name.endswith(WEIGHT_FILE_EXTENSIONS)
+        )
+    buffer = bytearray(chunk_size)
+    total = 0
+    for file_path in files:
+        with open(file_path, "rb", buffering=0) as f:
+            while True:
+                read = f.readinto(buffer)
+                if not read:
+                    break
+                total += read
+    return total
+
+
+def export_bundles(checkpoint_dir, dtype=torch.bfloat16, components=None, overwrite=False) -> Dict[str, str]:
+    """Exports the components of a checkpoint directory, returns the bundle paths."""
+    paths = {}
+    for component in components or COMPONENTS:
+        path = bundle_path(checkpoint_dir, component, dtype)
+        paths[component] = path
+        if os.path.isfile(path) and not overwrite:
+            logger.info(f"Bundle exists, skipping: {path}")
+            continue
+        model = load_pretrained_component(component, os.path.join(checkpoint_dir, COMPONENTS[component]), dtype)
+        save_bundle(model, path, component, dtype)
+        logger.info(f"Bundle saved to: {path}")
+        del model
+    return paths
+
+
+@click.command()
+@click.option(
+    "--checkpoint_dir", type=str, required=True, help="ACE-Step checkpoint, or the Hugging Face cache holding it"
+)
+@click.option("--dtype", type=click.Choice(["bfloat16", "float16", "float32"]), default="bfloat16")
+@click.option("--component", "components", type=click.Choice(list(COMPONENTS)), multiple=True, help="Default: all")
+@click.option("--overwrite", is_flag=True, default=False)
+def main(checkpoint_dir, dtype, components, overwrite):
+    # a Hugging Face cache directory resolves to its snapshot, where load_checkpoint looks for bundles
+    from acestep.pipeline_ace_step import REPO_ID, ACEStepPipeline
+
+    checkpoint_dir = ACEStepPipeline.get_checkpoint_path(checkpoint_dir, REPO_ID, local_files_only=True)
+    export_bundles(checkpoint_dir, getattr(torch, dtype), components or None, overwrite)
+
+
+if __name__ == "__main__":
+    main()
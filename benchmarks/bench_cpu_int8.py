@@ -0,0 +1,94 @@
+"""
+CPU latency and weight size of the float32 models versus dynamic int8 quantization.
+
+Loads the transformer and UMT5 from ``--checkpoint_dir`` in float32, times one transformer
+``decode`` step and one UMT5 forward, quantizes them with
+``acestep.cpu_quantization.quantize_dynamic_int8`` and times them again. The weight size is the
+serialized state dict, the difference is the largest absolute deviation from float32.
+
+    python benchmarks/bench_cpu_int8.py --checkpoint_dir ~/.cache/ace-step/checkpoints --threads 8
+"""
+
+import io
+import os
+import sys
+import time
+
+import click
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from acestep.cpu_quantization import quantize_dynamic_int8  # noqa: E402
+from acestep.models.text_encoder_query_scale import install_query_scale  # noqa: E402
+from acestep.pipeline_ace_step import ACEStepPipeline  # noqa: E402
+from acestep.weight_bundles import COMPONENTS, load_pretrained_component  # noqa: E402
+
+
+def state_dict_mb(model):
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / 2**20
+
+
+def timed(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+@click.command()
+@click.option("--checkpoint_dir", type=str, required=True)
+@click.option("--duration", type=float, default=60.0, help="Song length the decode step is timed for (seconds)")
+@click.option("--text_length", type=int, default=128)
+@click.option("--threads", type=int, default=None, help="torch intra-op threads, default: torch's choice")
+@click.option("--repeats", type=int, default=3)
+def main(checkpoint_dir, duration, text_length, threads, repeats):
+    if threads:
+        torch.set_num_threads(threads)
+    torch.manual_seed(0)
+    frame_length = ACEStepPipeline.duration_frame_length(duration)
+
+    transformer = load_pretrained_component(
+        "ace_step_transformer", os.path.join(checkpoint_dir, COMPONENTS["ace_step_transformer"]), torch.float32
+    ).eval()
+    decode_inputs = dict(
+        hidden_states=torch.randn(1, 8, 16, frame_length),
+        attention_mask=torch.ones(1, frame_length),
+        encoder_hidden_states=torch.randn(1, text_length, transformer.inner_dim),
+        encoder_hidden_mask=torch.ones(1, text_length),
+        timestep=torch.full((1,), 500.0),
+        output_length=frame_length,
+    )
+
+    text_encoder = load_pretrained_component(
+        "text_encoder", os.path.join(checkpoint_dir, COMPONENTS["text_encoder"]), torch.float32
+    ).eval()
+    install_query_scale(text_encoder)
+    input_ids = torch.randint(0, text_encoder.config.vocab_size, (1, text_length))
+
+    cases = (
+        ("transformer decode", transformer, lambda: transformer.decode(**decode_inputs)[0]),
+        ("umt5 forward", text_encoder, lambda: text_encoder(input_ids=input_ids).last_hidden_state),
+    )
+    with torch.inference_mode():
+        for name, model, fn in cases:
+            reference = fn()
+            fp32_ms = timed(fn, repeats)
+            fp32_mb = state_dict_mb(model)
+            quantize_dynamic_int8(model)
+            max_diff = (fn() - reference).abs().max().item()
+            int8_ms = timed(fn, repeats)
+            int8_mb = state_dict_mb(model)
+            print(
+                f"{name:<20} fp32 {fp32_ms:9.1f} ms {fp32_mb:8.0f} MB   "
+                f"int8 {int8_ms:9.1f} ms {int8_mb:8.0f} MB   "
+                f"speed-up {fp32_ms / int8_ms:5.2f}x   max diff {max_diff:.2e}"
+            )
+
+
+if __name__ == "__main__":
+    main()
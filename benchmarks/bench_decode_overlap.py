@@ -0,0 +1,76 @@
+"""
+Scaling benchmark of MusicDCAE.decode_overlap.
+
+Decodes random latents of increasing duration and reports the wall time, the time per second
+of audio and the peak device memory. With the preallocated overlap-add buffers the time per
+second of audio should stay flat from 30 s to 240 s (linear scaling); a growing value points
+at copies that depend on the song length.
+
+    python benchmarks/bench_decode_overlap.py --checkpoint_dir ~/.cache/ace-step/checkpoints
+"""
+
+import os
+import sys
+import time
+
+import click
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from acestep.music_dcae.music_dcae_pipeline import MusicDCAE  # noqa: E402
+
+
+def synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+@click.command()
+@click.option("--checkpoint_dir", type=str, required=True)
+@click.option("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+@click.option("--dtype", type=click.Choice(["float32", "bfloat16", "float16"]), default="bfloat16")
+@click.option("--durations", type=str, default="30,60,120,240")
+@click.option("--sample_rate", type=int, default=48000)
+@click.option("--repeats", type=int, default=3)
+def main(checkpoint_dir, device, dtype, durations, sample_rate, repeats):
+    device = torch.device(device)
+    dtype = getattr(torch, dtype)
+    model = MusicDCAE(
+        dcae_checkpoint_path=os.path.join(checkpoint_dir, "music_dcae_f8c8"),
+        vocoder_checkpoint_path=os.path.join(checkpoint_dir, "music_vocoder"),
+    )
+    model = model.to(device=device, dtype=dtype).eval()
+    generator = torch.Generator(device=device).manual_seed(0)
+
+    def timed(latents):
+        synchronize(device)
+        start = time.perf_counter()
+        model.decode_overlap(latents, sr=sample_rate)
+        synchronize(device)
+        return time.perf_counter() - start
+
+    warmup = torch.randn(1, 8, 16, 256, device=device, dtype=dtype, generator=generator)
+    timed(warmup)
+
+    base_per_second = None
+    for duration in [float(value) for value in durations.split(",")]:
+        frame_length = int(duration * 44100 / 512 / 8)
+        latents = torch.randn(1, 8, 16, frame_length, device=device, dtype=dtype, generator=generator)
+        if device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats(device)
+        elapsed = min(timed(latents) for _ in range(repeats))
+        per_second = elapsed / duration * 1000
+        if base_per_second is None:
+            base_per_second = per_second
+        peak = (
+            torch.cuda.max_memory_allocated(device) / 1024**2 if device.type == "cuda" else float("nan")
+        )
+        print(
+            f"{duration:6.0f} s  {elapsed:7.2f} s  {per_second:7.2f} ms per audio s  "
+            f"(x{per_second / base_per_second:4.2f} of the shortest)  peak {peak:8.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
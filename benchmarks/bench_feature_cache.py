@@ -0,0 +1,123 @@
+"""
+Benchmark of the step-level feature cache of ACEStepTransformer2DModel.decode.
+
+Runs the same Euler sampling loop without the cache and with a range of thresholds, and reports
+the diffusion time, the fraction of transformer passes that reused the deep blocks and the
+relative difference of the final latents against the uncached run. Without --checkpoint_dir a
+small randomly initialised transformer is used, which shows the mechanics but not the real
+quality / speed trade-off.
+
+    python benchmarks/bench_feature_cache.py --checkpoint_dir ~/.cache/ace-step/checkpoints
+"""
+
+import os
+import sys
+import time
+
+import click
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from acestep.models.ace_step_transformer import (  # noqa: E402
+    ACEStepTransformer2DModel,
+    StepFeatureCache,
+)
+from acestep.schedulers import FlowMatchEulerDiscreteScheduler  # noqa: E402
+
+
+def load_transformer(checkpoint_dir, device, dtype):
+    if checkpoint_dir is not None:
+        model = ACEStepTransformer2DModel.from_pretrained(
+            os.path.join(checkpoint_dir, "ace_step_transformer"), torch_dtype=dtype
+        )
+    else:
+        torch.manual_seed(0)
+        model = ACEStepTransformer2DModel(
+            num_layers=8,
+            attention_head_dim=32,
+            num_attention_heads=4,
+            mlp_ratio=2.5,
+            ssl_latent_dims=[64, 64],
+            max_width=4096,
+        )
+    return model.to(device=device, dtype=dtype).eval()
+
+
+@torch.no_grad()
+def sample(model, latents, encoder_hidden_states, encoder_hidden_mask, infer_step, threshold):
+    device = latents.device
+    scheduler = FlowMatchEulerDiscreteScheduler(num_train_timesteps=1000, shift=3.0)
+    scheduler.set_timesteps(infer_step, device=device)
+    timesteps = scheduler.timesteps
+    attention_mask = torch.ones(latents.shape[0], latents.shape[-1], device=device, dtype=latents.dtype)
+    decode_tables = model.precompute_decode_tables(
+        timesteps=timesteps,
+        latent_length=latents.shape[-1],
+        encoder_length=encoder_hidden_states.shape[1],
+    )
+    feature_cache = (
+        StepFeatureCache(threshold, num_steps=len(timesteps)) if threshold > 0 else None
+    )
+    for i, t in enumerate(timesteps):
+        noise_pred = model.decode(
+            hidden_states=latents,
+            attention_mask=attention_mask,
+            encoder_hidden_states=encoder_hidden_states,
+            encoder_hidden_mask=encoder_hidden_mask,
+            output_length=latents.shape[-1],
+            timestep=t.expand(latents.shape[0]),
+            decode_tables=decode_tables,
+            step_index=i,
+            feature_cache=feature_cache,
+        ).sample
+        latents = scheduler.step(
+            model_output=noise_pred, timestep=t, sample=latents, omega=10.0, return_dict=False
+        )[0]
+    return latents, feature_cache.reuse_ratio if feature_cache is not None else 0.0
+
+
+@click.command()
+@click.option("--checkpoint_dir", type=str, default=None)
+@click.option("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+@click.option("--dtype", type=click.Choice(["float32", "bfloat16", "float16"]), default="bfloat16")
+@click.option("--duration", type=float, default=60.0, help="audio seconds, sets the latent length")
+@click.option("--infer_step", type=int, default=27)
+@click.option("--thresholds", type=str, default="0.05,0.1,0.2,0.3")
+def main(checkpoint_dir, device, dtype, duration, infer_step, thresholds):
+    device = torch.device(device)
+    dtype = getattr(torch, dtype)
+    model = load_transformer(checkpoint_dir, device, dtype)
+    inner_dim = model.inner_dim
+
+    generator = torch.Generator(device=device).manual_seed(0)
+    frame_length = int(duration * 44100 / 512 / 8)
+    latents = torch.randn(1, 8, 16, frame_length, device=device, dtype=dtype, generator=generator)
+    encoder_hidden_states = torch.randn(1, 128, inner_dim, device=device, dtype=dtype, generator=generator)
+    encoder_hidden_mask = torch.ones(1, 128, device=device, dtype=dtype)
+
+    def timed(threshold):
+        if device.type == "cuda":
+            torch.cuda.synchronize(device)
+        start = time.perf_counter()
+        out, reuse_ratio = sample(
+            model, latents, encoder_hidden_states, encoder_hidden_mask, infer_step, threshold
+        )
+        if device.type == "cuda":
+            torch.cuda.synchronize(device)
+        return out.float(), reuse_ratio, time.perf_counter() - start
+
+    timed(0.0)  # warm-up
+    reference, _, reference_time = timed(0.0)
+    print(f"baseline            {reference_time:7.2f} s  ({infer_step} steps, {frame_length} frames)")
+    for threshold in [float(value) for value in thresholds.split(",")]:
+        out, reuse_ratio, elapsed = timed(threshold)
+        rel_diff = ((out - reference).norm() / reference.norm()).item()
+        print(
+            f"threshold {threshold:<8.3f}  {elapsed:7.2f} s  speedup {reference_time / elapsed:5.2f}x  "
+            f"reused {reuse_ratio:6.1%}  rel. diff {rel_diff:.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark of guidance reuse in ACEStepPipeline.
+
+Generates the same prompt with a fixed seed for several values of `guidance_reuse_interval` and
+reports the number of transformer passes, the wall time and the relative difference of the
+decoded audio against the run that recomputes every guidance branch on every step.
+
+    python benchmarks/bench_guidance_reuse.py --checkpoint_path ~/.cache/ace-step/checkpoints
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import click
+import torch
+import torchaudio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from acestep.pipeline_ace_step import ACEStepPipeline  # noqa: E402
+
+PROMPT = "pop, synth, drums, guitar, 120 bpm, upbeat, catchy, vibrant, female vocals"
+LYRICS = "[verse]\nNeon lights are calling me tonight\n[chorus]\nWe keep on dancing till the morning light"
+
+
+@click.command()
+@click.option("--checkpoint_path", type=str, default=None)
+@click.option("--bf16", type=bool, default=True)
+@click.option("--duration", type=float, default=30.0)
+@click.option("--infer_step", type=int, default=27)
+@click.option("--intervals", type=str, default="1,2,3,4")
+@click.option("--batched_guidance", type=bool, default=False)
+@click.option("--seed", type=int, default=42)
+def main(checkpoint_path, bf16, duration, infer_step, intervals, batched_guidance, seed):
+    pipeline = ACEStepPipeline(
+        checkpoint_dir=checkpoint_path,
+        dtype="bfloat16" if bf16 else "float32",
+    )
+    reference = None
+    with tempfile.TemporaryDirectory() as output_dir:
+        for interval in [int(value) for value in intervals.split(",")]:
+            start = time.perf_counter()
+            pipeline(
+                audio_duration=duration,
+                prompt=PROMPT,
+                lyrics=LYRICS,
+                infer_step=infer_step,
+                guidance_scale=15.0,
+                scheduler_type="euler",
+                cfg_type="apg",
+                omega_scale=10.0,
+                manual_seeds=str(seed),
+                batched_guidance=batched_guidance,
+                guidance_reuse_interval=interval,
+                save_path=os.path.join(output_dir, f"interval_{interval}.wav"),
+            )
+            elapsed = time.perf_counter() - start
+            audio, _ = torchaudio.load(os.path.join(output_dir, f"interval_{interval}.wav"))
+            if reference is None:
+                reference = audio
+            rel_diff = ((audio - reference).norm() / reference.norm()).item()
+            stats = pipeline.last_diffusion_stats
+            print(
+                f"interval {interval:<3} passes {stats['transformer_passes']:4d}  "
+                f"reused steps {stats['reused_guidance_steps']:3d}  {elapsed:7.2f} s  "
+                f"rel. audio diff {rel_diff:.4f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Micro-benchmark of the shared resampler registry.
+
+Compares building a new torchaudio Resample per call (what the decode / encode / dataset code
+did), the cached module from acestep.resampling.get_resampler and acestep.resampling.resample
+(polyphase path for 44.1 kHz <-> 48 kHz), and reports the time per call and the largest
+difference against torchaudio.
+
+    python benchmarks/bench_resampling.py --device cuda --seconds 240
+"""
+
+import os
+import sys
+import time
+
+import click
+import torch
+import torchaudio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from acestep.resampling import get_resampler, resample  # noqa: E402
+
+
+def synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def timed(device, fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        synchronize(device)
+        start = time.perf_counter()
+        fn()
+        synchronize(device)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+@click.command()
+@click.option("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+@click.option("--seconds", type=float, default=30.0)
+@click.option("--batch_size", type=int, default=1)
+@click.option("--rates", type=str, default="44100:48000,48000:44100,32000:48000")
+@click.option("--repeats", type=int, default=5)
+def main(device, seconds, batch_size, rates, repeats):
+    device = torch.device(device)
+    for pair in rates.split(","):
+        orig_freq, new_freq = (int(value) for value in pair.split(":"))
+        waveform = torch.randn(batch_size, 2, int(seconds * orig_freq), device=device)
+
+        def uncached():
+            return torchaudio.transforms.Resample(orig_freq, new_freq).to(device)(waveform)
+
+        def cached():
+            return get_resampler(orig_freq, new_freq, waveform.dtype, device)(waveform)
+
+        def registry():
+            return resample(waveform, orig_freq, new_freq)
+
+        reference = uncached()
+        max_diff = (registry() - reference).abs().max().item()
+        uncached_ms = timed(device, uncached, repeats)
+        cached_ms = timed(device, cached, repeats)
+        registry_ms = timed(device, registry, repeats)
+        print(
+            f"{orig_freq:>6} -> {new_freq:<6} {str(tuple(waveform.shape)):<20} "
+            f"new module {uncached_ms:8.2f} ms   cached {cached_ms:8.2f} ms   "
+            f"resample() {registry_ms:8.2f} ms   max diff {max_diff:.2e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
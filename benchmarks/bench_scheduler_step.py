@@ -0,0 +1,127 @@
+"""
+Micro-benchmark of the flow-match scheduler step.
+
+Compares the previous per-step implementation of the Euler / PingPong update (numpy omega
+rescale, float32 upcast and temporaries on every call) with the shared fused step now used
+by the schedulers, and reports the time per step and the largest difference of the results.
+
+    python benchmarks/bench_scheduler_step.py --device cuda --batch_size 2
+"""
+
+import os
+import sys
+import time
+
+import click
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from acestep.schedulers import (  # noqa: E402
+    FlowMatchEulerDiscreteScheduler,
+    FlowMatchPingPongScheduler,
+)
+
+
+def reference_euler_step(sigmas, step_index, sample, model_output, omega):
+    def logistic_function(x, L=0.9, U=1.1, x_0=0.0, k=1):
+        x = np.asarray(x)
+        return L + (U - L) / (1 + np.exp(-k * (x - x_0)))
+
+    omega = logistic_function(omega, k=0.1)
+    sample = sample.to(torch.float32)
+    sigma = sigmas[step_index]
+    sigma_next = sigmas[step_index + 1]
+    dx = (sigma_next - sigma) * model_output
+    m = dx.mean()
+    dx_ = (dx - m) * omega + m
+    return (sample + dx_).to(model_output.dtype)
+
+
+def reference_pingpong_step(sigmas, step_index, sample, model_output, generator):
+    sample = sample.to(torch.float32)
+    sigma = sigmas[step_index]
+    sigma_next = sigmas[step_index + 1]
+    denoised = sample - sigma * model_output
+    noise = torch.empty_like(sample).normal_(generator=generator)
+    return ((1 - sigma_next) * denoised + sigma_next * noise).to(model_output.dtype)
+
+
+def synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def time_steps(device, fn, num_steps):
+    synchronize(device)
+    start = time.perf_counter()
+    for i in range(num_steps):
+        fn(i)
+    synchronize(device)
+    return (time.perf_counter() - start) / num_steps * 1e6
+
+
+@click.command()
+@click.option("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+@click.option("--dtype", type=click.Choice(["float32", "bfloat16", "float16"]), default="bfloat16")
+@click.option("--batch_size", type=int, default=1)
+@click.option("--frame_length", type=int, default=2584, help="latent frames, 2584 is ~240 s of audio")
+@click.option("--infer_step", type=int, default=60)
+@click.option("--omega_scale", type=float, default=10.0)
+@click.option("--repeats", type=int, default=5)
+def main(device, dtype, batch_size, frame_length, infer_step, omega_scale, repeats):
+    device = torch.device(device)
+    dtype = getattr(torch, dtype)
+    shape = (batch_size, 8, 16, frame_length)
+    sample = torch.randn(shape, device=device, dtype=dtype)
+    model_outputs = [torch.randn(shape, device=device, dtype=dtype) for _ in range(4)]
+
+    for name, scheduler_cls in (
+        ("euler", FlowMatchEulerDiscreteScheduler),
+        ("pingpong", FlowMatchPingPongScheduler),
+    ):
+        scheduler = scheduler_cls(num_train_timesteps=1000, shift=3.0)
+        scheduler.set_timesteps(infer_step, device=device)
+        sigmas = scheduler.sigmas
+        num_steps = len(scheduler.timesteps)
+
+        if name == "euler":
+            def reference(i):
+                return reference_euler_step(sigmas, i, sample, model_outputs[i % 4], omega_scale)
+        else:
+            ref_generator = torch.Generator(device=device).manual_seed(0)
+
+            def reference(i):
+                return reference_pingpong_step(sigmas, i, sample, model_outputs[i % 4], ref_generator)
+
+        fused_generator = torch.Generator(device=device).manual_seed(0)
+
+        def fused(i):
+            scheduler._step_index = i
+            return scheduler.step(
+                model_output=model_outputs[i % 4],
+                timestep=scheduler.timesteps[i],
+                sample=sample,
+                omega=omega_scale,
+                generator=fused_generator,
+                return_dict=False,
+            )[0]
+
+        # warm up and compare the first step of each
+        if name == "pingpong":
+            ref_generator.manual_seed(0)
+            fused_generator.manual_seed(0)
+        max_diff = (reference(0).float() - fused(0).float()).abs().max().item()
+
+        reference_us = min(time_steps(device, reference, num_steps) for _ in range(repeats))
+        fused_us = min(time_steps(device, fused, num_steps) for _ in range(repeats))
+        print(
+            f"{name:<9} {str(tuple(shape)):<24} {str(dtype):<15} "
+            f"reference {reference_us:9.1f} us/step   fused {fused_us:9.1f} us/step   "
+            f"speedup {reference_us / fused_us:5.2f}x   max diff {max_diff:.3e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
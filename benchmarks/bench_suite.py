@@ -0,0 +1,197 @@
+"""
+Stage-by-stage benchmark of the pipeline on tiny random models (see benchmarks/tiny_models.py).
+
+Times text encoding, lyric tokenization, the lyric encoder, diffusion steps per scheduler, DCAE
+decode, vocoder, overlap decode and the WAV write for every duration and batch size, and writes
+the median and best time of every measurement as JSON. Needs no checkpoint and no network, so it
+runs on any CPU-only machine.
+
+With ``--baseline`` each result is compared against the same measurement of an earlier run; a
+median slower by more than ``--tolerance`` is reported as a regression and the exit code is 1.
+
+    python benchmarks/bench_suite.py --output benchmarks/baseline_cpu.json
+    python benchmarks/bench_suite.py --baseline benchmarks/baseline_cpu.json
+"""
+
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import click
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tiny_models import TEXT_EMBEDDING_DIM, SPEAKER_EMBEDDING_DIM, build_tiny_pipeline  # noqa: E402
+
+SCHEDULERS = ("euler", "heun", "pingpong", "dpm++")
+LYRICS = """[verse]
+Neon lights are flashing on the wall
+Dancing shadows answer every call
+[chorus]
+Sing it loud, sing it clear
+Every night the radio is here
+"""
+
+
+def synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def measure(device, fn, repeats):
+    fn()  # warm-up, allocations and kernel selection
+    times = []
+    for _ in range(repeats):
+        synchronize(device)
+        start = time.perf_counter()
+        fn()
+        synchronize(device)
+        times.append((time.perf_counter() - start) * 1000)
+    return {"median_ms": round(statistics.median(times), 3), "min_ms": round(min(times), 3)}
+
+
+def run_suite(pipeline, durations, batch_sizes, infer_steps, repeats):
+    device = pipeline.device
+    dtype = pipeline.dtype
+    transformer = pipeline.ace_step_transformer
+    music_dcae = pipeline.music_dcae
+    results = {}
+
+    def record(name, fn, per=1):
+        result = measure(device, fn, repeats)
+        if per != 1:
+            result = {key: round(value / per, 3) for key, value in result.items()}
+        results[name] = result
+        print(f"{name:<45} {result['median_ms']:10.2f} ms  (best {result['min_ms']:.2f} ms)")
+
+    output_dir = tempfile.mkdtemp(prefix="ace-step-bench-")
+    with torch.inference_mode():
+        input_ids = torch.randint(0, pipeline.text_encoder_model.config.vocab_size, (1, 64), device=device)
+        record("text_encoding", lambda: pipeline.text_encoder_model(input_ids=input_ids))
+
+        lyric_token_idx = pipeline.tokenize_lyrics(LYRICS)
+        record("lyric_tokenization", lambda: pipeline.tokenize_lyrics(LYRICS))
+
+        for batch_size in batch_sizes:
+            lyric_ids = torch.tensor(lyric_token_idx, device=device)[None].repeat(batch_size, 1)
+            lyric_mask = torch.ones_like(lyric_ids)
+            record(
+                f"lyric_encoder/batch={batch_size}",
+                lambda: transformer.forward_lyric_encoder(lyric_token_idx=lyric_ids, lyric_mask=lyric_mask),
+            )
+            text_states = torch.randn(batch_size, 64, TEXT_EMBEDDING_DIM, device=device, dtype=dtype)
+            text_mask = torch.ones(batch_size, 64, device=device, dtype=dtype)
+
+            for duration in durations:
+                suffix = f"duration={duration:g}/batch={batch_size}"
+                for scheduler_type in SCHEDULERS:
+
+                    def diffusion():
+                        random_generators, _ = pipeline.set_seeds(batch_size, [0] * batch_size)
+                        return pipeline.text2music_diffusion_process(
+                            duration=duration,
+                            encoder_text_hidden_states=text_states,
+                            text_attention_mask=text_mask,
+                            speaker_embds=torch.zeros(batch_size, SPEAKER_EMBEDDING_DIM, device=device, dtype=dtype),
+                            lyric_token_ids=lyric_ids,
+                            lyric_mask=lyric_mask,
+                            random_generators=random_generators,
+                            infer_steps=infer_steps,
+                            scheduler_type=scheduler_type,
+                        )
+
+                    # per step, the lyric encoder runs once per call and is a small share of it
+                    record(f"diffusion_step/{scheduler_type}/{suffix}", diffusion, per=infer_steps)
+
+                frame_length = pipeline.duration_frame_length(duration)
+                latents = torch.randn(batch_size, 8, 16, frame_length, device=device, dtype=dtype)
+                scaled = latents / music_dcae.scale_factor + music_dcae.shift_factor
+                record(f"dcae_decode/{suffix}", lambda: music_dcae.dcae.decoder(scaled))
+                mels = music_dcae.dcae.decoder(scaled)
+                record(f"vocoder/{suffix}", lambda: music_dcae.vocoder.decode(mels.flatten(0, 1)))
+                record(f"latents_to_audio/{suffix}", lambda: music_dcae.decode(latents, sr=48000))
+                record(f"overlap_decode/{suffix}", lambda: music_dcae.decode_overlap(latents, sr=48000))
+
+                if batch_size == batch_sizes[0]:
+                    _, wavs = music_dcae.decode(latents, sr=48000)
+                    wav = wavs[0].float().cpu()
+                    path = os.path.join(output_dir, "bench.wav")
+                    record(f"file_write/duration={duration:g}", lambda: pipeline.write_wav_file(wav, path))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Lines describing every shared measurement and the names of those slower than the tolerance."""
+    lines, regressions = [], []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            continue
+        ratio = result["median_ms"] / max(previous["median_ms"], 1e-9)
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        lines.append(f"{name:<45} {previous['median_ms']:10.2f} -> {result['median_ms']:10.2f} ms  x{ratio:5.2f}{flag}")
+    return lines, regressions
+
+
+@click.command()
+@click.option("--durations", type=str, default="10,30", help="Song durations (seconds)")
+@click.option("--batch_sizes", type=str, default="1,2")
+@click.option("--infer_steps", type=int, default=4)
+@click.option("--repeats", type=int, default=3)
+@click.option("--dtype", type=click.Choice(["float32", "bfloat16"]), default="float32")
+@click.option("--threads", type=int, default=None, help="torch intra-op threads, default: torch's choice")
+@click.option("--output", type=str, default=None, help="Write the results as JSON to this file")
+@click.option("--baseline", type=str, default=None, help="JSON of an earlier run to compare against")
+@click.option("--tolerance", type=float, default=0.25, help="Allowed slowdown of a median, 0.25 = 25%")
+def main(durations, batch_sizes, infer_steps, repeats, dtype, threads, output, baseline, tolerance):
+    if threads:
+        torch.set_num_threads(threads)
+    pipeline = build_tiny_pipeline(dtype=dtype)
+    config = {
+        "durations": [float(value) for value in durations.split(",")],
+        "batch_sizes": [int(value) for value in batch_sizes.split(",")],
+        "infer_steps": infer_steps,
+        "repeats": repeats,
+        "dtype": dtype,
+    }
+    results = run_suite(pipeline, config["durations"], config["batch_sizes"], infer_steps, repeats)
+    report = {
+        "environment": {
+            "host": platform.node(),
+            "machine": platform.machine(),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "threads": torch.get_num_threads(),
+        },
+        "config": config,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {output}")
+
+    if baseline:
+        with open(baseline) as f:
+            baseline_report = json.load(f)
+        if baseline_report.get("config") != config:
+            print(f"Warning: baseline config {baseline_report.get('config')} differs from {config}")
+        lines, regressions = compare(results, baseline_report, tolerance)
+        print("\n".join(lines))
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print(f"No regression beyond {tolerance:.0%} against {baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Load time of the checkpoint components from ``from_pretrained`` versus weight bundles.
+
+For each component the script times ``from_pretrained`` followed by the cast to the pipeline
+dtype, and ``acestep.weight_bundles.load_bundle``, both up to the model being on ``--device``.
+"cold" evicts the files from the page cache first (posix_fadvise, Linux only, best effort),
+"warm" loads again right after. Missing bundles are exported first.
+
+    python benchmarks/bench_weight_bundles.py --checkpoint_dir ~/.cache/ace-step/checkpoints
+"""
+
+import os
+import sys
+import time
+
+import click
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from acestep.weight_bundles import (  # noqa: E402
+    COMPONENTS,
+    load_pretrained_component,
+    bundle_path,
+    export_bundles,
+    load_bundle,
+)
+
+
+def synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def evict(path):
+    files = [path] if os.path.isfile(path) else [
+        os.path.join(root, name) for root, _, names in os.walk(path) for name in names
+    ]
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for file_path in files:
+        with open(file_path, "rb") as f:
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def timed(device, fn):
+    synchronize(device)
+    start = time.perf_counter()
+    model = fn()
+    synchronize(device)
+    elapsed = time.perf_counter() - start
+    del model
+    return elapsed
+
+
+@click.command()
+@click.option("--checkpoint_dir", type=str, required=True)
+@click.option("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+@click.option("--dtype", type=click.Choice(["bfloat16", "float16", "float32"]), default="bfloat16")
+def main(checkpoint_dir, device, dtype):
+    device = torch.device(device)
+    dtype = getattr(torch, dtype)
+    export_bundles(checkpoint_dir, dtype)
+
+    for component, sub_dir in COMPONENTS.items():
+        source = os.path.join(checkpoint_dir, sub_dir)
+        bundle = bundle_path(checkpoint_dir, component, dtype)
+
+        def pretrained():
+            return load_pretrained_component(component, source, torch.float32).to(device=device, dtype=dtype)
+
+        def bundled():
+            return load_bundle(bundle, device=device)
+
+        results = []
+        for name, path, fn in (("from_pretrained", source, pretrained), ("bundle", bundle, bundled)):
+            evict(path)
+            cold = timed(device, fn)
+            warm = timed(device, fn)
+            results.append(f"{name} cold {cold:6.2f} s  warm {warm:6.2f} s")
+        print(f"{component:<22} " + "   ".join(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Randomly initialized, small-config versions of the ACE-Step models.
+
+The layer types, latent shapes, mel layout and upsampling factors are those of the released
+checkpoint, only the widths and depths are reduced, so every stage of the pipeline runs end to
+end on a CPU in seconds without checkpoints or network access. The numbers they produce are for
+comparing one revision of the code against another, not for estimating the full model.
+"""
+
+import os
+import sys
+import tempfile
+
+import torch
+from diffusers import AutoencoderDC
+from transformers import UMT5Config, UMT5EncoderModel
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from acestep.models.ace_step_transformer import ACEStepTransformer2DModel  # noqa: E402
+from acestep.models.lyrics_utils.lyric_encoder import ConformerEncoder  # noqa: E402
+from acestep.music_dcae.music_dcae_pipeline import MusicDCAE  # noqa: E402
+from acestep.music_dcae.music_vocoder import ADaMoSHiFiGANV1  # noqa: E402
+from acestep.pipeline_ace_step import ACEStepPipeline  # noqa: E402
+
+TEXT_EMBEDDING_DIM = 32
+SPEAKER_EMBEDDING_DIM = 16
+LYRIC_HIDDEN_SIZE = 64
+
+
+def build_tiny_lyric_encoder():
+    return ConformerEncoder(
+        input_size=LYRIC_HIDDEN_SIZE,
+        output_size=LYRIC_HIDDEN_SIZE,
+        attention_heads=4,
+        linear_units=4 * LYRIC_HIDDEN_SIZE,
+        num_blocks=2,
+        static_chunk_size=0,
+    )
+
+
+def build_tiny_transformer():
+    # keeps the vocabulary of the lyric tokenizer
+    transformer = ACEStepTransformer2DModel(
+        num_layers=2,
+        attention_head_dim=16,
+        num_attention_heads=4,
+        speaker_embedding_dim=SPEAKER_EMBEDDING_DIM,
+        text_embedding_dim=TEXT_EMBEDDING_DIM,
+        ssl_encoder_depths=[1, 1],
+        ssl_latent_dims=[16, 16],
+        lyric_hidden_size=LYRIC_HIDDEN_SIZE,
+    )
+    # the model always builds the 1024-wide, 6-block lyric encoder of the release
+    transformer.lyric_encoder = build_tiny_lyric_encoder()
+    return transformer
+
+
+def build_tiny_dcae():
+    # 4 stages, 3 of them downsampling: the f8c8 layout of 2 x 128 mel bins -> 8 x 16 latents
+    return AutoencoderDC(
+        in_channels=2,
+        latent_channels=8,
+        attention_head_dim=8,
+        encoder_block_types=("ResBlock", "ResBlock", "ResBlock", "EfficientViTBlock"),
+        decoder_block_types=("ResBlock", "ResBlock", "ResBlock", "EfficientViTBlock"),
+        encoder_block_out_channels=(16, 32, 32, 64),
+        decoder_block_out_channels=(16, 32, 32, 64),
+        encoder_layers_per_block=(1, 1, 1, 1),
+        decoder_layers_per_block=(1, 1, 1, 1),
+        encoder_qkv_multiscales=((), (), (), (5,)),
+        decoder_qkv_multiscales=((), (), (), (5,)),
+        upsample_block_type="interpolate",
+        downsample_block_type="Conv",
+        decoder_norm_types="rms_norm",
+        decoder_act_fns="silu",
+    )
+
+
+def build_tiny_vocoder():
+    # same 512x upsampling (hop length) as the released vocoder, narrow channels
+    return ADaMoSHiFiGANV1(
+        depths=[1, 1, 1, 1],
+        dims=[16, 16, 32, 32],
+        resblock_kernel_sizes=(3, 7),
+        resblock_dilation_sizes=((1, 3, 5), (1, 3, 5)),
+        num_mels=32,
+        upsample_initial_channel=64,
+    )
+
+
+def build_tiny_text_encoder():
+    return UMT5EncoderModel(
+        UMT5Config(vocab_size=1024, d_model=TEXT_EMBEDDING_DIM, d_kv=8, d_ff=64, num_layers=2, num_heads=4)
+    )
+
+
+def build_tiny_pipeline(dtype="float32", seed=0):
+    """ACEStepPipeline on the CPU with tiny random models in place of the checkpoint, lyric front end included."""
+    torch.manual_seed(seed)
+    pipeline = ACEStepPipeline(checkpoint_dir=tempfile.mkdtemp(prefix="ace-step-tiny-"), dtype=dtype)
+    pipeline.device = torch.device("cpu")
+    pipeline.ace_step_transformer = build_tiny_transformer().eval().to(pipeline.dtype)
+    pipeline.music_dcae = MusicDCAE.from_modules(build_tiny_dcae(), build_tiny_vocoder()).eval().to(pipeline.dtype)
+    pipeline.text_encoder_model = build_tiny_text_encoder().eval().to(pipeline.dtype)
+    pipeline.lang_segment, pipeline.lyric_tokenizer = pipeline.load_lyric_frontend()
+    pipeline.loaded = True
+    return pipeline
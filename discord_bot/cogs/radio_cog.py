@@ -175,7 +175,10 @@ class RadioCog(commands.Cog):
             
             # Track generation metrics
             if metrics:
-                metrics.record_song_generation(genre, language, generation_time)
+                metrics.record_song_generation(
+                    genre, language, generation_time,
+                    diffusion_evals=self.radio_engine.last_generation_stats.get("evaluations")
+                )
             
             # Convert for Discord
             try:
@@ -65,6 +65,46 @@ TORCH_DTYPE = "float16"  # float32 dla CPU
 TORCH_COMPILE = os.getenv("TORCH_COMPILE", "false").lower() == "true"  # Disabled by default on Windows
 OVERLAPPED_DECODE = os.getenv("OVERLAPPED_DECODE", "true" if CPU_OFFLOAD else "false").lower() == "true"
 TORCH_COMPILE_FALLBACK = True  # Auto-fallback to eager mode on torch_compile errors
+# Jeden forward z batchem cond/uncond zamiast 2-3 osobnych (więcej VRAM na krok)
+BATCHED_GUIDANCE = os.getenv("BATCHED_GUIDANCE", "false" if CPU_OFFLOAD else "true").lower() == "true"
+# Podwójne guidance (tekst / tekst + liryka) - oba > 1.0 dodają trzecią gałąź, 0 = wyłączone
+GUIDANCE_SCALE_TEXT = float(os.getenv("GUIDANCE_SCALE_TEXT", "0"))
+GUIDANCE_SCALE_LYRIC = float(os.getenv("GUIDANCE_SCALE_LYRIC", "0"))
+# Próg ponownego użycia głębokich bloków transformera między krokami (0 = wyłączone, ~0.1-0.3 = szybciej)
+FEATURE_CACHE_THRESHOLD = float(os.getenv("FEATURE_CACHE_THRESHOLD", "0"))
+# Sampler: euler / heun / pingpong / dpm++ / adaptive (adaptive sam dobiera krok, limit = liczba kroków)
+SCHEDULER_TYPE = os.getenv("SCHEDULER_TYPE", "euler")
+# Tolerancja błędu dla samplera adaptive (mniej = więcej kroków, lepsza jakość)
+ADAPTIVE_TOLERANCE = float(os.getenv("ADAPTIVE_TOLERANCE", "0.05"))
+# Długie utwory generowane oknami (sekundy, 0 = wyłączone) - stała pamięć niezależnie od długości
+LONG_FORM_WINDOW = float(os.getenv("LONG_FORM_WINDOW", "0"))
+LONG_FORM_OVERLAP = float(os.getenv("LONG_FORM_OVERLAP", "10"))
+# Kolejne okna long-form to kontynuacje (extend), których sampler adaptive nie obsługuje
+if SCHEDULER_TYPE == "adaptive" and LONG_FORM_WINDOW > 0:
+    raise ValueError("SCHEDULER_TYPE=adaptive does not support LONG_FORM_WINDOW > 0, use euler / heun / pingpong / dpm++")
+# Trwały cache torch.compile (podkatalog per hash modelu, wersja torch, dtype) - kompilacja raz, nie per utwór
+COMPILE_CACHE_DIR = Path(os.getenv("COMPILE_CACHE_DIR", str(CACHE_DIR / "torch_compile")))
+# Długości utworów (sekundy), dla których transformer jest kompilowany przy starcie (pusty = bez rozgrzewki)
+COMPILE_WARMUP_DURATIONS = [
+    float(d) for d in os.getenv("COMPILE_WARMUP_DURATIONS", "30,60,120,180,240").split(",") if d.strip()
+]
+# Długość utworu dopełniana (z maską) do najbliższego kubełka - stałe kształty dla torch.compile.
+# Domyślnie kubełki = długości z rozgrzewki przy TORCH_COMPILE, bez kompilacji wyłączone
+DURATION_BUCKETS = [
+    float(d)
+    for d in os.getenv(
+        "DURATION_BUCKETS", ",".join(str(d) for d in COMPILE_WARMUP_DURATIONS) if TORCH_COMPILE else ""
+    ).split(",")
+    if d.strip()
+]
+# Bez GPU: wagi Linear transformera i UMT5 jako int8 (dynamiczna kwantyzacja, cache w checkpoints/int8_dynamic)
+CPU_INT8 = os.getenv("CPU_INT8", "false" if LLM_GPU_ENABLED else "true").lower() == "true"
+# Lokalny eksport int4/int8 (python -m acestep.quantized_export), brak eksportu = pełny checkpoint
+QUANTIZED_CHECKPOINT = os.getenv("QUANTIZED_CHECKPOINT", "false").lower() == "true"
+QUANTIZED_DIR = os.getenv("QUANTIZED_DIR") or None  # Domyślnie <checkpoint>/quantized
+# Bez GPU: przy pierwszym starcie dobierz wątki / bf16 autocast / channels-last i zapisz per host
+CPU_AUTOTUNE = os.getenv("CPU_AUTOTUNE", "false" if LLM_GPU_ENABLED else "true").lower() == "true"
+CPU_TUNING_FILE = Path(os.getenv("CPU_TUNING_FILE", str(CACHE_DIR / "cpu_tuning.json")))
 
 # ACE-Step defaults z radio_gradio.py (after CPU_OFFLOAD is defined)
 DEFAULT_GENRE = "pop"
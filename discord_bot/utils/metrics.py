@@ -23,6 +23,7 @@ class BotMetrics:
     # Performance
     avg_generation_time: float = 0.0
     avg_queue_length: float = 0.0
+    avg_diffusion_evals: float = 0.0
     
     # System
     peak_memory_usage: float = 0.0
@@ -55,6 +56,7 @@ class MetricsCollector:
         
         # Statistics storage
         self.generation_times: List[float] = []
+        self.diffusion_evals: List[int] = []
         self.queue_lengths: List[int] = []
         self.genre_stats: Dict[str, int] = {}
         self.language_stats: Dict[str, int] = {}
@@ -73,8 +75,9 @@ class MetricsCollector:
         # Load existing data
         self.load_metrics()
     
-    def record_song_generation(self, genre: str, language: str, generation_time: float):
-        """Zapisz generowanie utworu"""
+    def record_song_generation(self, genre: str, language: str, generation_time: float,
+                               diffusion_evals: Optional[int] = None):
+        """Zapisz generowanie utworu (diffusion_evals = liczba kroków samplera)"""
         self.metrics.total_songs_generated += 1
         self.generation_times.append(generation_time)
         
@@ -83,6 +86,12 @@ class MetricsCollector:
             self.generation_times.pop(0)
         self.metrics.avg_generation_time = sum(self.generation_times) / len(self.generation_times)
         
+        if diffusion_evals is not None:
+            self.diffusion_evals.append(diffusion_evals)
+            if len(self.diffusion_evals) > 100:
+                self.diffusion_evals.pop(0)
+            self.metrics.avg_diffusion_evals = sum(self.diffusion_evals) / len(self.diffusion_evals)
+        
         # Update genre/language stats
         self.genre_stats[genre] = self.genre_stats.get(genre, 0) + 1
         self.language_stats[language] = self.language_stats.get(language, 0) + 1
@@ -189,6 +198,7 @@ class MetricsCollector:
             "generation": {
                 "total_songs": self.metrics.total_songs_generated,
                 "avg_time": round(self.metrics.avg_generation_time, 2),
+                "avg_diffusion_evals": round(self.metrics.avg_diffusion_evals, 1),
                 "songs_per_hour": round(self.metrics.total_songs_generated / (uptime.total_seconds() / 3600), 2) if uptime.total_seconds() > 0 else 0
             },
             "activity": {
@@ -222,6 +232,7 @@ class MetricsCollector:
                 "all_commands": self.command_stats,
                 "error_breakdown": self.error_stats,
                 "recent_generation_times": self.generation_times[-20:],  # Last 20
+                "recent_diffusion_evals": self.diffusion_evals[-20:],  # Last 20
                 "recent_queue_lengths": self.queue_lengths[-50:]  # Last 50
             },
             "metrics": self.metrics.to_dict()
@@ -236,6 +247,7 @@ class MetricsCollector:
             with open(self.stats_file, 'w', encoding='utf-8') as f:
                 stats = {
                     "generation_times": self.generation_times,
+                    "diffusion_evals": self.diffusion_evals,
                     "queue_lengths": self.queue_lengths,
                     "genre_stats": self.genre_stats,
                     "language_stats": self.language_stats,
@@ -264,6 +276,7 @@ class MetricsCollector:
                 with open(self.stats_file, 'r', encoding='utf-8') as f:
                     data = json.load(f)
                     self.generation_times = data.get("generation_times", [])
+                    self.diffusion_evals = data.get("diffusion_evals", [])
                     self.queue_lengths = data.get("queue_lengths", [])
                     self.genre_stats = data.get("genre_stats", {})
                     self.language_stats = data.get("language_stats", {})
@@ -278,6 +291,7 @@ class MetricsCollector:
         self.metrics = BotMetrics()
         self.metrics.bot_start_time = datetime.now().isoformat()
         self.generation_times.clear()
+        self.diffusion_evals.clear()
         self.queue_lengths.clear()
         self.genre_stats.clear()
         self.language_stats.clear()
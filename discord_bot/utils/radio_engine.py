@@ -9,13 +9,14 @@ import os
 import time
 import gc
 import uuid
+import wave
 from pathlib import Path
-from typing import Optional, Tuple
-from llama_cpp import Llama
+from typing import Optional, Tuple, TYPE_CHECKING
 
-# Import from ACE-Step
-from acestep.pipeline_ace_step import ACEStepPipeline
-from acestep.schedulers import FlowMatchEulerDiscreteScheduler
+# llama_cpp i ACE-Step (spaCy, diffusers, transformers) importujemy dopiero przy ładowaniu
+# modeli - sam import bota i cogów jest dzięki temu szybki
+if TYPE_CHECKING:
+    from acestep.pipeline_ace_step import ACEStepPipeline
 
 # Local imports
 import sys
@@ -51,6 +52,11 @@ class RadioEngine:
         # Model instances (will be loaded on demand)
         self.llm = None
         self.ace_pipeline = None
+        # Statystyki dyfuzji ostatniej generacji (liczba kroków itp.)
+        self.last_generation_stats = {}
+        # Rozgrzewka torch.compile raz na proces, kolejne ładowania trafiają w trwały cache
+        self.compile_warmed_up = False
+        self.last_compile_report = {}
         
         print(f"RadioEngine initialized - Device: {self.device}, CPU Offload: {cpu_offload}")
     
@@ -91,6 +97,8 @@ class RadioEngine:
                     print(f"🔍 llama-cpp info check failed: {e}")
                 
                 
+                from llama_cpp import Llama
+                
                 self.llm = Llama(
                     model_path=model_path,
                     n_ctx=LLM_CONTEXT_SIZE,
@@ -149,15 +157,17 @@ class RadioEngine:
                 torch.cuda.empty_cache()
             gc.collect()
     
-    def _load_ace_pipeline(self) -> ACEStepPipeline:
+    def _load_ace_pipeline(self) -> "ACEStepPipeline":
         """Załaduj ACE-Step Pipeline"""
         if self.ace_pipeline is None:
             print("Loading ACE-Step Pipeline...")
+            from acestep.pipeline_ace_step import ACEStepPipeline
             
             # Try with torch_compile first, fallback to eager mode if it fails
             torch_compile_enabled = TORCH_COMPILE
             
-            # Clear torch compile cache to prevent FileExistsError on Windows  
+            # Stały katalog cache (pipeline dobiera podkatalog per model / torch / dtype),
+            # skompilowane kernele przeżywają unload pipeline i restart bota
             if torch_compile_enabled:
                 try:
                     import torch._dynamo
@@ -165,18 +175,10 @@ class RadioEngine:
                     # For Windows: Set suppress_errors to enable graceful fallback to eager
                     torch._dynamo.config.suppress_errors = True
                     torch._dynamo.config.verbose = False
-                    
-                    # Set cache environment for better Windows compatibility
                     os.environ['TORCH_COMPILE_DEBUG'] = '0'
-                    os.environ['TORCHDYNAMO_CACHE_SIZE_LIMIT'] = '1'
                     
-                    # Create unique temp directory for this session
-                    session_id = str(uuid.uuid4())[:8]
-                    temp_cache_dir = self.temp_dir / f"torch_cache_{session_id}"
-                    temp_cache_dir.mkdir(exist_ok=True)
-                    os.environ['TORCHINDUCTOR_CACHE_DIR'] = str(temp_cache_dir)
-                    
-                    print(f"🔧 torch_compile setup: suppress_errors=True, cache_dir={temp_cache_dir}")
+                    COMPILE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                    print(f"🔧 torch_compile setup: suppress_errors=True, cache_dir={COMPILE_CACHE_DIR}")
                     
                 except Exception as e:
                     print(f"⚠️ torch_compile setup failed: {e}")
@@ -190,17 +192,25 @@ class RadioEngine:
                 # Use bfloat16 for better performance (works with CPU offload too)
                 dtype = "bfloat16"
                 print(f"🔧 Using dtype: {dtype}")
-                print(f"🔧 FIXED: ACE-Step quantized CPU offload bugs + disabled quantized (repo missing)")
+                print(f"🔧 Quantized checkpoint: {QUANTIZED_CHECKPOINT}")
                 
                 self.ace_pipeline = ACEStepPipeline(
                     checkpoint_dir=self.checkpoint_path,
                     dtype=dtype,
                     torch_compile=torch_compile_enabled,  # Use official recommendation
                     cpu_offload=self.cpu_offload,  # Pass CPU offload setting
-                    quantized=False,  # FIXED: Disable quantized (repo doesn't exist)
-                    overlapped_decode=OVERLAPPED_DECODE  # Official 8GB VRAM optimization
+                    quantized=QUANTIZED_CHECKPOINT,  # Lokalny eksport, bez niego pełny checkpoint
+                    quantized_dir=QUANTIZED_DIR,
+                    overlapped_decode=OVERLAPPED_DECODE,  # Official 8GB VRAM optimization
+                    compile_cache_dir=str(COMPILE_CACHE_DIR),
+                    duration_buckets=DURATION_BUCKETS,
+                    cpu_int8=CPU_INT8,
+                    cpu_autotune=CPU_AUTOTUNE,
+                    cpu_tuning_file=str(CPU_TUNING_FILE)
                 )
                 print(f"✅ ACE-Step Pipeline loaded - CPU offload: {self.ace_pipeline.cpu_offload}")
+                if torch_compile_enabled and not self.compile_warmed_up and COMPILE_WARMUP_DURATIONS:
+                    self._warmup_compile()
             except Exception as e:
                 if torch_compile_enabled and TORCH_COMPILE_FALLBACK:
                     print(f"⚠️ torch_compile failed ({e}), falling back to eager mode...")
@@ -212,21 +222,58 @@ class RadioEngine:
                     # Use bfloat16 for better performance (works with CPU offload too)
                     dtype = "bfloat16"
                     print(f"🔧 Using dtype: {dtype}")
-                    print(f"🔧 FIXED: ACE-Step quantized CPU offload bugs + disabled quantized (repo missing)")
+                    print(f"🔧 Quantized checkpoint: {QUANTIZED_CHECKPOINT}")
                     
                     self.ace_pipeline = ACEStepPipeline(
                         checkpoint_dir=self.checkpoint_path,
                         dtype=dtype,
                         torch_compile=False,  # Disabled for Windows compatibility
                         cpu_offload=self.cpu_offload,
-                        quantized=False,  # FIXED: Disable quantized (repo doesn't exist)
-                        overlapped_decode=OVERLAPPED_DECODE
+                        quantized=QUANTIZED_CHECKPOINT,  # Lokalny eksport, bez niego pełny checkpoint
+                        quantized_dir=QUANTIZED_DIR,
+                        overlapped_decode=OVERLAPPED_DECODE,
+                        cpu_int8=CPU_INT8,
+                        cpu_autotune=CPU_AUTOTUNE,
+                        cpu_tuning_file=str(CPU_TUNING_FILE)
                     )
                     print(f"✅ ACE-Step Pipeline loaded in eager mode - CPU offload: {self.ace_pipeline.cpu_offload}")
                 else:
                     raise
         return self.ace_pipeline
     
+    @staticmethod
+    def _diffusion_settings() -> dict:
+        """Ustawienia dyfuzji wspólne dla generacji i rozgrzewki torch.compile"""
+        return dict(
+            guidance_scale=15.0,
+            guidance_scale_text=GUIDANCE_SCALE_TEXT,
+            guidance_scale_lyric=GUIDANCE_SCALE_LYRIC,
+            scheduler_type=SCHEDULER_TYPE,
+            cfg_type="apg",
+            omega_scale=10.0,
+            batched_guidance=BATCHED_GUIDANCE,
+            feature_cache_threshold=FEATURE_CACHE_THRESHOLD,
+            adaptive_tolerance=ADAPTIVE_TOLERANCE,
+        )
+    
+    def _warmup_compile(self) -> None:
+        """Skompiluj transformer dla długości z COMPILE_WARMUP_DURATIONS (raz na proces)"""
+        try:
+            print(f"🔥 torch_compile warm-up: {COMPILE_WARMUP_DURATIONS} s")
+            # Krótka generacja z tymi samymi ustawieniami dyfuzji co utwory - te same grafy co w generacji
+            report = self.ace_pipeline.warmup_compile(
+                durations=COMPILE_WARMUP_DURATIONS,
+                batch_sizes=(1,),
+                **self._diffusion_settings(),
+            )
+            print(
+                f"✅ Warm-up: {report.get('warmup_seconds', 0)}s, "
+                f"cache hit {report.get('fx_graph_cache_hits', 0)} / miss {report.get('fx_graph_cache_misses', 0)}"
+            )
+        except Exception as e:
+            print(f"⚠️ torch_compile warm-up failed: {e}")
+        self.compile_warmed_up = True
+    
     def _unload_ace_pipeline(self) -> None:
         """Zwolnij ACE-Step Pipeline z pamięci"""
         if self.ace_pipeline is not None:
@@ -247,7 +294,7 @@ class RadioEngine:
             torch.cuda.empty_cache()
             torch.cuda.reset_peak_memory_stats()
         
-        # Clean torch compile cache
+        # Usuń stare katalogi torch_cache_<uuid> z poprzednich wersji (trwały cache jest w COMPILE_CACHE_DIR)
         try:
             torch_cache_dirs = list(self.temp_dir.glob("torch_cache_*"))
             for cache_dir in torch_cache_dirs:
@@ -392,12 +439,21 @@ class RadioEngine:
                     prompt=tags,
                     lyrics=lyrics,
                     infer_step=27,
-                    guidance_scale=15.0,
-                    scheduler_type="euler",
-                    cfg_type="apg",
-                    omega_scale=10.0,
-                    batch_size=1
+                    batch_size=1,
+                    **self._diffusion_settings(),
+                    long_form_window=LONG_FORM_WINDOW,
+                    long_form_overlap=LONG_FORM_OVERLAP,
+                    # PCM w pamięci zamiast zapisu float WAV i ponownego odczytu przez ffmpeg
+                    output_mode="pcm16_bytes"
                 )
+                self.last_generation_stats = dict(pipeline.last_diffusion_stats)
+                self.last_compile_report = dict(pipeline.last_compile_report)
+                if self.last_compile_report:
+                    print(
+                        f"🔧 torch_compile: cache hit {self.last_compile_report.get('fx_graph_cache_hits', 0)} / "
+                        f"miss {self.last_compile_report.get('fx_graph_cache_misses', 0)}"
+                    )
+                print(f"📊 Diffusion: {self.last_generation_stats.get('evaluations')} kroków")
                 
                 # Monitor VRAM during generation
                 if torch.cuda.is_available():
@@ -409,7 +465,9 @@ class RadioEngine:
                 allocated_after_gen = torch.cuda.memory_allocated() / (1024 ** 3)
                 print(f"🔍 VRAM after generation: {allocated_after_gen:.2f}GB")
             
-            audio_path = Path(results[0])
+            # Zapis od razu w formacie Discord (48kHz, stereo, s16) - convert_for_discord pomija ffmpeg
+            audio_path = self.output_dir / f"radio_{uuid.uuid4().hex}.wav"
+            self._write_pcm16_wav(audio_path, results[0])
             print(f"Music generated: {audio_path}")
             return audio_path
             
@@ -448,6 +506,28 @@ class RadioEngine:
         
         return audio_path
     
+    @staticmethod
+    def _write_pcm16_wav(path: Path, pcm: bytes) -> None:
+        """Zapisz interleaved s16le PCM jako WAV w formacie Discord"""
+        with wave.open(str(path), "wb") as wav_file:
+            wav_file.setnchannels(DISCORD_CHANNELS)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(DISCORD_SAMPLE_RATE)
+            wav_file.writeframes(pcm)
+    
+    @staticmethod
+    def _is_discord_wav(audio_path: Path) -> bool:
+        """Czy plik jest już WAV 48kHz stereo s16 (nie wymaga konwersji)"""
+        try:
+            with wave.open(str(audio_path), "rb") as wav_file:
+                return (
+                    wav_file.getframerate() == DISCORD_SAMPLE_RATE
+                    and wav_file.getnchannels() == DISCORD_CHANNELS
+                    and wav_file.getsampwidth() == 2
+                )
+        except (wave.Error, EOFError, OSError):
+            return False
+    
     def convert_for_discord(self, audio_path: Path) -> Path:
         """
         Konwertuj audio dla Discord (WAV 48kHz stereo)
@@ -458,6 +538,10 @@ class RadioEngine:
         Returns:
             Path: Ścieżka do skonwertowanego pliku
         """
+        if self._is_discord_wav(audio_path):
+            print(f"✅ Audio already in Discord format: {audio_path}")
+            return audio_path
+        
         try:
             output_path = self.temp_dir / f"discord_{audio_path.stem}.wav"
             
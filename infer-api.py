@@ -1,11 +1,21 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 import os
+import json
+import queue
+import struct
+import threading
 from acestep.pipeline_ace_step import ACEStepPipeline
 from acestep.data_sampler import DataSampler
 import uuid
 
+STREAM_SAMPLE_RATE = 48000
+STREAM_CHANNELS = 2
+STREAM_SAMPLE_WIDTH = 2  # 16-bit PCM
+STREAM_QUEUE_SIZE = 8
+
 app = FastAPI(title="ACEStep Pipeline API")
 
 class ACEStepInput(BaseModel):
@@ -33,6 +43,11 @@ class ACEStepInput(BaseModel):
     guidance_scale_text: float = 0.0
     guidance_scale_lyric: float = 0.0
 
+class ACEStepStreamInput(ACEStepInput):
+    # "wav": a RIFF header sized for the whole clip followed by PCM data
+    # "pcm": a JSON header line followed by raw interleaved s16le PCM
+    stream_format: str = "wav"
+
 class ACEStepOutput(BaseModel):
     status: str
     output_path: Optional[str]
@@ -97,6 +112,129 @@ async def generate_audio(input_data: ACEStepInput):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating audio: {str(e)}")
 
+def wav_header(sample_rate: int, num_samples: int) -> bytes:
+    block_align = STREAM_CHANNELS * STREAM_SAMPLE_WIDTH
+    data_size = num_samples * block_align
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, STREAM_CHANNELS, sample_rate, sample_rate * block_align, block_align, STREAM_SAMPLE_WIDTH * 8,
+        b"data", data_size,
+    )
+
+def pcm_header(sample_rate: int, num_samples: int) -> bytes:
+    header = {
+        "sample_rate": sample_rate,
+        "channels": STREAM_CHANNELS,
+        "sample_format": "s16le",
+        "num_samples": num_samples,
+    }
+    return (json.dumps(header) + "\n").encode("utf-8")
+
+def to_pcm16_bytes(wav_chunk) -> bytes:
+    pcm = (wav_chunk.clamp(-1.0, 1.0) * 32767.0).round().short()
+    return pcm.t().contiguous().numpy().tobytes()
+
+@app.post("/generate_stream")
+def generate_audio_stream(input_data: ACEStepStreamInput):
+    if input_data.audio_duration <= 0:
+        raise HTTPException(status_code=400, detail="audio_duration must be positive for streaming")
+    if input_data.stream_format not in ("wav", "pcm"):
+        raise HTTPException(status_code=400, detail=f"Unsupported stream_format: {input_data.stream_format}")
+
+    try:
+        model_demo = initialize_pipeline(
+            input_data.checkpoint_path,
+            input_data.bf16,
+            input_data.torch_compile,
+            input_data.device_id
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error initializing pipeline: {str(e)}")
+
+    num_samples = ACEStepPipeline.num_audio_samples(input_data.audio_duration, STREAM_SAMPLE_RATE)
+    total_bytes = num_samples * STREAM_CHANNELS * STREAM_SAMPLE_WIDTH
+    chunks = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+    cancelled = threading.Event()
+
+    def on_audio_chunk(batch_index, start_sample, wav_chunk):
+        data = to_pcm16_bytes(wav_chunk)
+        while True:
+            if cancelled.is_set():
+                raise RuntimeError("Client disconnected, generation cancelled")
+            try:
+                chunks.put(data, timeout=1.0)
+                return
+            except queue.Full:
+                continue
+
+    def run_pipeline():
+        try:
+            model_demo(
+                audio_duration=input_data.audio_duration,
+                prompt=input_data.prompt,
+                lyrics=input_data.lyrics,
+                infer_step=input_data.infer_step,
+                guidance_scale=input_data.guidance_scale,
+                scheduler_type=input_data.scheduler_type,
+                cfg_type=input_data.cfg_type,
+                omega_scale=input_data.omega_scale,
+                manual_seeds=", ".join(map(str, input_data.actual_seeds)),
+                guidance_interval=input_data.guidance_interval,
+                guidance_interval_decay=input_data.guidance_interval_decay,
+                min_guidance_scale=input_data.min_guidance_scale,
+                use_erg_tag=input_data.use_erg_tag,
+                use_erg_lyric=input_data.use_erg_lyric,
+                use_erg_diffusion=input_data.use_erg_diffusion,
+                oss_steps=", ".join(map(str, input_data.oss_steps)),
+                guidance_scale_text=input_data.guidance_scale_text,
+                guidance_scale_lyric=input_data.guidance_scale_lyric,
+                audio_chunk_callback=on_audio_chunk,
+            )
+        except Exception as e:
+            if not cancelled.is_set():
+                chunks.put(e)
+        finally:
+            if not cancelled.is_set():
+                chunks.put(None)
+
+    def stream_body():
+        if input_data.stream_format == "wav":
+            yield wav_header(STREAM_SAMPLE_RATE, num_samples)
+        else:
+            yield pcm_header(STREAM_SAMPLE_RATE, num_samples)
+
+        worker = threading.Thread(target=run_pipeline, daemon=True)
+        worker.start()
+        sent_bytes = 0
+        try:
+            while True:
+                item = chunks.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                item = item[: total_bytes - sent_bytes]
+                if item:
+                    sent_bytes += len(item)
+                    yield item
+            # keep the advertised length exact so the header stays valid
+            if sent_bytes < total_bytes:
+                yield bytes(total_bytes - sent_bytes)
+        finally:
+            cancelled.set()
+
+    media_type = "audio/wav" if input_data.stream_format == "wav" else "application/octet-stream"
+    return StreamingResponse(
+        stream_body(),
+        media_type=media_type,
+        headers={
+            "X-Sample-Rate": str(STREAM_SAMPLE_RATE),
+            "X-Channels": str(STREAM_CHANNELS),
+            "X-Num-Samples": str(num_samples),
+        },
+    )
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
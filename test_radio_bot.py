@@ -4,7 +4,10 @@ Basic tests dla ACE-Step Discord Radio Bot
 
 import pytest
 import asyncio
+import os
+import subprocess
 import sys
+import torch
 from pathlib import Path
 from datetime import datetime
 from unittest.mock import Mock, AsyncMock, patch
@@ -235,6 +238,490 @@ class TestConstants:
         for lang in enum_languages:
             assert lang in queue_languages
 
+def import_times(module):
+    """Import `module` in a fresh interpreter with -X importtime, returns {module: cumulative us}"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+class TestFusedSchedulerStep:
+    """Test that the fused flow-match step matches the previous unfused updates"""
+    
+    @staticmethod
+    def rescale_omega(omega):
+        # the previous numpy logistic rescale
+        import numpy as np
+        return 0.9 + 0.2 / (1 + np.exp(-0.1 * omega))
+    
+    @classmethod
+    def mean_shift(cls, sample, dx, omega, dtype):
+        m = dx.mean()
+        return (sample + (dx - m) * cls.rescale_omega(omega) + m).to(dtype)
+    
+    def run_steps(self, scheduler, reference_step, dtype, num_steps=5):
+        """Runs both paths from the same latents, each on its own previous output"""
+        scheduler.set_timesteps(num_steps)
+        generator = torch.Generator().manual_seed(0)
+        fused_sample = reference_sample = torch.randn(1, 8, 16, 24, generator=generator).to(dtype)
+        # bfloat16 outputs may round to a neighbouring value, float32 ones must agree closely
+        tolerance = {} if dtype == torch.bfloat16 else {"rtol": 1e-5, "atol": 1e-5}
+        outputs = []
+        for t in scheduler.timesteps:
+            model_output = torch.randn(1, 8, 16, 24, generator=generator).to(dtype)
+            if scheduler.step_index is None:
+                scheduler._init_step_index(t)
+            step_index = scheduler.step_index
+            fused_sample = scheduler.step(
+                model_output=model_output, timestep=t, sample=fused_sample, omega=10.0, return_dict=False
+            )[0]
+            reference_sample = reference_step(step_index, reference_sample, model_output)
+            torch.testing.assert_close(fused_sample, reference_sample, **tolerance)
+            # a returned sample stays valid until the step after next
+            if len(outputs) >= 1:
+                torch.testing.assert_close(outputs[-1][0], outputs[-1][1])
+            outputs.append((fused_sample, fused_sample.clone()))
+        # the two output buffers are used in turn
+        assert outputs[0][0].data_ptr() == outputs[2][0].data_ptr()
+        assert outputs[0][0].data_ptr() != outputs[1][0].data_ptr()
+    
+    @pytest.mark.parametrize("dtype", [torch.float32, torch.bfloat16])
+    def test_euler(self, dtype):
+        """Test the fused Euler step against the previous mean-shift update"""
+        pytest.importorskip("diffusers")
+        from acestep.schedulers import FlowMatchEulerDiscreteScheduler
+        
+        scheduler = FlowMatchEulerDiscreteScheduler(num_train_timesteps=1000, shift=3.0)
+        
+        def reference_step(step_index, sample, model_output):
+            sigma, sigma_next = scheduler.sigmas[step_index], scheduler.sigmas[step_index + 1]
+            dx = (sigma_next - sigma) * model_output
+            return self.mean_shift(sample.to(torch.float32), dx, 10.0, model_output.dtype)
+        
+        self.run_steps(scheduler, reference_step, dtype)
+    
+    @pytest.mark.parametrize("dtype", [torch.float32, torch.bfloat16])
+    def test_heun(self, dtype):
+        """Test the fused Heun step, including the stored first-order sample, against the previous update"""
+        pytest.importorskip("diffusers")
+        from acestep.schedulers import FlowMatchHeunDiscreteScheduler
+        
+        scheduler = FlowMatchHeunDiscreteScheduler(num_train_timesteps=1000, shift=3.0)
+        state = {}
+        
+        def reference_step(step_index, sample, model_output):
+            sample = sample.to(torch.float32)
+            if not state:
+                sigma, sigma_next = scheduler.sigmas[step_index], scheduler.sigmas[step_index + 1]
+                derivative = (sample - (sample - model_output * sigma)) / sigma
+                dt = sigma_next - sigma
+                state.update(derivative=derivative, dt=dt, sample=sample)
+            else:
+                sigma_next = scheduler.sigmas[step_index]
+                derivative = (sample - (sample - model_output * sigma_next)) / sigma_next
+                derivative = 0.5 * (state["derivative"] + derivative)
+                dt, sample = state["dt"], state["sample"]
+                state.clear()
+            return self.mean_shift(sample, derivative * dt, 10.0, model_output.dtype)
+        
+        self.run_steps(scheduler, reference_step, dtype)
+
+class TestLongForm:
+    """Test that long-form generation rejects the adaptive sampler before diffusing"""
+    
+    def test_adaptive_rejected(self, tmp_path):
+        """Test that long-form with scheduler_type='adaptive' fails before the first window"""
+        pytest.importorskip("diffusers")
+        from acestep.pipeline_ace_step import ACEStepPipeline
+        
+        # models are not loaded, any diffusion would fail with another error
+        pipeline = ACEStepPipeline(checkpoint_dir=str(tmp_path), dtype="float32")
+        with pytest.raises(ValueError, match="adaptive"):
+            pipeline.text2music_long_form_process(
+                duration=300.0, lyrics="", batch_size=1, window_duration=120.0, scheduler_type="adaptive"
+            )
+    
+    def test_adaptive_settings_rejected(self):
+        """Test that the bot settings refuse SCHEDULER_TYPE=adaptive with LONG_FORM_WINDOW"""
+        pytest.importorskip("dotenv")
+        env = dict(os.environ, SCHEDULER_TYPE="adaptive", LONG_FORM_WINDOW="120")
+        result = subprocess.run(
+            [sys.executable, "-c", "import discord_bot.config.settings"],
+            cwd=Path(__file__).parent,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        assert result.returncode != 0
+        assert "LONG_FORM_WINDOW" in result.stderr
+
+class TestImportTime:
+    """Test that heavy dependencies are imported on first use, not on import"""
+    
+    def test_radio_engine_defers_models(self, record_property):
+        """Test that importing the bot engine does not pull in ACE-Step or llama_cpp"""
+        times = import_times("discord_bot.utils.radio_engine")
+        record_property("import_time_ms", times["discord_bot.utils.radio_engine"] / 1000)
+        assert "acestep.pipeline_ace_step" not in times
+        assert "llama_cpp" not in times
+    
+    def test_lyric_tokenizer_defers_normalizers(self, record_property):
+        """Test that the lyric tokenizer imports its language normalizers lazily"""
+        pytest.importorskip("tokenizers")
+        module = "acestep.models.lyrics_utils.lyric_tokenizer"
+        times = import_times(module)
+        record_property("import_time_ms", times[module] / 1000)
+        for heavy in ("spacy", "pypinyin", "hangul_romanize", "num2words"):
+            assert heavy not in times
+
+class TestDurationBuckets:
+    """Test that padding text2music to a duration bucket does not change the result"""
+    
+    @staticmethod
+    def make_pipeline(tmp_path, duration_buckets):
+        pytest.importorskip("diffusers")
+        from acestep.pipeline_ace_step import ACEStepPipeline
+        from acestep.models.ace_step_transformer import ACEStepTransformer2DModel
+        from acestep.models.lyrics_utils.lyric_encoder import ConformerEncoder
+        
+        pipeline = ACEStepPipeline(checkpoint_dir=str(tmp_path), dtype="float32", duration_buckets=duration_buckets)
+        pipeline.device = torch.device("cpu")
+        torch.manual_seed(0)
+        transformer = ACEStepTransformer2DModel(
+            num_layers=2,
+            attention_head_dim=16,
+            num_attention_heads=4,
+            speaker_embedding_dim=8,
+            text_embedding_dim=16,
+            ssl_encoder_depths=[1, 1],
+            ssl_latent_dims=[8, 8],
+            lyric_encoder_vocab_size=32,
+            lyric_hidden_size=32,
+        )
+        # the lyric encoder always outputs 1024 features, a narrow one has to match lyric_proj
+        transformer.lyric_encoder = ConformerEncoder(
+            input_size=32, output_size=32, attention_heads=4, linear_units=64, num_blocks=1, static_chunk_size=0
+        )
+        pipeline.ace_step_transformer = transformer.eval()
+        return pipeline
+    
+    def generate(self, pipeline, duration):
+        random_generators, _ = pipeline.set_seeds(1, [42])
+        return pipeline.text2music_diffusion_process(
+            duration=duration,
+            encoder_text_hidden_states=torch.randn(1, 5, 16, generator=torch.Generator().manual_seed(1)),
+            text_attention_mask=torch.ones(1, 5),
+            speaker_embds=torch.zeros(1, 8),
+            lyric_token_ids=torch.arange(6)[None],
+            lyric_mask=torch.ones(1, 6, dtype=torch.long),
+            random_generators=random_generators,
+            infer_steps=3,
+        )
+    
+    def test_bucket_frame_length(self, tmp_path):
+        """Test bucket selection"""
+        pipeline = self.make_pipeline(tmp_path, [60, 30])
+        assert pipeline.duration_buckets == [30.0, 60.0]
+        assert pipeline.bucket_frame_length(pipeline.duration_frame_length(20)) == pipeline.duration_frame_length(30)
+        assert pipeline.bucket_frame_length(pipeline.duration_frame_length(45)) == pipeline.duration_frame_length(60)
+        # longer than every bucket: exact length
+        assert pipeline.bucket_frame_length(1000) == 1000
+    
+    def test_warmup_shapes(self, tmp_path):
+        """Test that the compile warm-up covers every guidance batch size and fits dynamo's cache"""
+        from acestep.compile_cache import warmup_cache_size_limit
+        
+        pipeline = self.make_pipeline(tmp_path, None)
+        assert pipeline.guidance_batch_sizes(1) == (1,)
+        assert pipeline.guidance_batch_sizes(1, batched_guidance=True) == (1, 2)
+        assert pipeline.guidance_batch_sizes(
+            1, batched_guidance=True, guidance_scale_text=5.0, guidance_scale_lyric=1.5
+        ) == (1, 3)
+        durations = [30, 60, 90, 120, 180, 240, 300]
+        assert warmup_cache_size_limit(durations, (1, 3)) >= 2 * 2 * 7 * 2
+        assert warmup_cache_size_limit(durations, (1, 3), erg_query_scales=True) >= 2 * 2 * 2 * 7 * 2
+    
+    def test_padded_matches_unpadded(self, tmp_path):
+        """Test that a padded run returns the latents of the unpadded run"""
+        unpadded = self.generate(self.make_pipeline(tmp_path, None), duration=5.0)
+        padded = self.generate(self.make_pipeline(tmp_path, [8.0]), duration=5.0)
+        assert padded.shape == unpadded.shape
+        assert torch.isfinite(padded).all()
+        assert torch.allclose(padded, unpadded, atol=1e-4, rtol=1e-4)
+
+class TestCrossAttentionKVCache:
+    """Test that caching the cross-attention keys and values does not change decode"""
+    
+    def decode(self, transformer, encoder_hidden_states, encoder_hidden_mask, timestep, kv_cache):
+        latents = torch.randn(2, 8, 16, 12, generator=torch.Generator().manual_seed(2))
+        with torch.no_grad():
+            return transformer.decode(
+                hidden_states=latents,
+                attention_mask=torch.ones(2, 12),
+                encoder_hidden_states=encoder_hidden_states,
+                encoder_hidden_mask=encoder_hidden_mask,
+                timestep=torch.tensor([timestep, timestep]),
+                output_length=12,
+                cross_attention_kv_cache=kv_cache,
+            ).sample
+    
+    def test_matches_uncached(self, tmp_path):
+        """Test cached decode against the cache-disabled path for the same and for new encoder states"""
+        transformer = TestDurationBuckets.make_pipeline(tmp_path, None).ace_step_transformer
+        from acestep.models.customer_attention_processor import CrossAttentionKVCache
+    
+        generator = torch.Generator().manual_seed(1)
+        encoder_hidden_states = torch.randn(2, 10, 64, generator=generator)
+        encoder_hidden_mask = torch.ones(2, 10)
+        encoder_hidden_mask[1, 7:] = 0
+        kv_cache = CrossAttentionKVCache()
+    
+        # the second step reads the keys and values stored by the first
+        for timestep in (900.0, 500.0):
+            torch.testing.assert_close(
+                self.decode(transformer, encoder_hidden_states, encoder_hidden_mask, timestep, kv_cache),
+                self.decode(transformer, encoder_hidden_states, encoder_hidden_mask, timestep, None),
+            )
+        assert len(kv_cache._variants) == 1
+    
+        # new conditioning of the same shape must not reuse the stored entries
+        other_hidden_states = torch.randn(2, 10, 64, generator=generator)
+        other_hidden_mask = torch.ones(2, 10)
+        for timestep in (900.0, 500.0):
+            torch.testing.assert_close(
+                self.decode(transformer, other_hidden_states, other_hidden_mask, timestep, kv_cache),
+                self.decode(transformer, other_hidden_states, other_hidden_mask, timestep, None),
+            )
+        assert len(kv_cache._variants) == 2
+
+class TestStreamingDecode:
+    """Test that streamed resampling and decoding match the whole-signal results"""
+    
+    def test_resampler_matches_whole(self):
+        """Test StreamingResampler on chunks shorter than its context and off the filter period"""
+        pytest.importorskip("diffusers")
+        from acestep.music_dcae.music_dcae_pipeline import StreamingResampler
+        from acestep.resampling import resample
+    
+        seconds = torch.arange(5000) / 44100
+        signal = torch.stack([torch.sin(2 * torch.pi * 440 * seconds), torch.sin(2 * torch.pi * 1000 * seconds)])
+        signal = signal + 0.1 * torch.randn(signal.shape, generator=torch.Generator().manual_seed(0))
+    
+        resampler = StreamingResampler(44100, 48000)
+        chunks = []
+        start = 0
+        for size in (100, 700, 1, 2048, 1500):
+            chunks.append(resampler.process(signal[:, start : start + size]))
+            start += size
+        assert start < signal.shape[1]
+        chunks.append(resampler.process(signal[:, start:]))
+        # the zero-padded tail only comes out on flush
+        chunks.append(resampler.flush())
+    
+        torch.testing.assert_close(torch.cat(chunks, dim=-1), resample(signal, 44100, 48000), rtol=1e-4, atol=1e-5)
+    
+    def test_stream_matches_decode_overlap(self):
+        """Test decode_overlap_stream at 48 kHz against decode_overlap at 44.1 kHz resampled in one go"""
+        pytest.importorskip("diffusers")
+        from acestep.music_dcae.music_dcae_pipeline import MusicDCAE
+        from acestep.resampling import resample
+        from benchmarks.tiny_models import build_tiny_dcae, build_tiny_vocoder
+    
+        torch.manual_seed(0)
+        music_dcae = MusicDCAE.from_modules(build_tiny_dcae(), build_tiny_vocoder()).eval()
+        # 1200 mel frames: three vocoder windows, the last one zero-padded
+        latent = torch.randn(8, 16, 150, generator=torch.Generator().manual_seed(1))
+    
+        chunks = []
+        emitted = 0
+        for start_sample, wav_chunk in music_dcae.decode_overlap_stream(latent, sr=48000):
+            assert start_sample == emitted
+            chunks.append(wav_chunk)
+            emitted += wav_chunk.shape[1]
+        assert len(chunks) > 3
+    
+        _, (whole,) = music_dcae.decode_overlap(latent[None], sr=44100)
+        expected = resample(whole, 44100, 48000)[:, : music_dcae.num_output_samples(150, sr=48000)]
+        torch.testing.assert_close(torch.cat(chunks, dim=-1), expected, rtol=1e-4, atol=1e-5)
+
+class TestQuantizedExport:
+    """Test that the quantized loader only accepts complete, matching exports"""
+    
+    @staticmethod
+    def write_export(quantized_dir, **overrides):
+        import json
+        from acestep.quantized_export import MANIFEST_FILE_NAME, MANIFEST_FORMAT_VERSION, QUANTIZED_COMPONENTS
+        
+        manifest = {
+            "format_version": MANIFEST_FORMAT_VERSION,
+            "scheme": "int4wo",
+            "dtype": "bfloat16",
+            "device_type": "cuda",
+            "torch_version": torch.__version__,
+            "components": {component: {"file": f"{component}.pt", "config": {}} for component in QUANTIZED_COMPONENTS},
+        }
+        manifest.update(overrides)
+        quantized_dir.mkdir(parents=True, exist_ok=True)
+        for entry in manifest["components"].values():
+            (quantized_dir / entry["file"]).write_bytes(b"")
+        (quantized_dir / MANIFEST_FILE_NAME).write_text(json.dumps(manifest))
+        return manifest
+    
+    def test_read_manifest(self, tmp_path):
+        """Test that missing, outdated or incomplete exports are ignored"""
+        pytest.importorskip("accelerate")
+        from acestep.quantized_export import read_manifest
+        
+        assert read_manifest(tmp_path / "missing") is None
+        manifest = self.write_export(tmp_path / "quantized")
+        assert read_manifest(tmp_path / "quantized") == manifest
+        (tmp_path / "quantized" / "text_encoder.pt").unlink()
+        assert read_manifest(tmp_path / "quantized") is None
+        self.write_export(tmp_path / "old", format_version="0")
+        assert read_manifest(tmp_path / "old") is None
+    
+    def test_check_manifest(self, tmp_path):
+        """Test that int4 exports are bound to their device type, dtype and torch version"""
+        pytest.importorskip("accelerate")
+        from acestep.quantized_export import check_manifest
+        
+        manifest = self.write_export(tmp_path)
+        assert check_manifest(manifest, "cuda", torch.bfloat16) is None
+        assert check_manifest(manifest, "cpu", torch.bfloat16) is not None
+        assert check_manifest(manifest, "cuda", torch.float32) is not None
+        assert check_manifest(dict(manifest, scheme="int8wo"), "cpu", torch.bfloat16) is None
+        assert check_manifest(dict(manifest, torch_version="0.0"), "cuda", torch.bfloat16) is not None
+    
+    def test_snapshot_layout(self, tmp_path):
+        """Test that the loader finds the checkpoint and its export in a Hugging Face cache, offline"""
+        pytest.importorskip("diffusers")
+        from acestep.pipeline_ace_step import ACEStepPipeline
+        from acestep.weight_bundles import dtype_name
+        
+        repo_dir = tmp_path / "models--ACE-Step--ACE-Step-v1-3.5B"
+        snapshot = repo_dir / "snapshots" / "0123456789abcdef"
+        for name in ("music_dcae_f8c8", "music_vocoder", "ace_step_transformer", "umt5-base"):
+            (snapshot / name).mkdir(parents=True)
+        (repo_dir / "refs").mkdir()
+        (repo_dir / "refs" / "main").write_text(snapshot.name)
+        
+        pipeline = ACEStepPipeline(checkpoint_dir=str(tmp_path), quantized=True)
+        checkpoint_dir, quantized_dir, manifest, reason = pipeline.find_quantized_export()
+        assert checkpoint_dir == str(snapshot)
+        assert quantized_dir == str(snapshot / "quantized")
+        assert manifest is None and reason == "no quantized export"
+        
+        self.write_export(
+            snapshot / "quantized", device_type=pipeline.device.type, dtype=dtype_name(pipeline.dtype)
+        )
+        checkpoint_dir, quantized_dir, manifest, reason = pipeline.find_quantized_export()
+        assert checkpoint_dir == str(snapshot)
+        assert manifest is not None and reason is None
+        
+        # not in the cache: falls back without trying to download
+        empty = ACEStepPipeline(checkpoint_dir=str(tmp_path / "empty"), quantized=True)
+        assert empty.find_quantized_export()[3].startswith("no local checkpoint")
+    
+    def test_export_matches_pipeline(self, tmp_path):
+        """Test that the export of a float32 pipeline passes its own manifest check"""
+        pytest.importorskip("diffusers")
+        from acestep.pipeline_ace_step import ACEStepPipeline
+        from acestep.quantized_export import default_quantized_dir
+        from acestep.weight_bundles import dtype_name
+        
+        for name in ("music_dcae_f8c8", "music_vocoder", "ace_step_transformer", "umt5-base"):
+            (tmp_path / name).mkdir()
+        
+        def export(checkpoint_dir, output_dir=None, scheme="int4wo", dtype=torch.bfloat16, device=None, group_size=128):
+            # writes what the real export records about the arguments it was given
+            output_dir = output_dir or default_quantized_dir(checkpoint_dir)
+            self.write_export(
+                Path(output_dir), scheme=scheme, dtype=dtype_name(dtype), device_type=torch.device(device).type
+            )
+            return output_dir
+        
+        pipeline = ACEStepPipeline(checkpoint_dir=str(tmp_path), dtype="float32", quantized=True)
+        with patch("acestep.pipeline_ace_step.export_quantized_checkpoint", side_effect=export):
+            pipeline.export_quantized(scheme="int8wo")
+        assert pipeline.dtype == torch.float32
+        assert pipeline.find_quantized_export()[3] is None
+
+class TestCpuTuning:
+    """Test the per-host CPU settings file"""
+    
+    def test_settings_round_trip(self, tmp_path):
+        """Test that settings are stored per host key without dropping other hosts"""
+        from acestep.cpu_tuning import host_key, load_cpu_settings, save_cpu_settings
+        
+        path = str(tmp_path / "cpu_tuning.json")
+        key = host_key(torch.float32)
+        assert load_cpu_settings(path, key) is None
+        settings = {"intra_op_threads": 4, "autocast_bf16": False, "dcae_channels_last": True}
+        save_cpu_settings(path, key, settings)
+        save_cpu_settings(path, host_key(torch.float32, "int8"), dict(settings, intra_op_threads=2))
+        assert load_cpu_settings(path, key) == settings
+        assert load_cpu_settings(path, host_key(torch.float32, "int8"))["intra_op_threads"] == 2
+    
+    def test_thread_candidates(self):
+        """Test that thread counts are distinct, positive and start with all cores"""
+        from acestep.cpu_tuning import thread_candidates
+        
+        assert thread_candidates(16) == [16, 8, 4]
+        assert thread_candidates(2) == [2, 1]
+        assert thread_candidates(1) == [1]
+
+class TestProfiler:
+    """Test the opt-in Chrome trace profiler"""
+    
+    def test_resolve_profile_dir(self, tmp_path, monkeypatch):
+        """Test that profiling is off unless enabled by argument or ACE_PROFILE"""
+        from acestep.profiling import DEFAULT_PROFILE_DIR, PROFILE_ENV_VAR, resolve_profile_dir
+        
+        monkeypatch.delenv(PROFILE_ENV_VAR, raising=False)
+        assert resolve_profile_dir() is None
+        assert resolve_profile_dir(False) is None
+        assert resolve_profile_dir(True) == DEFAULT_PROFILE_DIR
+        monkeypatch.setenv(PROFILE_ENV_VAR, "1")
+        assert resolve_profile_dir() == DEFAULT_PROFILE_DIR
+        monkeypatch.setenv(PROFILE_ENV_VAR, str(tmp_path))
+        assert resolve_profile_dir() == str(tmp_path)
+        assert resolve_profile_dir(False) is None
+    
+    def test_trace(self, tmp_path):
+        """Test that stages, steps and hooked modules end up in the saved trace"""
+        import json
+        from acestep.profiling import PipelineProfiler
+        
+        profiler = PipelineProfiler(str(tmp_path), "cpu")
+        linear = torch.nn.Linear(4, 4)
+        profiler._hook("linear", "test", linear)
+        profiler.start_trace()
+        profiler.begin_stage("diffusion")
+        for _ in profiler.step_events("diffusion_step", range(3)):
+            linear(torch.randn(1, 4))
+        path = profiler.save()
+        
+        with open(path) as f:
+            events = json.load(f)["traceEvents"]
+        spans = [event for event in events if event["ph"] == "X"]
+        assert [event["args"]["step"] for event in spans if event["name"] == "diffusion_step"] == [0, 1, 2]
+        assert sum(event["name"] == "linear" for event in spans) == 3
+        stage = next(event for event in spans if event["name"] == "diffusion")
+        assert all(stage["ts"] <= event["ts"] for event in spans)
+        profiler.remove_hooks()
+        linear(torch.randn(1, 4))
+        assert profiler.summary().keys() == {"diffusion", "diffusion_step", "linear"}
+
 # Integration tests
 class TestIntegration:
     """Integration tests for bot components"""